@@ -0,0 +1,168 @@
+"""
+Actuation with a cache of device state: no-op commands are dropped, bursts coalesced.
+
+The ESP nodes poll the latest content instance (/la) of their container (led, solenoid,
+fan), so every content instance we create grows the container and costs a round trip,
+even when the device is already in the requested state. Actuator remembers the last
+content known to be on each container (warmed from /la at startup, then updated by our
+own writes) and:
+  - drops a command whose content is already the device's state (a no-op),
+  - holds a command for COALESCE_WINDOW seconds from the first command of a burst;
+    later commands for the same device replace it, and only the last one is written
+    ("fan speed to one, two, three" within 200 ms -> one write of "3").
+Writes for one device are serialized, so the container always ends on the last command;
+while one is in flight, a new command is never dropped as a no-op (the write may change
+or fail), it waits for the next flush instead.
+A failed write forgets the device's state, so the next command is written whatever it
+is. Cached state older than STATE_MAX_AGE is not trusted to drop a command, in case the
+container was written by someone else in between.
+
+    actuator = Actuator(write=lambda device, con: post_cin(device, con))
+    actuator.warm(read_latest)
+    actuator.submit('fan', '2').add_done_callback(lambda f: print(f.result()))
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+COALESCE_WINDOW = 0.2  # Seconds a command waits for a newer one for the same device (0 writes at once)
+STATE_MAX_AGE = 300  # Seconds cached state is trusted to drop a no-op (None: always)
+DEVICES = ('led', 'solenoid', 'fan')
+
+# Outcomes a submitted command resolves to
+WRITTEN = "written"  # Its content was written to the CSE
+NOOP = "noop"  # The device was already in the requested state
+COALESCED = "coalesced"  # Superseded by a later command within the window
+FAILED = "failed"  # The write failed
+OUTCOMES = (WRITTEN, NOOP, COALESCED, FAILED)
+
+log = logging.getLogger("actuation")
+
+
+def command_content(action_details):
+    """ (device, content instance content) for a COMMAND_MAP action, or None if it maps to no write. """
+    device, action = action_details.get('device'), action_details.get('action')
+    if device in ('led', 'solenoid') and action in ('activate', 'deactivate'):
+        return device, "ON" if action == 'activate' else "OFF"
+    if device == 'fan':
+        if action == 'set_speed' and action_details.get('value') is not None:
+            return device, str(action_details['value'])  # Speed 1, 2 or 3
+        if action == 'deactivate':
+            return device, "0"  # Speed 0 for off
+    return None
+
+
+class Actuator:
+    """
+    Per-device state cache and coalescing in front of write(device, con), which creates
+    the content instance and returns True on success. submit() never blocks on the CSE
+    when window > 0: the write runs on a timer thread when the window closes.
+    """
+
+    def __init__(self, write, window=COALESCE_WINDOW, max_age=STATE_MAX_AGE, clock=time.monotonic):
+        self.write = write
+        self.window = window
+        self.max_age = max_age
+        self.clock = clock
+        self.state = {}  # device -> (content, clock() when it was known to be on the CSE)
+        self.pending = {}  # device -> {"con": ..., "futures": [...]} waiting for the window to close
+        self.inflight = {}  # device -> content being written right now
+        self.stats = {"submitted": 0, "writes": 0, **{outcome: 0 for outcome in OUTCOMES}}
+        self._lock = threading.Lock()
+        self._device_locks = {}
+
+    def warm(self, read_latest, devices=DEVICES):
+        """
+        Seeds the cache with read_latest(device) (the content of its /la, None if it has
+        none). A device whose read fails is left out, so its first command is written.
+        Returns {device: content} for the devices read.
+        """
+        known = {}
+        for device in devices:
+            try:
+                con = read_latest(device)
+            except Exception as e:
+                log.warning("Could not read the state of %s: %s", device, e, extra={'device': device})
+                continue
+            if con is not None:
+                known[device] = con
+        with self._lock:
+            now = self.clock()
+            for device, con in known.items():
+                self.state.setdefault(device, (con, now))
+        return known
+
+    def known_state(self, device):
+        """ The device's cached content if it is fresh enough to drop a no-op, else None. """
+        with self._lock:
+            return self._known_state(device)
+
+    def _known_state(self, device):
+        con, known_at = self.state.get(device, (None, None))
+        if con is None or (self.max_age is not None and self.clock() - known_at > self.max_age):
+            return None
+        return con
+
+    def submit(self, device, con):
+        """ Requests device -> con. Returns a Future resolving to one of OUTCOMES. """
+        future = Future()
+        with self._lock:
+            self.stats["submitted"] += 1
+            burst = self.pending.get(device)
+            if burst is not None:
+                burst["con"] = con
+                burst["futures"].append(future)
+                return future
+            if device not in self.inflight and self._known_state(device) == con:
+                self.stats[NOOP] += 1
+                future.set_result(NOOP)
+                return future
+            self.pending[device] = {"con": con, "futures": [future]}
+            device_lock = self._device_locks.setdefault(device, threading.Lock())
+        if self.window > 0:
+            timer = threading.Timer(self.window, self._flush, args=(device, device_lock))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._flush(device, device_lock)
+        return future
+
+    def _flush(self, device, device_lock):
+        # The device lock keeps one device's writes in order; a burst that opens while this
+        # one is being written is only taken once this write has finished.
+        with device_lock:
+            with self._lock:
+                burst = self.pending.pop(device)
+                con, futures = burst["con"], burst["futures"]
+                superseded, last = futures[:-1], futures[-1]
+                self.stats[COALESCED] += len(superseded)
+                noop = self._known_state(device) == con  # E.g. ON, OFF, ON within the window
+                if noop:
+                    self.stats[NOOP] += 1
+                else:
+                    self.inflight[device] = con
+            if not noop:
+                try:
+                    ok = self.write(device, con)
+                except Exception as e:
+                    log.error("Error writing %s -> %s: %s", device, con, e, extra={'device': device})
+                    ok = False
+                with self._lock:
+                    del self.inflight[device]
+                    self.stats["writes"] += 1
+                    if ok:
+                        self.state[device] = (con, self.clock())
+                        self.stats[WRITTEN] += 1
+                    else:
+                        self.state.pop(device, None)  # Unknown now; write the next command whatever it is
+                        self.stats[FAILED] += 1
+        for future in superseded:
+            future.set_result(COALESCED)
+        last.set_result(NOOP if noop else WRITTEN if ok else FAILED)
+
+    def summary(self):
+        s = self.stats
+        saved = s["submitted"] - s["writes"]
+        return (f"actuator: {s['submitted']} commands, {s['writes']} writes ({s['failed']} failed), "
+                f"saved {saved} ({s['noop']} no-op, {s['coalesced']} coalesced)")
@@ -1,22 +1,10 @@
-import requests
+import om2m
+import provision
 
-base_url = "http://127.0.0.1:8080/~/in-cse/in-name"
-headers = {
-    "X-M2M-Origin": "admin:admin",
-    "Content-Type": "application/vnd.onem2m-res+json; ty=3"
-}
-
-def create_container(name):
-    data = {
-        "m2m:cnt": {
-            "rn": name
-        }
-    }
-    url = f"{base_url}"
-    response = requests.post(url, json=data, headers=headers)
-    print(f"Container '{name}':", response.status_code, response.text)
-
-# Create containers
-create_container("led")
-create_container("fan")
-create_container("solenoid")
+# Actuator containers, directly under the CSE (also part of om2m_tree.json).
+# Provisioning is idempotent: existing containers are left alone.
+provision.run([
+    {"ty": "cnt", "rn": "led"},
+    {"ty": "cnt", "rn": "fan"},
+    {"ty": "cnt", "rn": "solenoid"},
+], om2m.cse_url())
@@ -0,0 +1,316 @@
+"""
+Incremental assembly of AUDIO_START/AUDIO_CHUNK/AUDIO_END content instances into sessions.
+
+The ESP main node uploads each recording as one AUDIO_START (session id, chunk count,
+Base64 WAV header), TOTAL_CHUNKS AUDIO_CHUNK messages and one AUDIO_END. SessionAssembler
+keeps partial sessions between polls/notifications and only looks at content instances
+whose 'ri' it has not seen before, so the work per poll scales with new data.
+assemble_wav_buffer decodes a complete session into one preallocated buffer, and
+decode_wav_bytes turns it into the 16 kHz float32 array Whisper takes, without going
+through a file.
+"""
+import base64
+import binascii
+import logging
+import struct
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SESSION_TTL = 60  # Seconds a partial session may go without new data before it is dropped
+MAX_SEEN_RESOURCES = 200000  # Bound on remembered 'ri' values (oldest forgotten first)
+MAX_COMPLETED_SESSIONS = 1000  # Bound on remembered completed session IDs
+WHISPER_SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono float32
+
+log = logging.getLogger("audiosession")  # Session drops; assembly errors still print
+
+
+def new_session():
+    # ris/ct: the content instances the session was built from and the earliest creation time
+    return {"header": None, "total_chunks": 0, "chunks": {}, "end": False, "ris": [], "ct": None}
+
+
+def parse_audio_message(message):
+    """
+    Parses one audio message.
+    Returns (kind, session_id, number, payload) where kind is "start", "chunk" or "end",
+    number is the total chunk count (start) or chunk index (chunk), or None if the
+    message is not a well-formed audio message.
+    """
+    if not isinstance(message, str):
+        return None
+    try:
+        if message.startswith("AUDIO_START:"):
+            parts = message.split(":", 3)
+            if len(parts) == 4:
+                return "start", parts[1], int(parts[2]), parts[3]
+        elif message.startswith("AUDIO_CHUNK:"):
+            parts = message.split(":", 3)
+            if len(parts) == 4:
+                return "chunk", parts[1], int(parts[2]), parts[3]
+        elif message.startswith("AUDIO_END:"):
+            parts = message.split(":", 1)
+            if len(parts) == 2:
+                return "end", parts[1], None, None
+    except ValueError:
+        pass
+    return None
+
+
+def is_session_complete(session_data):
+    """Check if a session is complete (has header, all chunks and end marker)."""
+    if not session_data or session_data.get("header") is None:
+        return False
+    expected_chunks = session_data.get("total_chunks", 0)
+    if expected_chunks <= 0:
+        return False
+    if len(session_data.get("chunks", {})) != expected_chunks:
+        return False
+    return bool(session_data.get("end", False))
+
+
+def session_sort_key(session_id):
+    """ Numeric session IDs sort numerically; anything else sorts first. """
+    return int(session_id) if session_id.isdigit() else float('-inf')
+
+
+class SessionAssembler:
+    """
+    Keeps partial sessions across polls and fires on_complete(session_id, session_data)
+    once per session when its header, all chunks and AUDIO_END have arrived.
+    """
+
+    def __init__(self, on_complete, ttl=SESSION_TTL, max_seen=MAX_SEEN_RESOURCES,
+                 max_completed=MAX_COMPLETED_SESSIONS, clock=time.monotonic, log_extra=None):
+        self.on_complete = on_complete
+        self.log_extra = log_extra  # Fields of this assembler's log records, e.g. its home or source
+        self.ttl = ttl
+        self.max_seen = max_seen
+        self.max_completed = max_completed
+        self.clock = clock
+        self.seen = OrderedDict()  # ri -> None, insertion ordered for bounded eviction
+        self.completed = OrderedDict()  # session_id -> None
+        self.sessions = {}  # session_id -> session data (partial sessions only)
+        self.last_update = {}  # session_id -> clock() of last ingested message
+
+    def ingest(self, entries, latest_only=False):
+        """
+        Ingests content instances, skipping any 'ri' already seen.
+        Sessions completed by this batch are passed to on_complete in session order;
+        with latest_only=True only the newest one is, and the rest are just marked done
+        (used on startup so a restart doesn't replay old commands).
+        Returns the number of new entries ingested.
+        """
+        now = self.clock()
+        new_count = 0
+        touched = set()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            ri = entry.get("ri")
+            if ri is not None:
+                if ri in self.seen:
+                    continue
+                self.seen[ri] = None
+                if len(self.seen) > self.max_seen:
+                    self.seen.popitem(last=False)
+            new_count += 1
+            session_id = self._apply(entry.get("con"), now)
+            if session_id is not None:
+                touched.add(session_id)
+                session = self.sessions[session_id]
+                if ri is not None:
+                    session["ris"].append(ri)
+                ct = entry.get("ct")
+                if ct and (session["ct"] is None or ct < session["ct"]):
+                    session["ct"] = ct
+
+        complete = sorted((sid for sid in touched if is_session_complete(self.sessions.get(sid))),
+                          key=session_sort_key)
+        for index, session_id in enumerate(complete):
+            session_data = self.sessions.pop(session_id)
+            self.last_update.pop(session_id, None)
+            self._mark_completed(session_id)
+            if latest_only and index < len(complete) - 1:
+                continue
+            self.on_complete(session_id, session_data)
+
+        self.evict_expired(now)
+        return new_count
+
+    def _apply(self, message, now):
+        """ Folds one message into its session. Returns the session ID it touched, or None. """
+        parsed = parse_audio_message(message)
+        if parsed is None:
+            return None
+        kind, session_id, number, payload = parsed
+        if session_id in self.completed:
+            return None  # Late duplicate of a session that was already handed off
+
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = new_session()
+        if kind == "start":
+            session["header"] = payload
+            session["total_chunks"] = number
+        elif kind == "chunk":
+            session["chunks"][number] = payload
+        else:
+            session["end"] = True
+        self.last_update[session_id] = now
+        return session_id
+
+    def _mark_completed(self, session_id):
+        self.completed[session_id] = None
+        if len(self.completed) > self.max_completed:
+            self.completed.popitem(last=False)
+
+    def evict_expired(self, now=None):
+        """ Drops partial sessions that have not received data within the TTL. Returns their IDs. """
+        now = self.clock() if now is None else now
+        expired = [sid for sid, t in self.last_update.items() if now - t > self.ttl]
+        for session_id in expired:
+            log.warning("Dropping incomplete session %s (no data for %ss)", session_id, self.ttl, extra=self.log_extra)
+            del self.sessions[session_id]
+            del self.last_update[session_id]
+        return expired
+
+    @property
+    def pending_sessions(self):
+        return len(self.sessions)
+
+
+def parse_wav_header(buf):
+    """
+    Parses a RIFF/WAVE header. buf may hold just the header (as in AUDIO_START) or a
+    whole file. Returns a dict with channels, sample_rate, bits, data_offset and
+    data_size (None if the header leaves the size open). Raises ValueError if malformed.
+    """
+    view = memoryview(buf)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError("not a RIFF/WAVE header")
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        (chunk_size,) = struct.unpack_from("<I", view, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16 or body + 16 > len(view):
+                raise ValueError("truncated fmt chunk")
+            _, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", view, body)
+            fmt = {"channels": channels, "sample_rate": sample_rate, "bits": bits}
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("data chunk before fmt chunk")
+            # 0 and 0xFFFFFFFF are used by streaming writers that don't know the length up front
+            fmt["data_size"] = None if chunk_size in (0, 0xFFFFFFFF) else chunk_size
+            fmt["data_offset"] = body
+            return fmt
+        offset = body + chunk_size + (chunk_size & 1)  # Chunks are word aligned
+    raise ValueError("no data chunk in header")
+
+
+def decoded_base64_length(encoded):
+    """ Exact number of bytes a (padded) Base64 string decodes to, without decoding it. """
+    n = len(encoded)
+    if n % 4:
+        raise ValueError(f"Base64 length {n} is not a multiple of 4")
+    return n // 4 * 3 - (encoded.endswith("==") + encoded.endswith("="))
+
+
+def assemble_wav_buffer(session_data):
+    """
+    Assembles a complete session into a single preallocated buffer and returns a
+    memoryview over it (no final copy). The data size comes from the WAV header; each
+    chunk is decoded into a temporary bytes object (a2b_base64 can't decode into a
+    buffer) and copied to its offset, so only one decoded chunk is alive at a time.
+    This halves peak memory against decoding every chunk and joining them; it is not
+    faster, since decoding dominates. Chunks must be exactly 0..total_chunks-1 and
+    together fill the header's data size; anything missing, out of range or oversized
+    is rejected. Returns None on error.
+    """
+    if not session_data or session_data.get("header") is None:
+        print("Error: No header found in session data for assembly.")
+        return None
+    try:
+        header = base64.b64decode(session_data["header"], validate=True)
+        info = parse_wav_header(header)
+    except (binascii.Error, ValueError) as e:
+        print(f"Error decoding WAV header: {e}")
+        return None
+
+    chunks = session_data.get("chunks", {})
+    total_chunks = session_data.get("total_chunks", 0)
+    if total_chunks <= 0 or set(chunks) != set(range(total_chunks)):
+        missing = sorted(set(range(max(total_chunks, 0))) - set(chunks))
+        unexpected = sorted(set(chunks) - set(range(max(total_chunks, 0))))
+        print(f"Error: Chunk set mismatch (expected 0..{total_chunks - 1}, "
+              f"missing {missing}, unexpected {unexpected}).")
+        return None
+
+    header_size = info["data_offset"]
+    try:
+        chunk_sizes = [decoded_base64_length(chunks[i]) for i in range(total_chunks)]
+    except ValueError as e:
+        print(f"Error: Malformed chunk encoding: {e}")
+        return None
+    data_size = info["data_size"] if info["data_size"] is not None else sum(chunk_sizes)
+    if sum(chunk_sizes) != data_size:
+        print(f"Error: Chunks hold {sum(chunk_sizes)} bytes but the header declares {data_size}.")
+        return None
+
+    buffer = bytearray(header_size + data_size)
+    view = memoryview(buffer)
+    view[:header_size] = header[:header_size]
+    offset = header_size
+    for index, size in enumerate(chunk_sizes):
+        try:
+            decoded = binascii.a2b_base64(chunks[index])
+        except binascii.Error as e:
+            print(f"Error decoding base64 for chunk {index}: {e}")
+            return None
+        if len(decoded) != size or offset + size > len(buffer):
+            print(f"Error: Chunk {index} overflows the declared data size.")
+            return None
+        view[offset:offset + size] = decoded
+        offset += size
+    return view
+
+
+def decode_wav_bytes(wav_bytes, target_rate=WHISPER_SAMPLE_RATE):
+    """
+    Decodes 16-bit PCM WAV data (bytes, bytearray or memoryview) to a mono float32
+    array in [-1, 1] at target_rate, ready to pass straight to WhisperModel.transcribe.
+    Returns None on error.
+    """
+    try:
+        info = parse_wav_header(wav_bytes)
+    except ValueError as e:
+        print(f"Error parsing WAV data: {e}")
+        return None
+    if info["bits"] != 16:
+        print(f"Unsupported WAV sample width: {info['bits']} bits (expected 16)")
+        return None
+
+    channels = max(info["channels"], 1)
+    start = info["data_offset"]
+    end = len(wav_bytes) if info["data_size"] is None else min(len(wav_bytes), start + info["data_size"])
+    end -= (end - start) % (2 * channels)  # Whole frames only
+    frames = memoryview(wav_bytes)[start:end]
+
+    audio = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return resample_audio(audio, info["sample_rate"], target_rate)
+
+
+def resample_audio(audio, source_rate, target_rate):
+    """ Linear-interpolation resampling; plenty for speech going from 8 kHz up to 16 kHz. """
+    if source_rate == target_rate or len(audio) == 0:
+        return audio
+    target_length = int(round(len(audio) * target_rate / source_rate))
+    source_times = np.arange(len(audio), dtype=np.float64)
+    target_times = np.arange(target_length, dtype=np.float64) * (source_rate / target_rate)
+    return np.interp(target_times, source_times, audio).astype(np.float32)
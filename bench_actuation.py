@@ -0,0 +1,121 @@
+"""
+Benchmark: OM2M writes and command latency, one content instance per command vs actuation.Actuator.
+
+Replays --commands recognized voice commands against the stub CSE (stubcse.py, with
+--latency added to every response) at Poisson arrivals of --rate per second. A command
+picks a random device and state, so many ask for the state the device is already in;
+with probability --burst it is instead a burst of 3-5 fan speed changes 20-80 ms apart
+(someone correcting themselves, or repeated sessions). Commands go through a stage
+routed by device, like voiceprocess's actuation stage, in each mode:
+  direct     one content instance per command (how execute_om2m_action wrote before)
+  dedup      Actuator with window 0: no-op commands dropped, the rest written at once
+  coalesce   Actuator with --window: no-ops dropped and bursts coalesced into one write
+Reports the content instances written, the writes saved, command -> settled latency
+(written, dropped or coalesced) p50/p99, and whether every container ended on the
+last command sent to its device.
+
+    python bench_actuation.py --commands 200 --rate 5 --latency 0.02 --window 0.2
+"""
+import argparse
+import random
+import threading
+import time
+
+import actuation
+import om2m
+from pipeline import Stage, percentile
+from stubcse import StubCSE
+
+FAN_SPEEDS = ("0", "1", "2", "3")
+STATES = {"led": ("ON", "OFF"), "solenoid": ("ON", "OFF"), "fan": FAN_SPEEDS}
+
+
+def command_stream(n, rate, burst):
+    """ [(offset seconds, device, content)] with Poisson arrivals. """
+    commands, t = [], 0.0
+    while len(commands) < n:
+        t += random.expovariate(rate)
+        if random.random() < burst:
+            for _ in range(random.randint(3, 5)):
+                commands.append((t, "fan", random.choice(FAN_SPEEDS[1:])))
+                t += random.uniform(0.02, 0.08)
+        else:
+            device = random.choice(list(STATES))
+            commands.append((t, device, random.choice(STATES[device])))
+    return commands[:n]
+
+
+def run(mode, commands, args):
+    cse = StubCSE(port=0)
+    base_url = cse.start()
+    client = om2m.OM2MClient(base_url, pool_size=8)
+    for device in STATES:
+        client.create_container("", device, mni=100).raise_for_status()
+        client.create_content_instance(device, STATES[device][-1]).raise_for_status()  # OFF / speed 3
+    cse.latency = args.latency
+    writes_before = cse.request_count
+    latencies, lock = [], threading.Lock()
+
+    def write(device, con):
+        return client.create_content_instance(device, con).status_code == 201
+
+    def settled(arrived):
+        with lock:
+            latencies.append(time.perf_counter() - arrived)
+
+    actuator = None
+    if mode != "direct":
+        actuator = actuation.Actuator(write, window=args.window if mode == "coalesce" else 0)
+        actuator.warm(lambda device: (client.latest(device) or {}).get('con'))
+        writes_before = cse.request_count
+
+    def handle(job):
+        arrived, device, con = job
+        if actuator is None:
+            write(device, con)
+            settled(arrived)
+        else:
+            actuator.submit(device, con).add_done_callback(lambda f: settled(arrived))
+
+    stage = Stage("actuation", handle, workers=4, maxsize=len(commands), route=lambda job: job[1]).start()
+    start = time.perf_counter()
+    for offset, device, con in commands:
+        time.sleep(max(0.0, start + offset - time.perf_counter()))
+        stage.put((time.perf_counter(), device, con))
+    stage.join()
+    while len(latencies) < len(commands):
+        time.sleep(0.01)
+    writes = cse.request_count - writes_before
+
+    cse.latency = 0
+    last = {device: con for _, device, con in commands}
+    correct = all((client.latest(device) or {}).get('con') == con for device, con in last.items())
+    stage.stop()
+    client.close()
+    cse.stop()
+    return writes, latencies, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=5, help="Mean commands (or bursts) per second")
+    parser.add_argument("--burst", type=float, default=0.2, help="Share of arrivals that are fan speed bursts")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every stub CSE response")
+    parser.add_argument("--window", type=float, default=actuation.COALESCE_WINDOW)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    commands = command_stream(args.commands, args.rate, args.burst)
+
+    print(f"{len(commands)} commands over {commands[-1][0]:.1f} s, stub latency {args.latency * 1000:.0f} ms, "
+          f"window {args.window * 1000:.0f} ms")
+    for mode in ("direct", "dedup", "coalesce"):
+        writes, latencies, correct = run(mode, commands, args)
+        print(f"  {mode:<9} {writes:4d} writes  saved {len(commands) - writes:4d} ({(len(commands) - writes) / len(commands):4.0%})  "
+              f"settled p50 {percentile(latencies, 50) * 1000:6.1f} ms  p99 {percentile(latencies, 99) * 1000:6.1f} ms  "
+              f"final state {'ok' if correct else 'WRONG'}")
+
+
+if __name__ == "__main__":
+    main()
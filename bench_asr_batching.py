@@ -0,0 +1,96 @@
+"""
+Benchmark: Whisper + NLU throughput, one clip at a time vs micro-batches.
+
+Makes --clips synthetic command clips from a recording (default output.wav), each with
+its own gain, leading silence and a little noise, as if that many sessions had completed
+at once across homes. It then recognizes them:
+  one-at-a-time  voiceprocess.process_audio_command per clip (the previous ASR path)
+  batch N        voiceprocess.process_audio_batch on N clips at a time: one batched
+                 BatchedInferencePipeline call per tier, one encode for the texts
+for every N in --batch-sizes. It reports clips per second, the time a clip waits for its
+batch's result, the speedup over one at a time and how many clips got the same action as
+one at a time. Needs faster-whisper >= 1.1 and the models of WHISPER_TIERS (or --model).
+
+    python bench_asr_batching.py --clips 32 --batch-sizes 4,8,16 --cpu-threads 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+import voiceprocess
+from audiosession import decode_wav_bytes
+from pipeline import percentile
+
+
+def synthetic_clips(path, n, seed):
+    with open(path, "rb") as f:
+        audio = decode_wav_bytes(f.read())
+    rng = np.random.default_rng(seed)
+    clips = []
+    for _ in range(n):
+        lead = np.zeros(int(rng.uniform(0, 0.5) * voiceprocess.WHISPER_SAMPLE_RATE), dtype=np.float32)
+        clip = np.concatenate([lead, audio * rng.uniform(0.5, 1.5)])
+        clip += rng.normal(0, 0.003, len(clip)).astype(np.float32)
+        clips.append(np.clip(clip, -1, 1).astype(np.float32))
+    return clips
+
+
+def same_action(a, b):
+    keys = ('device', 'action', 'value')
+    return (a is None) == (b is None) and (a is None or all(a.get(k) == b.get(k) for k in keys))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clips", type=int, default=32)
+    parser.add_argument("--batch-sizes", default="4,8,16")
+    parser.add_argument("--wav", default="output.wav")
+    parser.add_argument("--model", help="One Whisper model instead of the WHISPER_TIERS cascade")
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--cpu-threads", type=int, default=voiceprocess.WHISPER_CPU_THREADS, help="0: library default")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    voiceprocess.logging.getLogger("voiceprocess").setLevel(voiceprocess.logging.WARNING)
+    if args.model:
+        voiceprocess.WHISPER_TIERS = [{"model": args.model, "beam_size": args.beam_size}]
+    voiceprocess.WHISPER_CPU_THREADS = args.cpu_threads
+    voiceprocess.ASR_BATCH_SIZE = max(int(size) for size in args.batch_sizes.split(","))
+    if not voiceprocess.load_models():
+        raise SystemExit("Model loading failed.")
+    if not voiceprocess.batched_whisper_models:
+        print("No BatchedInferencePipeline (faster-whisper < 1.1): batches run clip by clip.")
+
+    clips = synthetic_clips(args.wav, args.clips, args.seed)
+    print(f"{len(clips)} clips, tiers {[tier['model'] for tier in voiceprocess.WHISPER_TIERS]}, "
+          f"device {voiceprocess.DEVICE}, cpu threads {args.cpu_threads or 'default'}")
+
+    def run(batch_size):
+        voiceprocess.command_matcher.cache.clear()  # Every mode embeds the same texts afresh
+        actions, waits = [], []
+        start = time.perf_counter()
+        for first in range(0, len(clips), batch_size):
+            batch = clips[first:first + batch_size]
+            st_batch = time.perf_counter()
+            if batch_size == 1:
+                results = [voiceprocess.process_audio_command(batch[0], label=f"clip {first}")]
+            else:
+                results = voiceprocess.process_audio_batch([(clip, f"clip {first + i}") for i, clip in enumerate(batch)])
+            waits += [time.perf_counter() - st_batch] * len(batch)
+            actions += results
+        return time.perf_counter() - start, waits, actions
+
+    voiceprocess.process_audio_batch([(clip, "warm up") for clip in clips[:2]])  # First-call overhead
+    baseline_elapsed, waits, baseline = run(1)
+    print(f"  {'one-at-a-time':<14} {len(clips) / baseline_elapsed:7.2f} clips/s  wait p50 {percentile(waits, 50) * 1000:7.0f} ms  "
+          f"p99 {percentile(waits, 99) * 1000:7.0f} ms")
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        elapsed, waits, actions = run(batch_size)
+        agree = sum(same_action(a, b) for a, b in zip(actions, baseline))
+        print(f"  {f'batch {batch_size}':<14} {len(clips) / elapsed:7.2f} clips/s  wait p50 {percentile(waits, 50) * 1000:7.0f} ms  "
+              f"p99 {percentile(waits, 99) * 1000:7.0f} ms  x{baseline_elapsed / elapsed:4.1f}  "
+              f"same action {agree}/{len(clips)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: layered command matcher vs Sentence Transformer for every recognized text.
+
+Replays a stream of Whisper-style transcripts (exact phrases, punctuation/case variants,
+misrecognitions and paraphrases, with repeats as real usage has) through both paths and
+reports per-layer hit rates, mean latency and how often the two disagree on the action.
+First checks that the cheap layers leave STATE_WORD_CASES (an on/off word the nearest
+phrase lacks) to the embedding layer instead of answering with the opposite command.
+
+    python bench_command_matcher.py --rounds 20
+"""
+import argparse
+import random
+import statistics
+import time
+
+from sentence_transformers import SentenceTransformer
+
+import voiceprocess
+from commandmatcher import CommandMatcher
+
+TRANSCRIPTS = [
+    "Lights on.", "Lights off.", "Turn on lights.", "Turn off the lights.", "lights of",
+    "Activate lock.", "Deactivate the lock.", "turn of lock", "Fan speed to medium.",
+    "Fan speed to max!", "fan speed to tree", "Set to two.", "set 2 two", "Fan off.",
+    "Switch off the fan.", "please turn off the fan", "set fan off", "Could you switch on the lights?",
+    "Make the fan go faster", "Unlock the door", "turn on fan", "switch on fan", "set fan on",
+]
+# Within the fuzzy thresholds of the opposite command ("turn off fan" 0.87, margin 0.17)
+STATE_WORD_CASES = ["turn on fan", "switch on fan", "set fan on"]
+
+
+def check_state_words():
+    """ The cheap layers must not answer STATE_WORD_CASES; returns the texts they did answer. """
+    matcher = CommandMatcher(voiceprocess.COMMAND_MAP, embed_match=lambda text: (None, 0.0, 0.0))
+    wrong = []
+    for text in STATE_WORD_CASES:
+        phrase, score, _, layer = matcher.match(text)
+        if layer != "embedding":
+            wrong.append((text, phrase, score, layer))
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20, help="Times the transcript set is replayed (shuffled)")
+    parser.add_argument("--seed", type=int, default=37)
+    args = parser.parse_args()
+
+    wrong = check_state_words()
+    print(f"state-word cases left to the embedding layer: {len(STATE_WORD_CASES) - len(wrong)}/{len(STATE_WORD_CASES)}")
+    for text, phrase, score, layer in wrong:
+        print(f"    '{text}' -> '{phrase}' ({score:.3f}) via {layer}")
+
+    voiceprocess.resolve_device()
+    voiceprocess.st_model = SentenceTransformer(voiceprocess.SENTENCE_TRANSFORMER_MODEL, device=voiceprocess.DEVICE)
+    voiceprocess.known_command_embeddings = voiceprocess.st_model.encode(
+        voiceprocess.CANONICAL_COMMANDS, convert_to_tensor=True, device=voiceprocess.DEVICE)
+    voiceprocess.embedding_match("warm up")
+
+    rng = random.Random(args.seed)
+    stream = [text for _ in range(args.rounds) for text in rng.sample(TRANSCRIPTS, len(TRANSCRIPTS))]
+
+    baseline_times, baseline_actions = [], []
+    for text in stream:
+        start = time.perf_counter()
+        phrase, _, _ = voiceprocess.embedding_match(text)
+        baseline_times.append(time.perf_counter() - start)
+        baseline_actions.append(voiceprocess.COMMAND_MAP[phrase])
+
+    matcher = CommandMatcher(voiceprocess.COMMAND_MAP, embed_match=voiceprocess.embedding_match)
+    layered_times, disagreements = [], []
+    for text, expected in zip(stream, baseline_actions):
+        start = time.perf_counter()
+        phrase, _, _, layer = matcher.match(text)
+        layered_times.append(time.perf_counter() - start)
+        if voiceprocess.COMMAND_MAP.get(phrase) != expected:
+            disagreements.append((text, phrase, layer))
+
+    print(f"{len(stream)} lookups ({len(TRANSCRIPTS)} distinct transcripts x {args.rounds})")
+    print(f"  embedding only: mean {statistics.mean(baseline_times) * 1000:7.3f} ms  total {sum(baseline_times):.3f} s")
+    print(f"  layered:        mean {statistics.mean(layered_times) * 1000:7.3f} ms  total {sum(layered_times):.3f} s")
+    for layer, stats in matcher.stats.items():
+        mean = stats["seconds"] / stats["hits"] * 1000 if stats["hits"] else 0.0
+        print(f"    {layer:<10} {stats['hits']:>5} hits ({100 * stats['hits'] / len(stream):5.1f}%)  mean {mean:7.3f} ms")
+    print(f"  {matcher.summary()}")
+    print(f"  action disagreements with embedding-only: {len(set(disagreements))}")
+    for text, phrase, layer in sorted(set(disagreements)):
+        print(f"    '{text}' -> '{phrase}' via {layer}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: open-vocabulary transcription vs constrained command decoding.
+
+For every Whisper tier, runs the clips with CONSTRAINED_DECODING off and on and reports
+transcription + NLU latency, command accuracy (with a manifest, see bench_whisper_tiers.py)
+and how often the Sentence Transformer encode was skipped by an exact command match.
+
+    python bench_constrained_decoding.py --manifest samples.json --repeat 3
+"""
+import argparse
+import statistics
+import time
+
+import voiceprocess
+from bench_whisper_tiers import load_clips, is_correct
+
+
+def run(tier, clips, repeat):
+    """ Returns (latencies, correctness per clip, encoder calls, NLU calls). """
+    encode = voiceprocess.st_model.encode
+    encoder_calls = 0
+
+    def counting_encode(*args, **kwargs):
+        nonlocal encoder_calls
+        encoder_calls += 1
+        return encode(*args, **kwargs)
+
+    voiceprocess.st_model.encode = counting_encode
+    latencies, results, nlu_calls = [], [], 0
+    try:
+        for path, audio, expected in clips:
+            for _ in range(repeat):
+                voiceprocess.command_matcher.cache.clear()  # Measure decoding, not the matcher's LRU cache
+                start = time.perf_counter()
+                text, _ = voiceprocess.transcribe_audio(tier["model"], audio, tier.get("beam_size", 5))
+                phrase, score, _ = voiceprocess.match_commands([text])[0] if text else (None, 0.0, 0.0)
+                latencies.append(time.perf_counter() - start)
+                nlu_calls += bool(text)
+            accepted = phrase is not None and score >= voiceprocess.SIMILARITY_THRESHOLD
+            results.append(is_correct(voiceprocess.COMMAND_MAP[phrase] if accepted else None, expected))
+    finally:
+        voiceprocess.st_model.encode = encode
+    return latencies, results, encoder_calls, nlu_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--manifest", help="JSON mapping WAV path -> expected COMMAND_MAP phrase")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    clips = load_clips(args.manifest)
+    if not voiceprocess.load_models():
+        raise SystemExit("Model loading failed.")
+
+    print(f"\n{len(clips)} clips x {args.repeat} runs")
+    print(f"{'model':<10} {'mode':<12} {'p50':>10} {'mean':>10} {'accuracy':>9} {'encode skipped':>15}")
+    for tier in voiceprocess.WHISPER_TIERS:
+        for constrained in (False, True):
+            voiceprocess.CONSTRAINED_DECODING = constrained
+            voiceprocess.transcribe_audio(tier["model"], clips[0][1], tier.get("beam_size", 5))  # Warm-up
+            latencies, results, encoder_calls, nlu_calls = run(tier, clips, args.repeat)
+            scored = [r for r in results if r is not None]
+            accuracy = f"{100 * sum(scored) / len(scored):.1f}%" if scored else "n/a"
+            skipped = f"{100 * (nlu_calls - encoder_calls) / nlu_calls:.0f}%" if nlu_calls else "n/a"
+            print(f"{tier['model']:<10} {'constrained' if constrained else 'open':<12} "
+                  f"{statistics.median(latencies) * 1000:7.1f} ms {statistics.mean(latencies) * 1000:7.1f} ms "
+                  f"{accuracy:>9} {skipped:>15}")
+
+
+if __name__ == "__main__":
+    main()
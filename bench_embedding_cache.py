@@ -0,0 +1,80 @@
+"""
+Benchmark: startup cost of command embeddings with and without the on-disk cache.
+
+Builds a synthetic COMMAND_MAP of ~5k aliases (rooms x devices x phrasings) and times:
+  cold     no cache, every phrase encoded (what every restart did before)
+  warm     unchanged map, embeddings memory-mapped from the cache
+  edited   --edit-fraction of the phrases replaced, only those re-encoded
+
+    python bench_embedding_cache.py --phrases 5000 --edit-fraction 0.01
+"""
+import argparse
+import itertools
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+import voiceprocess
+from embeddingcache import load_or_encode
+
+ROOMS = ["", "bedroom", "kitchen", "living room", "bathroom", "hall", "study", "guest room", "garage",
+         "porch", "dining room", "nursery", "attic", "basement", "laundry", "office"]
+TEMPLATES = ["turn on the {room} {device}", "turn off the {room} {device}", "switch on {room} {device}",
+             "switch off {room} {device}", "activate {room} {device}", "deactivate {room} {device}",
+             "{room} {device} on", "{room} {device} off", "please turn on the {room} {device}",
+             "please turn off the {room} {device}", "set {room} {device} to one", "set {room} {device} to two",
+             "set {room} {device} to three", "{room} {device} to minimum", "{room} {device} to medium",
+             "{room} {device} to max", "could you switch on the {room} {device}",
+             "could you switch off the {room} {device}", "i want the {room} {device} on",
+             "i want the {room} {device} off"]
+DEVICES = ["lights", "lamp", "fan", "lock", "door lock", "ceiling fan", "night light", "heater",
+           "air purifier", "bulb", "strip light", "table lamp", "desk fan", "back door", "front door",
+           "window", "blinds", "kettle"]
+
+
+def synthetic_phrases(count):
+    phrases = dict.fromkeys(" ".join(t.format(room=r, device=d).split())
+                            for t, r, d in itertools.product(TEMPLATES, ROOMS, DEVICES))
+    if len(phrases) < count:
+        raise SystemExit(f"Only {len(phrases)} distinct synthetic phrases available")
+    return list(phrases)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--phrases", type=int, default=5000)
+    parser.add_argument("--edit-fraction", type=float, default=0.01)
+    args = parser.parse_args()
+
+    device = voiceprocess.resolve_device()
+    model = SentenceTransformer(voiceprocess.SENTENCE_TRANSFORMER_MODEL, device=device)
+    encode = lambda phrases: model.encode(phrases, convert_to_numpy=True, device=device)
+    encode(["warm up"])
+
+    phrases = synthetic_phrases(args.phrases)
+    cache_dir = tempfile.mkdtemp(prefix="embedding_cache_")
+    name = voiceprocess.SENTENCE_TRANSFORMER_MODEL
+    try:
+        start = time.perf_counter()
+        cold, stats = load_or_encode(phrases, encode, name, cache_dir=cache_dir)
+        print(f"cold    {time.perf_counter() - start:8.3f} s  {stats}")
+
+        start = time.perf_counter()
+        warm, stats = load_or_encode(phrases, encode, name, cache_dir=cache_dir)
+        print(f"warm    {time.perf_counter() - start:8.3f} s  {stats}")
+        assert np.allclose(cold, warm)
+
+        edits = max(1, int(len(phrases) * args.edit_fraction))
+        edited = phrases[:-edits] + [f"{p} now" for p in phrases[-edits:]]
+        start = time.perf_counter()
+        _, stats = load_or_encode(edited, encode, name, cache_dir=cache_dir)
+        print(f"edited  {time.perf_counter() - start:8.3f} s  {stats}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
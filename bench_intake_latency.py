@@ -0,0 +1,148 @@
+"""
+Benchmark: time from AUDIO_END upload to session detection, poll mode vs push mode.
+
+Runs against the in-memory stub CSE (stubcse.py), replays the checked-in output.wav
+as a firmware-style AUDIO_START/CHUNK/END session and replaces the AI step with a
+timestamp, so only intake latency is measured.
+
+    python bench_intake_latency.py --sessions 10 --poll-interval 4
+"""
+import argparse
+import base64
+import contextlib
+import io
+import queue
+import random
+import statistics
+import threading
+import time
+
+import requests
+
+import voiceprocess
+from stubcse import StubCSE
+
+CIN_HEADERS = {"X-M2M-Origin": "admin:admin", "Content-Type": "application/json;ty=4"}
+TOTAL_CHUNKS = 4  # Same as mainesp.ino
+WAV_HEADER_SIZE = 44
+
+
+def build_session_messages(session_id, wav_path="output.wav"):
+    """ Splits a WAV file into the AUDIO_START/CHUNK/END messages the ESP firmware sends. """
+    with open(wav_path, "rb") as f:
+        wav = f.read()
+    header, audio = wav[:WAV_HEADER_SIZE], wav[WAV_HEADER_SIZE:]
+    chunk_size = -(-len(audio) // TOTAL_CHUNKS)
+    messages = [f"AUDIO_START:{session_id}:{TOTAL_CHUNKS}:{base64.b64encode(header).decode()}"]
+    for i in range(TOTAL_CHUNKS):
+        chunk = audio[i * chunk_size:(i + 1) * chunk_size]
+        messages.append(f"AUDIO_CHUNK:{session_id}:{i}:{base64.b64encode(chunk).decode()}")
+    messages.append(f"AUDIO_END:{session_id}")
+    return messages
+
+
+def provision(base_url):
+    """ Creates voice_command/audio_upload on the stub CSE. Returns the container URL. """
+    requests.post(f"{base_url}/~/in-cse", json={"m2m:ae": {"rn": "voice_command", "api": "app-voice", "rr": True}},
+                  headers={"X-M2M-Origin": "admin:admin", "Content-Type": "application/json;ty=2"})
+    requests.post(f"{base_url}/~/in-cse/in-name/voice_command", json={"m2m:cnt": {"rn": "audio_upload", "mni": 60}},
+                  headers={"X-M2M-Origin": "admin:admin", "Content-Type": "application/json;ty=3"})
+    return f"{base_url}/~/in-cse/in-name/voice_command/audio_upload"
+
+
+def run_sessions(container_url, detected, num_sessions, gap, first_id):
+    """ Uploads sessions like the firmware and returns {session_id: AUDIO_END time}. """
+    end_times = {}
+    for n in range(num_sessions):
+        session_id = str(first_id + n)
+        for message in build_session_messages(session_id):
+            requests.post(container_url, headers=CIN_HEADERS, json={"m2m:cin": {"con": message}})
+            if message.startswith("AUDIO_END:"):
+                end_times[session_id] = time.perf_counter()
+            else:
+                time.sleep(gap)
+        # Wait until detected (or give up), then idle a random fraction of a poll
+        deadline = time.perf_counter() + voiceprocess.POLLING_INTERVAL * 3
+        while session_id not in detected and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        time.sleep(random.uniform(0, voiceprocess.POLLING_INTERVAL))
+    return end_times
+
+
+def summarize(label, end_times, detected):
+    latencies = [(detected[sid] - t) * 1000 for sid, t in end_times.items() if sid in detected]
+    missed = len(end_times) - len(latencies)
+    if not latencies:
+        print(f"{label:<6} no sessions detected ({missed} missed)")
+        return
+    print(f"{label:<6} n={len(latencies):<3} mean={statistics.mean(latencies):8.1f} ms  "
+          f"p50={statistics.median(latencies):8.1f} ms  max={max(latencies):8.1f} ms  missed={missed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--poll-interval", type=float, default=voiceprocess.POLLING_INTERVAL)
+    parser.add_argument("--gap", type=float, default=0.05, help="Seconds between firmware uploads")
+    args = parser.parse_args()
+
+    cse = StubCSE(port=0)
+    base_url = cse.start()
+    container_url = provision(base_url)
+    voiceprocess.SERVER_URL = f"{container_url}?rcn=4"
+    voiceprocess.CONTAINER_URL = container_url
+    voiceprocess.POLLING_INTERVAL = args.poll_interval
+    home = next(iter(voiceprocess.setup_routing()))
+
+    detected = {}
+
+    def record_detection(home, session_id, session_data):
+        detected[session_id] = time.perf_counter()
+        return True
+
+    voiceprocess.process_complete_session = record_detection
+    stop = threading.Event()
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    # --- Poll mode ---
+    def poll_worker():
+        while not stop.is_set():
+            voiceprocess.process_data_if_new(home, voiceprocess.fetch_om2m_audio_entries(home))
+            stop.wait(voiceprocess.POLLING_INTERVAL)
+
+    with quiet:
+        poller = threading.Thread(target=poll_worker, daemon=True)
+        poller.start()
+        poll_end_times = run_sessions(container_url, detected, args.sessions, args.gap, first_id=100000)
+        stop.set()
+        poller.join()
+
+    # --- Push mode ---
+    entry_queue = queue.Queue()
+    with quiet:
+        server = voiceprocess.start_notification_server(lambda path, cin: entry_queue.put(cin), host="127.0.0.1", port=0)
+        voiceprocess.NOTIFICATION_URL = f"http://127.0.0.1:{server.server_address[1]}/notify"
+        voiceprocess.create_om2m_subscription(home)
+
+        def push_worker():
+            while True:
+                entry = entry_queue.get()
+                if entry is None:
+                    return
+                voiceprocess.handle_pushed_entry(home, entry)
+
+        pusher = threading.Thread(target=push_worker, daemon=True)
+        pusher.start()
+        push_end_times = run_sessions(container_url, detected, args.sessions, args.gap, first_id=200000)
+        entry_queue.put(None)
+        pusher.join()
+        server.shutdown()
+
+    cse.stop()
+    print(f"AUDIO_END -> session detected ({args.sessions} sessions, poll interval {args.poll_interval}s)")
+    summarize("poll", poll_end_times, detected)
+    summarize("push", push_end_times, detected)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: ingestion loop throughput with the old per-entry logging vs logsetup.py.
+
+Replays the log calls one mong.py fetch cycle makes for a source with --entries new
+entries, plus the prints of one voiceprocess.py session, without any I/O besides the
+log output itself (written to a temporary file, as a redirected stdout/stderr would be).
+
+  old  f-strings at INFO for every fetch/process/store step, the per-insert debug
+       f-string built even though DEBUG is off, basicConfig StreamHandler formatting and
+       writing in the calling thread, voiceprocess print()s
+  new  lazy %-style calls, per-step messages at DEBUG, records queued to logsetup's
+       background JSON writer with rate limiting
+  new-unlimited  as new, without the rate limiter (every INFO record is written)
+
+Reports cycles per second seen by the loop and, for the queued modes, how long the writer took to
+flush what was queued. --sources cycles are run per round, one per source name, so the
+rate limiter sees the same mix of keys as the service.
+
+    python bench_logging.py --cycles 20000 --entries 20
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import logsetup
+
+SOURCES = ("gas_sensor", "temperature", "humidity", "voice_audio")
+
+
+def old_cycle(source_name, url, entries, out):
+    logging.info(f"Fetching data from: {url}")
+    logging.info(f"Successfully fetched data from {url}")
+    logging.info(f"Processing {len(entries)} entries for storage from source: {source_name}...")
+    for ri in entries:
+        logging.debug(f"Inserted new document with ri: {ri} from {source_name}")
+    logging.info(f"Finished storing entries for {source_name}: Inserted {len(entries)}, Updated 0, Up-to-date 0, Errors 0")
+    print(f"Fetching audio entries from: {url}", file=out)
+    print(f"Found {len(entries)} entries under 'm2m:cnt'.", file=out)
+    print(f"Ingested {len(entries)} new audio entries (0 partial sessions pending).", file=out)
+
+
+def new_cycle(source_name, url, entries, out):
+    logging.debug("Fetching data from: %s", url)
+    logging.debug("Successfully fetched data from %s", url)
+    logging.debug("Processing %d entries for storage from source: %s...", len(entries), source_name)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for ri in entries:
+            logging.debug("Inserted new document with ri: %s from %s", ri, source_name)
+    counts = {'inserted': len(entries), 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    logging.info("Finished storing entries for %s: Inserted %d, Updated %d, Up-to-date %d, Errors %d", source_name,
+                 counts['inserted'], counts['updated'], counts['up_to_date'], counts['errors'], extra={'source': source_name, **counts})
+    log = logging.getLogger("voiceprocess")
+    log.debug("Fetching audio entries from: %s", url)
+    log.debug("Found %d entries under 'm2m:cnt'.", len(entries))
+    log.info("Ingested %d new audio entries (%d partial sessions pending).", len(entries), 0)
+
+
+def run(mode, args):
+    out = tempfile.TemporaryFile("w")
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    listener = None
+    if mode == "old":
+        handler = logging.StreamHandler(out)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        cycle = old_cycle
+    else:
+        listener = logsetup.configure_logging(stream=out, rate_limit=(mode == "new"), queue_size=args.queue_size)
+        cycle = new_cycle
+    entries = [f"cin{i:08d}" for i in range(args.entries)]
+    urls = {name: f"http://127.0.0.1:8080/~/in-cse/in-name/{name}/data?rcn=4" for name in SOURCES[:args.sources]}
+
+    start = time.perf_counter()
+    for index in range(args.cycles):
+        name = SOURCES[index % args.sources]
+        cycle(name, urls[name], entries, out)
+    elapsed = time.perf_counter() - start
+    flush = 0.0
+    if listener is not None:
+        flush_start = time.perf_counter()
+        listener.stop()
+        flush = time.perf_counter() - flush_start
+    out.flush()
+    size = out.tell()
+    out.close()
+    dropped = sum(getattr(h, "dropped", 0) for h in root.handlers)
+    return elapsed, flush, size, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=20000)
+    parser.add_argument("--entries", type=int, default=20, help="New entries per fetch cycle")
+    parser.add_argument("--sources", type=int, default=len(SOURCES), choices=range(1, len(SOURCES) + 1))
+    parser.add_argument("--queue-size", type=int, default=logsetup.LOG_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    print(f"{args.cycles} cycles, {args.entries} entries each, {args.sources} sources")
+    for mode in ("old", "new", "new-unlimited"):
+        elapsed, flush, size, dropped = run(mode, args)
+        print(f"  {mode:<13} {args.cycles / elapsed:10.0f} cycles/s  ({elapsed / args.cycles * 1e6:6.1f} us/cycle), "
+              f"{size / 1024:8.1f} KiB written, writer flush {flush * 1000:.0f} ms, {dropped} dropped")
+
+
+if __name__ == "__main__":
+    main()
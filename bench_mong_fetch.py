@@ -0,0 +1,116 @@
+"""
+Benchmark: sequential fetch cycle (previous mong.main) vs per-source concurrent pollers.
+
+Provisions the three mong.py sources on the stub CSE (stubcse.py) and slows one of them
+down (--latency seconds per request, the voice container by default). Each mode runs
+for --duration seconds with storage replaced by a counter, so only fetch scheduling is
+measured. For every source it reports how many fetches completed, the worst gap between
+two completed fetches (how stale that source's data got) and p50/p99 cycle time.
+
+    python bench_mong_fetch.py --latency 6 --duration 30
+"""
+import argparse
+import threading
+import time
+
+import requests
+
+import mong
+from pipeline import LatencyTracker
+from stubcse import StubCSE
+
+HEADERS = {"X-M2M-Origin": "admin:admin", "Accept": "application/json"}
+SOURCE_PATHS = {
+    "voice_audio": ("voice_command", "audio_upload", "?rcn=4"),
+    "gas_sensor": ("gas_sensor", "data", "/la"),
+    "fall_sensor": ("fall_sensor", "fall_data", "/la"),
+}
+
+
+def provision(base_url):
+    """ Creates each source's AE/container with one content instance. Returns mong-style sources. """
+    sources = []
+    for name, (ae, cnt, suffix) in SOURCE_PATHS.items():
+        requests.post(f"{base_url}/~/in-cse", json={"m2m:ae": {"rn": ae, "api": f"app-{ae}", "rr": True}},
+                      headers={**HEADERS, "Content-Type": "application/json;ty=2"})
+        requests.post(f"{base_url}/~/in-cse/in-name/{ae}", json={"m2m:cnt": {"rn": cnt}},
+                      headers={**HEADERS, "Content-Type": "application/json;ty=3"})
+        requests.post(f"{base_url}/~/in-cse/in-name/{ae}/{cnt}", json={"m2m:cin": {"con": "1"}},
+                      headers={**HEADERS, "Content-Type": "application/json;ty=4"})
+        url = f"{base_url}/~/in-cse/in-name/{ae}/{cnt}"
+        sources.append({"name": name, "url": url + suffix})
+    return sources
+
+
+def legacy_loop(sources, stop_event):
+    """ The previous main loop: every source in turn, blocking requests.get without a timeout. """
+    while not stop_event.is_set():
+        start_time = time.time()
+        for source in sources:
+            raw_data = mong.fetch_om2m_data(source['url'], timeout=None)
+            mong.store_or_update_entries(None, mong.extract_entries_from_response(raw_data), source['name'])
+            # Time since the cycle began: a source waits for every source listed before it
+            mong.source_cycle_times.setdefault(source['name'], LatencyTracker()).record(time.time() - start_time)
+        stop_event.wait(max(0.0, mong.FETCH_INTERVAL - (time.time() - start_time)))
+
+
+def concurrent_loop(sources, stop_event):
+    session = mong.create_http_session(len(sources))
+    pollers = [threading.Thread(target=mong.poll_source, args=(None, source, session, stop_event), daemon=True)
+               for source in sources]
+    for poller in pollers:
+        poller.start()
+    for poller in pollers:
+        poller.join()
+
+
+def run(loop, sources, duration):
+    completions = {source['name']: [] for source in sources}
+
+    def record_store(collection, entries, source_name):
+        completions[source_name].append(time.perf_counter())
+
+    mong.store_or_update_entries = record_store
+    mong.source_cycle_times.clear()
+    stop_event = threading.Event()
+    start = time.perf_counter()
+    runner = threading.Thread(target=loop, args=(sources, stop_event), daemon=True)
+    runner.start()
+    time.sleep(duration)
+    stop_event.set()
+    runner.join()  # Let an in-flight sequential cycle finish so it can't leak into the next mode
+
+    results = {}
+    for name, times in completions.items():
+        edges = [start] + [t for t in times if t <= start + duration] + [start + duration]
+        gaps = [b - a for a, b in zip(edges, edges[1:])]
+        cycle_times = mong.source_cycle_times.get(name, LatencyTracker())
+        results[name] = (len(edges) - 2, max(gaps), *cycle_times.percentiles(50, 99))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--slow-source", default="voice_audio", choices=sorted(SOURCE_PATHS))
+    parser.add_argument("--latency", type=float, default=6.0, help="Seconds added to each request to the slow source")
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+    mong.logging.getLogger().setLevel(mong.logging.CRITICAL)  # Timeouts on the slow source are expected
+
+    cse = StubCSE(port=0)
+    base_url = cse.start()
+    sources = provision(base_url)
+    ae = SOURCE_PATHS[args.slow_source][0]
+    cse.set_latency(f"/~/in-cse/in-name/{ae}", args.latency)
+
+    print(f"{args.slow_source} delayed {args.latency}s, interval {mong.FETCH_INTERVAL}s, "
+          f"timeout {mong.FETCH_TIMEOUT}s, {args.duration:.0f}s per mode")
+    for label, loop in (("sequential", legacy_loop), ("concurrent", concurrent_loop)):
+        for name, (fetches, worst_gap, p50, p99) in run(loop, sources, args.duration).items():
+            cycles = f"p50 {p50:6.2f} s  p99 {p99:6.2f} s" if p50 is not None else "n/a"
+            print(f"{label:<11} {name:<12} fetches={fetches:<4} worst gap={worst_gap:6.2f} s  cycle {cycles}")
+    cse.stop()
+
+
+if __name__ == "__main__":
+    main()
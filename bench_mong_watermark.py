@@ -0,0 +1,118 @@
+"""
+Benchmark: DB writes and bytes fetched per mong.py cycle, before and after the watermark.
+
+Fills a voice container on the stub CSE (stubcse.py) with --backlog content instances,
+then runs --cycles fetch cycles --interval simulated seconds apart (the stub CSE's clock
+is advanced, so creation times differ), adding --new-per-cycle instances before each one:
+  before            fetch ?rcn=4, upsert every entry (previous behaviour)
+  watermark         fetch ?rcn=4, upsert only entries newer than the watermark
+  watermark+filter  as above, and ask the CSE for the delta only (cra/lim)
+Writes are counted by an in-memory collection that mimics bulk_write upsert results;
+bytes are the HTTP response bodies received.
+
+    python bench_mong_watermark.py --backlog 60 --cycles 20 --new-per-cycle 6
+"""
+import argparse
+import base64
+import os
+import time
+
+import requests
+
+import mong
+from stubcse import StubCSE
+
+HEADERS = {"X-M2M-Origin": "admin:admin", "Accept": "application/json"}
+
+
+class CountingCollection:
+    """ Just enough of a pymongo collection for store_or_update_entries and the watermark. """
+
+    def __init__(self):
+        self.documents = {}
+        self.ops = 0
+
+    def bulk_write(self, operations, ordered=True):
+        summary = {'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'upserted': [], 'writeErrors': []}
+        for index, op in enumerate(operations):
+            self.ops += 1
+            ri, doc = op._filter['ri'], op._doc['$set']
+            if ri not in self.documents:
+                summary['nUpserted'] += 1
+                summary['upserted'].append({'index': index, '_id': ri})
+            else:
+                summary['nMatched'] += 1
+                summary['nModified'] += self.documents[ri] != doc
+            self.documents[ri] = doc
+        return type("BulkWriteResult", (), {"bulk_api_result": summary})()
+
+    def find_one(self, query):
+        self.ops += 1
+        return self.documents.get(query['_id'])
+
+    def replace_one(self, query, document, upsert=False):
+        self.ops += 1
+        self.documents[query['_id']] = document
+
+
+def provision(base_url, backlog):
+    requests.post(f"{base_url}/~/in-cse", json={"m2m:ae": {"rn": "voice_command", "api": "app-voice", "rr": True}},
+                  headers={**HEADERS, "Content-Type": "application/json;ty=2"})
+    requests.post(f"{base_url}/~/in-cse/in-name/voice_command", json={"m2m:cnt": {"rn": "audio_upload", "mni": backlog}},
+                  headers={**HEADERS, "Content-Type": "application/json;ty=3"})
+    container_url = f"{base_url}/~/in-cse/in-name/voice_command/audio_upload"
+    add_instances(container_url, backlog)
+    return container_url
+
+
+def add_instances(container_url, count):
+    chunk = base64.b64encode(os.urandom(3000)).decode()
+    for i in range(count):
+        requests.post(container_url, json={"m2m:cin": {"con": f"AUDIO_CHUNK:1:{i}:{chunk}"}},
+                      headers={**HEADERS, "Content-Type": "application/json;ty=4"})
+
+
+def run(mode, args):
+    now = [time.time() - args.cycles * args.interval]
+    cse = StubCSE(port=0, clock=lambda: now[0])
+    container_url = provision(cse.start(), args.backlog)
+    source = {'name': 'voice_audio', 'url': f"{container_url}?rcn=4"}
+    collection, state_collection = CountingCollection(), CountingCollection()
+    received = {'bytes': 0}
+    session = mong.create_http_session(1)
+    session.hooks['response'].append(lambda r, *a, **k: received.__setitem__('bytes', received['bytes'] + len(r.content)))
+    mong.source_watermarks.clear()
+    mong.USE_FILTER_CRITERIA = mode == "watermark+filter"
+
+    stored = 0
+    for _ in range(args.cycles):
+        now[0] += args.interval
+        add_instances(container_url, args.new_per_cycle)
+        if mode == "before":
+            entries = mong.extract_entries_from_response(mong.fetch_om2m_data(source['url'], session))
+            counts = mong.store_or_update_entries(collection, entries, source['name'])
+        else:
+            counts = mong.run_fetch_cycle(collection, source, session, state_collection=state_collection)
+        stored += counts['inserted']
+    cse.stop()
+    return collection.ops + state_collection.ops, received['bytes'], stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backlog", type=int, default=60, help="Instances in the container (also its mni)")
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--new-per-cycle", type=int, default=6, help="One firmware session is 6 instances")
+    parser.add_argument("--interval", type=float, default=mong.FETCH_INTERVAL, help="Simulated seconds between cycles")
+    args = parser.parse_args()
+    mong.logging.getLogger().setLevel(mong.logging.WARNING)
+
+    print(f"{args.cycles} cycles, {args.new_per_cycle} new instances per cycle, container holds {args.backlog}")
+    for mode in ("before", "watermark", "watermark+filter"):
+        ops, received, stored = run(mode, args)
+        print(f"{mode:<17} DB ops={ops:<6} ({ops / args.cycles:6.1f}/cycle)  "
+              f"received={received / 1024:9.1f} KiB ({received / 1024 / args.cycles:7.1f} KiB/cycle)  new stored={stored}")
+
+
+if __name__ == "__main__":
+    main()
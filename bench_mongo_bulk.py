@@ -0,0 +1,103 @@
+"""
+Benchmark: per-entry update_one upserts (previous store_or_update_entries) vs one bulk_write.
+
+Stores --entries synthetic voice_audio content instances twice per strategy: once into
+an empty collection (all inserts) and once more unchanged (all up-to-date), as a poll
+loop does. Runs against mongomock by default or a real server with --uri. --rtt-ms adds
+a simulated network round trip to every collection call, which is what the per-entry
+version pays for on a remote mongod. mongomock itself scans the collection on every
+upsert, so against it the two strategies differ only by round trips; use a real mongod
+for server-side numbers. (mongomock 4.3 also rejects UpdateOne from pymongo >= 4.11.)
+
+    python bench_mongo_bulk.py --entries 10000 --rtt-ms 0.5
+    python bench_mongo_bulk.py --uri mongodb://localhost:27017/
+"""
+import argparse
+import base64
+import logging
+import os
+import time
+
+import mong
+
+
+class RoundTripCounter:
+    """ Wraps a collection, counting (and optionally delaying) update_one/bulk_write calls. """
+
+    def __init__(self, collection, rtt):
+        self.collection = collection
+        self.rtt = rtt
+        self.calls = 0
+
+    def _call(self, method, *args, **kwargs):
+        self.calls += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+        return getattr(self.collection, method)(*args, **kwargs)
+
+    def update_one(self, *args, **kwargs):
+        return self._call("update_one", *args, **kwargs)
+
+    def bulk_write(self, *args, **kwargs):
+        return self._call("bulk_write", *args, **kwargs)
+
+
+def legacy_store(collection, entries, source_name):
+    """ The previous implementation: one upsert round trip per entry. """
+    counts = {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    for entry in entries:
+        result = collection.update_one({'ri': entry['ri']}, {'$set': mong.build_document(entry, source_name)}, upsert=True)
+        if result.upserted_id is not None:
+            counts['inserted'] += 1
+        elif result.modified_count > 0:
+            counts['updated'] += 1
+        else:
+            counts['up_to_date'] += 1
+    return counts
+
+
+def synthetic_entries(count):
+    chunk = base64.b64encode(os.urandom(3000)).decode()
+    return [{"ri": f"/in-cse/cin-{i}", "rn": f"cin_{i}", "ct": "20250101T000000", "lt": "20250101T000000",
+             "st": 0, "cs": len(chunk), "con": f"AUDIO_CHUNK:{i // 4}:{i % 4}:{chunk}", "pi": "/in-cse/cnt-1"}
+            for i in range(count)]
+
+
+def fresh_collection(args, name):
+    if args.uri:
+        from pymongo import MongoClient
+        collection = MongoClient(args.uri)[args.db][name]
+    else:
+        import mongomock
+        collection = mongomock.MongoClient()[args.db][name]
+    collection.drop()
+    collection.create_index('ri', unique=True)
+    return collection
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--uri", help="MongoDB URI; mongomock is used if omitted")
+    parser.add_argument("--db", default="om2m_bench")
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    entries = synthetic_entries(args.entries)
+    print(f"{args.entries} entries, {'mongod at ' + args.uri if args.uri else 'mongomock'}, simulated RTT {args.rtt_ms} ms")
+    for label, store in (("update_one", legacy_store), ("bulk_write", mong.store_or_update_entries)):
+        collection = fresh_collection(args, f"bench_{label}")
+        for round_name in ("insert", "unchanged"):
+            counter = RoundTripCounter(collection, args.rtt_ms / 1000)
+            start = time.perf_counter()
+            counts = store(counter, entries, "voice_audio")
+            elapsed = time.perf_counter() - start
+            print(f"{label:<11} {round_name:<10} {elapsed:8.3f} s  {args.entries / elapsed:10.0f} entries/s  "
+                  f"round trips={counter.calls:<6} {counts}")
+        if args.uri:
+            collection.drop()
+
+
+if __name__ == "__main__":
+    main()
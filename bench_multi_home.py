@@ -0,0 +1,140 @@
+"""
+Load generator: --homes homes speaking to one voice server at once, one of them slow.
+
+Provisions an AE per home (home_001, ...) on the stub CSE (stubcse.py), with its audio
+container and led/fan/solenoid containers, and serves them all from one voiceprocess
+routing table (homes.py) with push intake. Every home then uploads --sessions firmware
+sessions (output.wav as AUDIO_START/CHUNK/END) at Poisson intervals of mean --interval
+seconds, concurrently with the others. ASR is simulated by burning CPU for --asr-ms on
+the shared ASR stage; each session asks to switch the home's lights, alternating on and
+off. The device containers of home_001 answer after --slow-latency seconds, like a home
+behind a congested uplink.
+
+Reports AUDIO_END -> command settled (written to the home's CSE) latency p50/p99 for the
+slow home and for all the others, so a slow home holding up the rest shows up as the
+other homes' latency rising with --slow-latency.
+
+    python bench_multi_home.py --homes 20 --sessions 5 --interval 5 --asr-ms 50 --slow-latency 2
+"""
+import argparse
+import contextlib
+import io
+import logging
+import random
+import threading
+import time
+
+import homes
+import om2m
+import provision
+import voiceprocess
+from bench_intake_latency import build_session_messages
+from pipeline import percentile
+from stubcse import StubCSE
+
+SLOW_HOME = "home_001"
+
+
+def homes_spec(names):
+    containers = [{"ty": "cnt", "rn": device} for device in homes.DEVICE_CONTAINERS]
+    containers.append({"ty": "cnt", "rn": "audio_upload", "mni": 60})
+    return [{"ty": "ae", "rn": name, "api": "app-home", "rr": True, "children": containers} for name in names]
+
+
+def simulated_recognize(session_id, audio, asr_seconds):
+    """ Burns CPU like a transcription would; lights on for even sessions, off for odd ones. """
+    end = time.perf_counter() + asr_seconds
+    while time.perf_counter() < end:
+        pass
+    action = 'activate' if int(session_id) % 2 == 0 else 'deactivate'
+    return {'device': 'led', 'action': action, 'session_id': session_id}
+
+
+def speak(base_url, name, sessions, interval, spoken):
+    """ One home's ESP main node: uploads sessions and records when each AUDIO_END was stored. """
+    with om2m.OM2MClient(base_url, pool_size=1) as firmware:
+        for n in range(sessions):
+            time.sleep(random.expovariate(1 / interval))
+            session_id = str(100000 + n)
+            for message in build_session_messages(session_id):
+                firmware.create_content_instance(f"{name}/audio_upload", message).raise_for_status()
+            spoken[(name, session_id)] = time.perf_counter()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--homes", type=int, default=20)
+    parser.add_argument("--sessions", type=int, default=5, help="Sessions per home")
+    parser.add_argument("--interval", type=float, default=5, help="Mean seconds between a home's sessions")
+    parser.add_argument("--asr-ms", type=float, default=50)
+    parser.add_argument("--slow-latency", type=float, default=2.0, help=f"Seconds {SLOW_HOME}'s devices take to answer")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    logging.getLogger("voiceprocess").setLevel(logging.ERROR)
+
+    cse = StubCSE(port=0)
+    base_url = cse.start()
+    names = [f"home_{index:03d}" for index in range(1, args.homes + 1)]
+    with om2m.OM2MClient(base_url) as client:
+        provision.provision(provision.flatten(homes_spec(names)), client)
+    if args.slow_latency:
+        for device in homes.DEVICE_CONTAINERS:
+            cse.set_latency(f"/~/in-cse/in-name/{SLOW_HOME}/{device}", args.slow_latency)
+
+    spoken, settled = {}, {}
+    execute = voiceprocess.execute_om2m_action
+
+    def tracked(action, home):
+        future = execute(action, home)
+        future.add_done_callback(lambda f: settled.__setitem__((home.name, action['session_id']), time.perf_counter()))
+        return future
+
+    voiceprocess.execute_om2m_action = tracked
+    voiceprocess.recognize_session = lambda session_id, audio: simulated_recognize(session_id, audio, args.asr_ms / 1000)
+    voiceprocess.ASR_PROCESSES = 0
+    voiceprocess.asr_stage.batch_size = 1  # simulated_recognize stands in for one session's ASR
+    voiceprocess.models_ready.set()
+    voiceprocess.asr_stage.start()
+    table = homes.RoutingTable([homes.Home(name, base_url, f"{name}/audio_upload",
+                                           {device: f"{name}/{device}" for device in homes.DEVICE_CONTAINERS},
+                                           pool_size=voiceprocess.ACTUATION_WORKERS + 2) for name in names])
+    with contextlib.redirect_stdout(io.StringIO()):
+        voiceprocess.setup_routing(table)
+        server = voiceprocess.start_notification_server(host="127.0.0.1", port=0)
+        voiceprocess.NOTIFICATION_URL = f"http://127.0.0.1:{server.server_address[1]}/notify"
+        voiceprocess.start_intake(push=True)
+        deadline = time.time() + 30
+        while not all(home.intake_primed for home in table) and time.time() < deadline:
+            time.sleep(0.05)
+
+    print(f"{args.homes} homes x {args.sessions} sessions (one every {args.interval:g} s on average), "
+          f"ASR {args.asr_ms:.0f} ms, {SLOW_HOME}'s devices answering after {args.slow_latency:g} s")
+    start = time.perf_counter()
+    speakers = [threading.Thread(target=speak, args=(base_url, name, args.sessions, args.interval, spoken))
+                for name in names]
+    for thread in speakers:
+        thread.start()
+    for thread in speakers:
+        thread.join()
+    deadline = time.perf_counter() + 10 + 2 * args.slow_latency
+    while len(settled) < len(spoken) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    for label, group in ((SLOW_HOME, [SLOW_HOME]), ("other homes", names[1:])):
+        latencies = [settled[key] - spoken[key] for key in spoken if key[0] in group and key in settled]
+        missed = sum(1 for key in spoken if key[0] in group and key not in settled)
+        if not latencies:
+            print(f"  {label:<12} no sessions settled ({missed} missed)")
+            continue
+        print(f"  {label:<12} n={len(latencies):<4} p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+              f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms  missed {missed}")
+    print(f"  {len(settled)} sessions in {elapsed:.1f} s; {cse.request_count} CSE requests")
+    print(voiceprocess.pipeline_summary())
+    server.shutdown()
+    cse.stop()
+
+
+if __name__ == "__main__":
+    main()
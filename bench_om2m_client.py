@@ -0,0 +1,106 @@
+"""
+Benchmark: OM2M requests per second, per-call requests.post/get vs the pooled om2m client.
+
+Starts the stub CSE (stubcse.py) with an AE and container, then runs --requests
+operations in each mode, alternating "create a content instance" and "GET /la" (what
+actuation and sensor polling do):
+  per-call  requests.post/get with their own headers, a new TCP connection per call
+            (how the scripts talked to the CSE before)
+  pooled    one om2m.OM2MClient, sequential calls over its keep-alive connections
+  threads   the same client shared by --concurrency threads
+  async     om2m.AsyncOM2MClient, --concurrency operations in flight with asyncio
+--latency adds a delay to every stub response, like a CSE across the network.
+
+    python bench_om2m_client.py --requests 2000 --concurrency 8
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+import requests
+
+import om2m
+from stubcse import StubCSE
+
+HEADERS = {"X-M2M-Origin": "admin:admin", "Accept": "application/json"}
+
+
+def per_call(container_url, n):
+    for i in range(n):
+        if i % 2:
+            requests.get(f"{container_url}/la", headers=HEADERS, timeout=10).raise_for_status()
+        else:
+            requests.post(container_url, json={"m2m:cin": {"con": str(i)}},
+                          headers={**HEADERS, "Content-Type": "application/json;ty=4"}, timeout=10).raise_for_status()
+
+
+def pooled_operation(client, container_url, i):
+    if i % 2:
+        client.latest(container_url)
+    else:
+        client.create_content_instance(container_url, str(i)).raise_for_status()
+
+
+def pooled(container_url, n, client):
+    for i in range(n):
+        pooled_operation(client, container_url, i)
+
+
+def threaded(container_url, n, client, concurrency):
+    threads = [threading.Thread(target=lambda offset: [pooled_operation(client, container_url, i)
+                                                       for i in range(offset, n, concurrency)], args=(offset,))
+               for offset in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def run_async(container_url, n, base_url, concurrency):
+    async with om2m.AsyncOM2MClient(base_url, pool_size=concurrency) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def operation(i):
+            async with semaphore:
+                if i % 2:
+                    await client.latest(container_url)
+                else:
+                    (await client.create_content_instance(container_url, str(i))).raise_for_status()
+        await asyncio.gather(*(operation(i) for i in range(n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every stub CSE response")
+    args = parser.parse_args()
+
+    cse = StubCSE(port=0)
+    base_url = cse.start()
+    client = om2m.OM2MClient(base_url, pool_size=args.concurrency)
+    client.create_ae("bench", "app-bench").raise_for_status()
+    client.create_container("bench", "data", mni=100).raise_for_status()
+    container_url = client.url("bench/data")
+    cse.set_latency("/~/in-cse/in-name/bench", args.latency)
+    modes = {
+        "per-call": lambda: per_call(container_url, args.requests),
+        "pooled": lambda: pooled(container_url, args.requests, client),
+        f"threads x{args.concurrency}": lambda: threaded(container_url, args.requests, client, args.concurrency),
+        f"async x{args.concurrency}": lambda: asyncio.run(run_async(container_url, args.requests, base_url, args.concurrency)),
+    }
+    try:
+        print(f"{args.requests} requests per mode (half CIN creates, half GET /la), stub latency {args.latency * 1000:.0f} ms")
+        for label, run in modes.items():
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:<12} {args.requests / elapsed:8.0f} req/s  ({elapsed / args.requests * 1000:6.2f} ms/request)")
+    finally:
+        client.close()
+        cse.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Load test: end-to-end latency of the staged pipeline vs the old serial loop.
+
+Replays many synthetic firmware sessions (output.wav split into AUDIO_START/CHUNK/END)
+straight into the session assembler at a Poisson arrival rate. ASR is simulated by
+burning CPU for --asr-ms (in the ASR worker processes in pipeline mode) and actuation by
+sleeping --actuation-ms, like a slow OM2M response. Latency runs from the moment a
+session was due to complete to the moment its command was sent, so time a session
+spent waiting behind another one is counted.
+
+  serial    assemble, recognize and actuate inline in the intake thread (previous design)
+  pipeline  voiceprocess stages: ASR pool of --asr-processes, ACTUATION_WORKERS threads
+
+    python bench_pipeline_load.py --sessions 200 --rate 4 --asr-ms 150 --actuation-ms 300 --asr-processes 2
+"""
+import argparse
+import contextlib
+import functools
+import io
+import random
+import statistics
+import time
+
+import voiceprocess
+from bench_intake_latency import build_session_messages
+from pipeline import percentile
+
+DEVICES = ("led", "solenoid", "fan")
+
+
+def simulated_asr_init(cpu_threads):
+    """ Replaces init_asr_worker: nothing to load. """
+
+
+def simulated_recognize(session_id, audio, asr_seconds):
+    """ Burns CPU like a transcription would and returns a command for the session. """
+    end = time.perf_counter() + asr_seconds
+    while time.perf_counter() < end:
+        pass
+    return {"device": DEVICES[int(session_id) % len(DEVICES)], "action": "activate", "session_id": session_id}
+
+
+def simulated_recognize_in_worker(session_id, audio, asr_seconds):
+    """ Replaces recognize_in_worker: the simulated result and no worker metrics. """
+    return simulated_recognize(session_id, audio, asr_seconds), {}
+
+
+def make_entries(num_sessions, first_id):
+    """ Content instances for num_sessions sessions, as the CSE would return them. """
+    sessions, ri = [], 0
+    template = build_session_messages("0")
+    for n in range(num_sessions):
+        session_id = str(first_id + n)
+        entries = []
+        for message in template:
+            ri += 1
+            kind, rest = message.split(":", 1)
+            rest = rest.split(":", 1)[1] if ":" in rest else ""
+            con = f"{kind}:{session_id}:{rest}" if rest else f"{kind}:{session_id}"
+            entries.append({"ri": f"/in-cse/cin-{first_id}-{ri}", "ct": "20250101T000000", "con": con})
+        sessions.append((session_id, entries))
+    return sessions
+
+
+def replay(home, sessions, rate, due, wait_done):
+    """ Feeds sessions at Poisson arrivals; due[session_id] is when it should have completed. """
+    next_arrival = time.perf_counter()
+    for session_id, entries in sessions:
+        next_arrival += random.expovariate(rate)
+        time.sleep(max(0.0, next_arrival - time.perf_counter()))
+        due[session_id] = next_arrival
+        for entry in entries:
+            voiceprocess.handle_pushed_entry(home, entry)
+    wait_done()
+
+
+def run(mode, args):
+    done, due = {}, {}
+    home = next(iter(voiceprocess.routing))
+
+    def execute(action, home=None):
+        time.sleep(args.actuation_ms / 1000)
+        done[action["session_id"]] = time.perf_counter()
+
+    voiceprocess.execute_om2m_action = execute
+    sessions = make_entries(args.sessions, first_id=100000 if mode == "serial" else 200000)
+
+    if mode == "serial":
+        original = home.assembler.on_complete
+
+        def serial(session_id, session_data):
+            audio = voiceprocess.decode_wav_bytes(voiceprocess.assemble_wav_file(session_data))
+            action = simulated_recognize(session_id, audio, args.asr_ms / 1000)
+            execute(action)
+            return True
+
+        home.assembler.on_complete = serial
+        replay(home, sessions, args.rate, due, lambda: None)
+        home.assembler.on_complete = original
+    else:
+        voiceprocess.ASR_PROCESSES = args.asr_processes
+        # partial of a module-level function, so it pickles into the ASR worker processes
+        voiceprocess.recognize_session = functools.partial(simulated_recognize, asr_seconds=args.asr_ms / 1000)
+        voiceprocess.recognize_in_worker = functools.partial(simulated_recognize_in_worker, asr_seconds=args.asr_ms / 1000)
+        voiceprocess.init_asr_worker = simulated_asr_init
+        if args.asr_processes > 0 and not voiceprocess.start_asr_pool():
+            raise SystemExit("ASR worker pool failed to start.")
+        voiceprocess.models_ready.set()
+        voiceprocess.asr_stage.workers = max(1, args.asr_processes)
+        voiceprocess.asr_stage.batch_size = 1  # simulated_recognize stands in for one session's ASR
+        voiceprocess.asr_stage.start()
+
+        def drain():
+            while len(done) < len(sessions) and voiceprocess.asr_stage.stats["dropped"] == 0:
+                time.sleep(0.01)
+            voiceprocess.asr_stage.join()
+            home.actuation_stage.join()
+
+        replay(home, sessions, args.rate, due, drain)
+    latencies = [(done[sid] - due[sid]) * 1000 for sid in due if sid in done]
+    return latencies, len(due) - len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=3.0, help="Mean session arrivals per second")
+    parser.add_argument("--asr-ms", type=float, default=150)
+    parser.add_argument("--actuation-ms", type=float, default=300)
+    parser.add_argument("--asr-processes", type=int, default=voiceprocess.ASR_PROCESSES)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    voiceprocess.setup_routing()  # The one home of SERVER_URL; actuation is simulated
+
+    print(f"{args.sessions} sessions at {args.rate}/s, ASR {args.asr_ms:.0f} ms, actuation {args.actuation_ms:.0f} ms")
+    for mode in ("serial", "pipeline"):
+        random.seed(args.seed)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, missed = run(mode, args)
+        elapsed = time.perf_counter() - start
+        if not latencies:
+            print(f"{mode:<9} no sessions completed")
+            continue
+        print(f"{mode:<9} p50={percentile(latencies, 50):8.1f} ms  p99={percentile(latencies, 99):8.1f} ms  "
+              f"mean={statistics.mean(latencies):8.1f} ms  throughput={len(latencies) / elapsed:5.2f}/s  "
+              f"missed={missed}")
+    print(voiceprocess.pipeline_summary())
+    if voiceprocess.asr_pool is not None:
+        voiceprocess.asr_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
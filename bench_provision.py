@@ -0,0 +1,81 @@
+"""
+Benchmark: provisioning --homes homes, one POST at a time vs provision.py.
+
+Each home is an AE (home_001, ...) with the containers of om2m_tree.json below it. On a
+fresh stub CSE (stubcse.py) with --latency added to every response, like a CSE across
+the network, it times:
+  sequential  one requests.post per resource, parents first (how the setup scripts
+              provisioned before)
+  provision   provision.py: parallel GETs to diff, then creates level by level with
+              --concurrency requests in flight
+  re-run      provision.py again on the provisioned CSE (diff only, nothing to create)
+
+    python bench_provision.py --homes 100 --latency 0.02 --concurrency 16
+"""
+import argparse
+import time
+
+import requests
+
+import om2m
+import provision
+from stubcse import StubCSE
+
+HEADERS = {"X-M2M-Origin": "admin:admin", "Accept": "application/json"}
+
+
+def homes_spec(homes):
+    containers = [{"ty": "cnt", "rn": name} for name in ("led", "fan", "solenoid", "gas_data", "fall_data", "command_data")]
+    containers.append({"ty": "cnt", "rn": "audio_upload", "mni": 10, "mbs": 100000})
+    return [{"ty": "ae", "rn": f"home_{index:03d}", "api": "app-home", "rr": True, "children": containers}
+            for index in range(1, homes + 1)]
+
+
+def sequential(base_url, nodes):
+    for node in nodes:
+        ty = om2m.RESOURCE_TYPES[node.resource_key]
+        parent = f"{base_url}/~/in-cse/in-name/{node.parent}".rstrip('/')
+        response = requests.post(parent, json={node.resource_key: node.attributes},
+                                 headers={**HEADERS, "Content-Type": f"application/json;ty={ty}"}, timeout=30)
+        response.raise_for_status()
+
+
+def timed_on_stub(latency, run):
+    cse = StubCSE(port=0, latency=latency)
+    base_url = cse.start()
+    try:
+        start = time.perf_counter()
+        result = run(base_url)
+        return time.perf_counter() - start, result, cse
+    finally:
+        cse.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--homes", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every stub CSE response")
+    parser.add_argument("--concurrency", type=int, default=provision.CONCURRENCY)
+    args = parser.parse_args()
+    nodes = provision.flatten(homes_spec(args.homes))
+    print(f"{args.homes} homes, {len(nodes)} resources, stub latency {args.latency * 1000:.0f} ms")
+
+    elapsed, _, cse = timed_on_stub(args.latency, lambda base_url: sequential(base_url, nodes))
+    print(f"  sequential  {elapsed:7.2f} s  {cse.request_count:5d} requests")
+
+    def provision_twice(base_url):
+        with om2m.OM2MClient(base_url, pool_size=args.concurrency) as client:
+            start = time.perf_counter()
+            first = provision.provision(nodes, client, args.concurrency)
+            first_elapsed = time.perf_counter() - start
+            second = provision.provision(nodes, client, args.concurrency)
+        return first_elapsed, first, second
+
+    total, (first_elapsed, first, second), cse = timed_on_stub(args.latency, provision_twice)
+    print(f"  provision   {first_elapsed:7.2f} s  {len(first['created'])} created, {len(first['failed'])} failed")
+    print(f"  re-run      {total - first_elapsed:7.2f} s  {len(second['unchanged'])} unchanged, "
+          f"{len(second['created']) + len(second['updated'])} changed  ({cse.request_count} requests in both runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Load test: many dashboards polling the read API (readapi.py), with and without its cache.
+
+Loads --hours of synthetic gas readings (one every --gas-interval seconds, ending now)
+and a few fall events into a scratch database through mong.build_document, with the
+indexes mong.prepare_database creates. An ingester then stores one gas reading every
+--ingest-interval seconds through mong.store_or_update_entries and invalidates the
+cache like mong.store_entries does. Meanwhile --clients dashboard threads each poll,
+every --poll seconds (staggered):
+  /latest, /range?source=gas_sensor&since=300, /series?source=gas_sensor&since=86400
+Runs for --duration seconds with the cache (CACHE_TTL) and without it (ttl=0), and
+reports requests per second, request latency p50/p99 and the number of MongoDB
+queries the service made. First prints the plan stages of /latest's all-sources
+aggregation (readapi.LATEST_ALL_PIPELINE), which should include DISTINCT_SCAN.
+
+    python bench_read_api.py --uri mongodb://localhost:27017/ --clients 100 --poll 2 --duration 30
+"""
+import argparse
+import random
+import threading
+import time
+
+import requests
+from pymongo import MongoClient
+
+import mong
+import readapi
+from pipeline import percentile
+
+DASHBOARD_QUERIES = ("/latest", "/range?source=gas_sensor&since=300", "/series?source=gas_sensor&since=86400")
+
+
+def load(collection, hours, gas_interval):
+    now = time.time()
+    t, n, batch = now - hours * 3600, 0, []
+    while t < now:
+        n += 1
+        ct = time.strftime(mong.OM2M_TIME_FORMAT, time.localtime(t))
+        batch.append(mong.build_document({'ri': f"/in-cse/cin-{n}", 'ct': ct, 'con': str(random.randint(300, 1024))}, 'gas_sensor'))
+        if n % 500 == 0:
+            batch.append(mong.build_document({'ri': f"/in-cse/fall-{n}", 'ct': ct,
+                                              'con': f"FALL_DETECTED: accel={random.uniform(5000, 45000):.2f}"}, 'fall_sensor'))
+        if len(batch) >= 10000:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+        t += gas_interval
+    if batch:
+        collection.insert_many(batch, ordered=False)
+    return n
+
+
+def ingest(collection, cache, interval, stop_event):
+    n = 0
+    while not stop_event.wait(interval):
+        n += 1
+        entry = {'ri': f"/in-cse/live-{time.time_ns()}", 'ct': time.strftime(mong.OM2M_TIME_FORMAT), 'con': str(random.randint(300, 1024))}
+        counts = mong.store_or_update_entries(collection, [entry], 'gas_sensor')
+        if counts['inserted']:
+            cache.invalidate('gas_sensor')
+
+
+def dashboard(base_url, poll, stop_event, latencies, errors):
+    session = requests.Session()
+    stop_event.wait(random.uniform(0, poll))
+    while not stop_event.is_set():
+        tick = time.perf_counter()
+        for query in DASHBOARD_QUERIES:
+            start = time.perf_counter()
+            try:
+                session.get(base_url + query, timeout=30).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except requests.RequestException:
+                errors.append(query)
+        stop_event.wait(max(0.0, poll - (time.perf_counter() - tick)))
+
+
+def mongo_queries():
+    return sum(sum(child.counts) for _, child in readapi.read_query_seconds._samples())
+
+
+def plan_stages(plan):
+    """ Stage names anywhere in an explain() result, outermost first. """
+    if isinstance(plan, dict):
+        return ([plan['stage']] if isinstance(plan.get('stage'), str) else []) + \
+            [stage for value in plan.values() for stage in plan_stages(value)]
+    if isinstance(plan, list):
+        return [stage for value in plan for stage in plan_stages(value)]
+    return []
+
+
+def run(collection, ttl, args):
+    cache = readapi.ReadCache(ttl=ttl)
+    server = readapi.start_http_server(0, readapi.ReadService(collection, cache), "127.0.0.1")
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    stop_event, latencies, errors = threading.Event(), [], []
+    threads = [threading.Thread(target=ingest, args=(collection, cache, args.ingest_interval, stop_event), daemon=True)]
+    threads += [threading.Thread(target=dashboard, args=(base_url, args.poll, stop_event, latencies, errors), daemon=True)
+                for _ in range(args.clients)]
+    queries_before = mongo_queries()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    queries = mongo_queries() - queries_before
+    label = f"cache ttl {ttl:g} s" if ttl else "no cache"
+    print(f"{label:<16} {len(latencies) / args.duration:8.1f} req/s  p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f} ms  MongoDB queries {queries:6d} "
+          f"({queries / args.duration:6.1f}/s)  errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uri", default=mong.MONGO_URI)
+    parser.add_argument("--db", default="om2m_bench_read_api")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--gas-interval", type=float, default=mong.FETCH_INTERVAL)
+    parser.add_argument("--ingest-interval", type=float, default=mong.FETCH_INTERVAL)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--poll", type=float, default=2, help="Seconds between a dashboard's refreshes")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--ttl", type=float, default=readapi.CACHE_TTL)
+    args = parser.parse_args()
+    mong.logging.getLogger().setLevel(mong.logging.WARNING)
+
+    client = MongoClient(args.uri)
+    client.drop_database(args.db)
+    collection = client[args.db][mong.MONGO_COLLECTION_NAME]
+    try:
+        collection.create_index('ri', unique=True)
+        collection.create_index([('source_name', 1), ('ct', 1)])
+        start = time.perf_counter()
+        readings = load(collection, args.hours, args.gas_interval)
+        print(f"Loaded {readings} readings in {time.perf_counter() - start:.1f} s; {args.clients} dashboards polling every "
+              f"{args.poll:g} s, one new reading every {args.ingest_interval:g} s")
+        explain = collection.database.command('aggregate', collection.name, pipeline=readapi.LATEST_ALL_PIPELINE, explain=True)
+        print(f"/latest (all sources) plan: {' <- '.join(plan_stages(explain)) or 'unknown'}")
+        for ttl in (args.ttl, 0):
+            run(collection, ttl, args)
+    finally:
+        client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark: throughput and peak RSS of readings_dump.py against json.load.
+
+Writes a synthetic dump of about --mb MB by repeating the documents of
+MongoDB_readingsdata.json with fresh ri/_id values, then runs each mode in its own
+process so peak RSS (ru_maxrss) is per mode:
+  json.load        the whole array at once (what loading the dump used to take)
+  stream           readings_dump.iter_json_array
+  import           stream + build/batch the mong.store_entries bulk_writes (a collection
+                   that only counts operations, so no server: database preparation, voice
+                   sessions and time-series readings are skipped)
+  export-ndjson    stream -> .ndjson.gz
+  export-parquet   stream -> .parquet (skipped without pyarrow)
+
+    python bench_readings_dump.py --mb 200
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from bson import ObjectId, json_util
+
+import readings_dump
+
+MODES = ["json.load", "stream", "import", "export-ndjson", "export-parquet"]
+
+
+class CountingCollection:
+    """ Accepts bulk_writes and reports every upsert as an insert. """
+
+    def __init__(self):
+        self.operations = 0
+
+    def bulk_write(self, operations, ordered=True):
+        self.operations += len(operations)
+        summary = {'nUpserted': len(operations), 'nMatched': 0, 'nModified': 0,
+                   'upserted': [{'index': i} for i in range(len(operations))]}
+        return type("BulkWriteResult", (), {"bulk_api_result": summary})()
+
+
+def write_dump(path, sample_path, target_bytes):
+    with open(sample_path) as f:
+        sample = json_util.loads(f.read())
+    written, n = 0, 0
+    with open(path, 'w') as f:
+        f.write("[")
+        while written < target_bytes:
+            for document in sample:
+                document = {**document, '_id': ObjectId(), 'ri': f"/in-cse/cin-bench-{n}"}
+                text = ("," if n else "") + json_util.dumps(document, indent=2)
+                f.write(text)
+                written += len(text)
+                n += 1
+        f.write("]")
+    return n
+
+
+def run_mode(mode, path, out_dir):
+    if mode == "json.load":
+        with open(path) as f:
+            return len(json_util.loads(f.read()))
+    if mode == "stream":
+        return sum(1 for _ in readings_dump.iter_dump(path))
+    if mode == "import":
+        readings_dump.mong.database_ready = True  # Nothing to prepare on CountingCollection
+        readings_dump.mong.VOICE_SESSION_SOURCES = set()  # Voice chunks take the bulk_write path too
+        read, _ = readings_dump.import_dump(CountingCollection(), path)
+        return read
+    if mode == "export-ndjson":
+        return readings_dump.export_documents(readings_dump.iter_dump(path), os.path.join(out_dir, "dump.ndjson.gz"))
+    return readings_dump.export_documents(readings_dump.iter_dump(path), os.path.join(out_dir, "dump.parquet"))
+
+
+def child(mode, path, out_dir):
+    readings_dump.logging.getLogger().setLevel(readings_dump.logging.WARNING)
+    start = time.perf_counter()
+    documents = run_mode(mode, path, out_dir)
+    elapsed = time.perf_counter() - start
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"documents": documents, "seconds": elapsed, "peak_mib": peak_kib / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, default=100)
+    parser.add_argument("--sample", default="MongoDB_readingsdata.json")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "DUMP", "OUT_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        path = os.path.join(out_dir, "dump.json")
+        count = write_dump(path, args.sample, int(args.mb * 1024 * 1024))
+        size_mib = os.path.getsize(path) / 1024 / 1024
+        print(f"Synthetic dump: {count} documents, {size_mib:.1f} MiB")
+        baseline = subprocess.run([sys.executable, "-c", "import readings_dump, resource; "
+                                   "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"],
+                                  capture_output=True, text=True, check=True)
+        print(f"Interpreter + imports alone: {int(baseline.stdout) / 1024:.1f} MiB peak RSS")
+        for mode in MODES:
+            proc = subprocess.run([sys.executable, __file__, "--child", mode, path, out_dir], capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{mode:<15} skipped: {proc.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            output = {"export-ndjson": "dump.ndjson.gz", "export-parquet": "dump.parquet"}.get(mode)
+            output_size = f"  output {os.path.getsize(os.path.join(out_dir, output)) / 1024 / 1024:7.1f} MiB" if output else ""
+            print(f"{mode:<15} {result['seconds']:7.2f} s  {size_mib / result['seconds']:7.1f} MiB/s  "
+                  f"{result['documents'] / result['seconds']:9.0f} docs/s  peak RSS {result['peak_mib']:8.1f} MiB{output_size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark: per-poll CPU of the old hash + re-group path vs the incremental SessionAssembler.
+
+Builds synthetic ?rcn=4 containers of 10, 1k and 100k content instances (6 per session,
+like the firmware's START + 4 CHUNK + END), then times one steady-state poll in which a
+single new session has arrived since the previous poll.
+
+    python bench_session_assembler.py --sizes 10 1000 100000 --repeat 5
+"""
+import argparse
+import hashlib
+import json
+import statistics
+import time
+
+from audiosession import SessionAssembler, parse_audio_message, new_session
+
+CHUNKS_PER_SESSION = 4
+
+
+def synthetic_entries(num_instances, payload_bytes, first_session=100000):
+    """ Returns a list of m2m:cin dicts shaped like the voice_command/audio_upload container. """
+    payload = "A" * payload_bytes
+    entries = []
+    session_id = first_session
+    while len(entries) < num_instances:
+        messages = [f"AUDIO_START:{session_id}:{CHUNKS_PER_SESSION}:{payload[:60]}"]
+        messages += [f"AUDIO_CHUNK:{session_id}:{i}:{payload}" for i in range(CHUNKS_PER_SESSION)]
+        messages.append(f"AUDIO_END:{session_id}")
+        for message in messages:
+            n = len(entries)
+            entries.append({"ty": 4, "ri": f"/in-cse/cin-{n}", "rn": f"cin_{n}", "pi": "/in-cse/cnt-1",
+                            "ct": "20250410T152836", "lt": "20250410T152836", "st": 0,
+                            "cs": len(message), "con": message})
+        session_id += 1
+    return entries[:num_instances]
+
+
+def legacy_poll(entries):
+    """ What process_data_if_new did every poll before the assembler: dump + MD5, then regroup everything. """
+    data = {"m2m:cnt": {"m2m:cin": entries}}
+    hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    sessions = {}
+    for entry in entries:
+        parsed = parse_audio_message(entry.get("con"))
+        if parsed is None:
+            continue
+        kind, session_id, number, payload = parsed
+        session = sessions.setdefault(session_id, new_session())
+        if kind == "start":
+            session["header"], session["total_chunks"] = payload, number
+        elif kind == "chunk":
+            session["chunks"][number] = payload
+        else:
+            session["end"] = True
+    return sessions
+
+
+def time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--payload-bytes", type=int, default=64, help="Base64 characters per chunk")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'instances':>10} {'legacy/poll':>14} {'assembler/poll':>16} {'speedup':>9}")
+    for size in args.sizes:
+        base = synthetic_entries(size, args.payload_bytes)
+        # One new session (6 instances) arrived since the last poll
+        next_session = 100000 + size // (CHUNKS_PER_SESSION + 2) + 1
+        polled = base + synthetic_entries(CHUNKS_PER_SESSION + 2, args.payload_bytes, first_session=next_session)
+        for i, entry in enumerate(polled[len(base):]):
+            entry["ri"] = f"/in-cse/cin-new-{i}"
+
+        legacy = time_call(lambda: legacy_poll(polled), args.repeat)
+
+        def assembler_poll():
+            assembler = SessionAssembler(on_complete=lambda sid, data: None)
+            assembler.ingest(base)  # Previous polls, not timed
+            start = time.perf_counter()
+            assembler.ingest(polled)
+            return time.perf_counter() - start
+
+        incremental = statistics.median(assembler_poll() for _ in range(args.repeat))
+        print(f"{size:>10} {legacy * 1000:>11.3f} ms {incremental * 1000:>13.3f} ms {legacy / incremental:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
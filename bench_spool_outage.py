@@ -0,0 +1,167 @@
+"""
+Load test: kill mongod in the middle of ingestion and check that nothing is lost.
+
+Starts its own mongod (--mongod, on a scratch --dbpath and --port) and the stub CSE
+(stubcse.py) with a gas container and a voice container. A generator posts --rate gas
+readings per second plus one two-chunk voice session per tick, while mong.py's pollers
+and spool drainer run against them. After --kill-after seconds mongod is killed with
+SIGKILL, and it is restarted --outage seconds later. Generation stops after --duration
+seconds, and the test waits for the spool to drain. It then checks that every gas
+content instance is in the readings collection and every voice session is in
+voice_sessions, and reports the peak spool size and how long draining took.
+
+    python bench_spool_outage.py --mongod /usr/bin/mongod --duration 30 --kill-after 8 --outage 10
+"""
+import argparse
+import base64
+import io
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+
+import requests
+from pymongo import MongoClient
+
+import mong
+from stubcse import StubCSE
+
+HEADERS = {"X-M2M-Origin": "admin:admin", "Accept": "application/json"}
+
+
+def start_mongod(args):
+    process = subprocess.Popen([args.mongod, "--dbpath", args.dbpath, "--port", str(args.port), "--bind_ip", "127.0.0.1"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    client = MongoClient(f"mongodb://127.0.0.1:{args.port}/", serverSelectionTimeoutMS=30000)
+    client.admin.command('ping')
+    return process
+
+
+def provision(base_url, ae, cnt):
+    requests.post(f"{base_url}/~/in-cse", json={"m2m:ae": {"rn": ae, "api": f"app-{ae}", "rr": True}},
+                  headers={**HEADERS, "Content-Type": "application/json;ty=2"})
+    requests.post(f"{base_url}/~/in-cse/in-name/{ae}", json={"m2m:cnt": {"rn": cnt, "mni": 1000000}},
+                  headers={**HEADERS, "Content-Type": "application/json;ty=3"})
+    return f"{base_url}/~/in-cse/in-name/{ae}/{cnt}"
+
+
+def post(container_url, con):
+    requests.post(container_url, json={"m2m:cin": {"con": con}}, headers={**HEADERS, "Content-Type": "application/json;ty=4"})
+
+
+def wav_header_b64():
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(bytes(1600))
+    return base64.b64encode(buffer.getvalue()[:44]).decode()
+
+
+def generate(gas_url, voice_url, rate, stop_event, created):
+    header, chunk = wav_header_b64(), base64.b64encode(bytes(800)).decode()
+    session_id = 1000
+    while not stop_event.is_set():
+        tick = time.time()
+        for _ in range(rate):
+            post(gas_url, str(300 + created['gas'] % 700))
+            created['gas'] += 1
+        session_id += 1
+        post(voice_url, f"AUDIO_START:{session_id}:2:{header}")
+        for index in range(2):
+            post(voice_url, f"AUDIO_CHUNK:{session_id}:{index}:{chunk}")
+        post(voice_url, f"AUDIO_END:{session_id}")
+        created['voice'] += 1
+        stop_event.wait(max(0.0, 1.0 - (time.time() - tick)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mongod", default="mongod")
+    parser.add_argument("--port", type=int, default=27099)
+    parser.add_argument("--dbpath", help="Scratch data directory (a temporary one by default)")
+    parser.add_argument("--rate", type=int, default=20, help="Gas readings per second")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--kill-after", type=float, default=8)
+    parser.add_argument("--outage", type=float, default=10)
+    args = parser.parse_args()
+    scratch = tempfile.mkdtemp()
+    args.dbpath = args.dbpath or os.path.join(scratch, "db")
+    os.makedirs(args.dbpath, exist_ok=True)
+    mong.logging.getLogger().setLevel(mong.logging.WARNING)
+
+    mongod = start_mongod(args)
+    cse = StubCSE(port=0)
+    base_url = cse.start()
+    gas_url, voice_url = provision(base_url, "gas_sensor", "data"), provision(base_url, "voice_command", "audio_upload")
+    mong.MONGO_URI = f"mongodb://127.0.0.1:{args.port}/"
+    mong.SPOOL_PATH = os.path.join(scratch, "spool.sqlite3")
+    mong.FETCH_INTERVAL, mong.SPOOL_DRAIN_INTERVAL, mong.FETCH_LIMIT = 1, 1, 1000
+    sources = [{'name': 'gas_sensor', 'url': f"{gas_url}?rcn=4"}, {'name': 'voice_audio', 'url': f"{voice_url}?rcn=4"}]
+
+    collection = mong.get_mongo_collection()
+    state_collection = collection.database[mong.MONGO_STATE_COLLECTION_NAME]
+    mong.ingest_spool = mong.Spool(mong.SPOOL_PATH)
+    stop_event, generator_stop = threading.Event(), threading.Event()
+    session = mong.create_http_session(len(sources))
+    threads = [threading.Thread(target=mong.poll_source, args=(collection, source, session, stop_event, state_collection), daemon=True)
+               for source in sources]
+    threads.append(threading.Thread(target=mong.drain_spool, args=(collection, mong.ingest_spool, stop_event, state_collection), daemon=True))
+    created = {'gas': 0, 'voice': 0}
+    generator = threading.Thread(target=generate, args=(gas_url, voice_url, args.rate, generator_stop, created), daemon=True)
+    for thread in threads + [generator]:
+        thread.start()
+
+    peak = {'records': 0, 'bytes': 0}
+    def sample_spool():
+        peak['records'] = max(peak['records'], mong.ingest_spool.pending())
+        peak['bytes'] = max(peak['bytes'], mong.ingest_spool.size_bytes)
+
+    start = time.time()
+    try:
+        while time.time() - start < args.kill_after:
+            time.sleep(0.2)
+        mongod.send_signal(signal.SIGKILL)
+        mongod.wait()
+        print(f"{time.time() - start:6.1f} s  mongod killed")
+        while time.time() - start < args.kill_after + args.outage:
+            sample_spool()
+            time.sleep(0.2)
+        mongod = start_mongod(args)
+        restarted = time.time()
+        print(f"{time.time() - start:6.1f} s  mongod restarted, spool holds {mong.ingest_spool.pending()} records")
+        while time.time() - start < args.duration:
+            sample_spool()
+            time.sleep(0.2)
+        generator_stop.set()
+        generator.join()
+        time.sleep(3 * mong.FETCH_INTERVAL)  # Let the pollers pick up the last instances
+        while mong.ingest_spool.pending():
+            time.sleep(0.2)
+        drained = time.time() - restarted
+        stop_event.set()
+        for thread in threads:
+            thread.join(mong.FETCH_TIMEOUT)
+
+        stored_ris = set(collection.distinct('ri', {'source_name': 'gas_sensor'}))
+        response = requests.get(f"{gas_url}?rcn=4", auth=mong.AUTH_CREDENTIALS, headers=HEADERS).json()
+        created_ris = {entry['ri'] for entry in mong.extract_entries_from_response(response)}
+        sessions = collection.database[mong.MONGO_VOICE_COLLECTION_NAME].count_documents({})
+        print(f"Peak spool {peak['records']} records ({peak['bytes'] / 1024:.1f} KiB), drained {drained:.1f} s after restart, "
+              f"{mong.ingest_spool.dropped} dropped over the cap")
+        print(f"gas: {len(created_ris)} created, {len(created_ris & stored_ris)} stored, {len(created_ris - stored_ris)} lost")
+        print(f"voice: {created['voice']} sessions created, {sessions} stored, {created['voice'] - sessions} lost")
+    finally:
+        cse.stop()
+        mongod.terminate()
+        mongod.wait()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: sensor queries on the old string layout vs the typed time-series collection.
+
+Generates --days of synthetic readings (a gas reading every --gas-interval seconds and
+a few falls per day) and writes them twice into a scratch database: as mong.py stored
+them before (string 'con' and compact 'ct' in one generic collection with its 'ri' index)
+and through mong.build_reading into a time-series collection created by
+mong.get_timeseries_collection. Then times, on both layouts:
+  max gas per hour over the last 24 h
+  falls per day over the whole range
+Needs a MongoDB 5.0+ server (time-series collections and $dateTrunc).
+
+    python bench_timeseries_queries.py --uri mongodb://localhost:27017/ --days 7
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+import mong
+
+BATCH_SIZE = 10000
+
+
+def synthetic_entries(days, gas_interval, falls_per_day):
+    """ Yields (source_name, content instance) in creation order. """
+    start = datetime(2025, 4, 1)
+    end = start + timedelta(days=days)
+    falls = sorted(start + timedelta(seconds=random.uniform(0, days * 86400)) for _ in range(days * falls_per_day))
+    t, n = start, 0
+    while t < end:
+        while falls and falls[0] <= t:
+            n += 1
+            yield 'fall_sensor', {'ri': f"/in-cse/cin-{n}", 'ct': falls.pop(0).strftime(mong.OM2M_TIME_FORMAT),
+                                  'con': f"FALL_DETECTED: accel={random.uniform(5000, 45000):.2f}"}
+        n += 1
+        yield 'gas_sensor', {'ri': f"/in-cse/cin-{n}", 'ct': t.strftime(mong.OM2M_TIME_FORMAT),
+                             'con': str(random.randint(300, 1024))}
+        t += timedelta(seconds=gas_interval)
+
+
+def load(db, args):
+    old = db['readings_old']
+    old.create_index('ri', unique=True)
+    new = mong.get_timeseries_collection(db)
+    if new is None:
+        raise SystemExit("Time-series collections need MongoDB 5.0+.")
+    old_batch, new_batch, last_ct = [], [], None
+    for source_name, entry in synthetic_entries(args.days, args.gas_interval, args.falls_per_day):
+        old_batch.append({'ri': entry['ri'], 'source_name': source_name, 'ct': entry['ct'], 'con': entry['con']})
+        new_batch.append(mong.build_reading(entry, source_name))
+        last_ct = entry['ct']
+        if len(old_batch) >= BATCH_SIZE:
+            old.insert_many(old_batch, ordered=False)
+            new.insert_many(new_batch, ordered=False)
+            old_batch, new_batch = [], []
+    if old_batch:
+        old.insert_many(old_batch, ordered=False)
+        new.insert_many(new_batch, ordered=False)
+    return old, new, mong.parse_om2m_time(last_ct)
+
+
+def queries(end):
+    """ {query name: (old layout pipeline, new layout pipeline)} """
+    start = end - timedelta(hours=24)
+    start_ct, end_ct = start.strftime(mong.OM2M_TIME_FORMAT), end.strftime(mong.OM2M_TIME_FORMAT)
+    return {
+        "max gas per hour (24 h)": (
+            [{'$match': {'source_name': 'gas_sensor', 'ct': {'$gte': start_ct, '$lte': end_ct}}},
+             {'$group': {'_id': {'$substrBytes': ['$ct', 0, 11]}, 'max': {'$max': {'$toDouble': '$con'}}}},
+             {'$sort': {'_id': 1}}],
+            [{'$match': {'source_name': 'gas_sensor', 'timestamp': {'$gte': start, '$lte': end}}},
+             {'$group': {'_id': {'$dateTrunc': {'date': '$timestamp', 'unit': 'hour'}}, 'max': {'$max': '$gas_level'}}},
+             {'$sort': {'_id': 1}}]),
+        "falls per day": (
+            [{'$match': {'source_name': 'fall_sensor', 'con': {'$regex': '^FALL_DETECTED'}}},
+             {'$group': {'_id': {'$substrBytes': ['$ct', 0, 8]}, 'falls': {'$sum': 1}}},
+             {'$sort': {'_id': 1}}],
+            [{'$match': {'source_name': 'fall_sensor', 'fall': True}},
+             {'$group': {'_id': {'$dateTrunc': {'date': '$timestamp', 'unit': 'day'}}, 'falls': {'$sum': 1}}},
+             {'$sort': {'_id': 1}}]),
+    }
+
+
+def timed(collection, pipeline, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = list(collection.aggregate(pipeline))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uri", default=mong.MONGO_URI)
+    parser.add_argument("--db", default="om2m_bench_timeseries")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--gas-interval", type=float, default=mong.FETCH_INTERVAL)
+    parser.add_argument("--falls-per-day", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    mong.logging.getLogger().setLevel(mong.logging.WARNING)
+
+    client = MongoClient(args.uri)
+    client.drop_database(args.db)
+    db = client[args.db]
+    try:
+        start = time.perf_counter()
+        old, new, end = load(db, args)
+        print(f"Loaded {old.estimated_document_count()} readings per layout in {time.perf_counter() - start:.1f} s")
+        for name in (old.name, new.name):
+            stats = db.command('collStats', name)
+            print(f"  {name:<20} storage {stats.get('storageSize', 0) / 1024:10.1f} KiB  "
+                  f"indexes {stats.get('totalIndexSize', 0) / 1024:8.1f} KiB")
+        for label, (old_pipeline, new_pipeline) in queries(end).items():
+            old_time, old_result = timed(old, old_pipeline, args.repeat)
+            new_time, new_result = timed(new, new_pipeline, args.repeat)
+            same = [r.get('max', r.get('falls')) for r in old_result] == [r.get('max', r.get('falls')) for r in new_result]
+            print(f"{label:<26} old {old_time * 1000:8.1f} ms  time-series {new_time * 1000:8.1f} ms  "
+                  f"groups {len(old_result)}/{len(new_result)}{'' if same else '  (results differ!)'}")
+    finally:
+        client.drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
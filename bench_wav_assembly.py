@@ -0,0 +1,79 @@
+"""
+Benchmark: legacy chunk assembly (b64decode + growing bytearray + bytes() copy) vs
+assemble_wav_buffer (one preallocated buffer, each chunk decoded and copied to its offset).
+The gain is peak memory; time is about even (0.9x at firmware size), as decoding dominates.
+
+Clips range from the firmware's 3 s / 8 kHz recording (4 chunks of 12000 bytes) up to
+longer 16 kHz recordings split into chunks of the same size. Reports median time and
+peak traced allocation per assembly, and checks both produce identical bytes.
+
+    python bench_wav_assembly.py --repeat 20
+"""
+import argparse
+import base64
+import statistics
+import struct
+import time
+import tracemalloc
+
+from audiosession import assemble_wav_buffer
+
+CHUNK_BYTES = 12000  # Raw bytes per chunk in mainesp.ino (8000 samples * 2 bytes * 3 s / 4)
+CLIPS = [(8000, 3), (16000, 30), (16000, 120), (16000, 600)]  # (sample rate, seconds)
+
+
+def wav_header(sample_rate, data_size):
+    """ 44-byte PCM header, as built by the firmware. """
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, 1,
+                       sample_rate, sample_rate * 2, 2, 16, b"data", data_size)
+
+
+def synthetic_session(sample_rate, seconds):
+    data_size = sample_rate * seconds * 2
+    audio = bytes(range(256)) * (data_size // 256) + bytes(data_size % 256)
+    chunks = {i: base64.b64encode(audio[off:off + CHUNK_BYTES]).decode()
+              for i, off in enumerate(range(0, data_size, CHUNK_BYTES))}
+    return {"header": base64.b64encode(wav_header(sample_rate, data_size)).decode(),
+            "total_chunks": len(chunks), "chunks": chunks, "end": True}
+
+
+def legacy_assemble(session_data):
+    """ The assembler voiceprocess.py and tempspeechtotext.py used before. """
+    wav_data = bytearray(base64.b64decode(session_data["header"]))
+    chunks = session_data["chunks"]
+    for idx in sorted(chunks.keys()):
+        wav_data.extend(base64.b64decode(chunks[idx]))
+    return bytes(wav_data)
+
+
+def measure(fn, session, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(session)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(session)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times) * 1000, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'clip':>12} {'chunks':>7} {'legacy':>10} {'peak':>9} {'buffer':>10} {'peak':>9} {'speedup':>8}")
+    for sample_rate, seconds in CLIPS:
+        session = synthetic_session(sample_rate, seconds)
+        assert bytes(assemble_wav_buffer(session)) == legacy_assemble(session)
+        legacy_ms, legacy_peak = measure(legacy_assemble, session, args.repeat)
+        new_ms, new_peak = measure(assemble_wav_buffer, session, args.repeat)
+        print(f"{seconds:>5}s@{sample_rate // 1000:>2}kHz {session['total_chunks']:>7} "
+              f"{legacy_ms:>7.2f} ms {legacy_peak:>6.2f} MB {new_ms:>7.2f} ms {new_peak:>6.2f} MB "
+              f"{legacy_ms / new_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: feeding Whisper from a WAV file on disk vs decoding the assembled bytes in memory.
+
+Uses the checked-in samples: output.wav (8 kHz, as uploaded by the firmware) is the
+input, and output_16k.wav (the same clip at 16 kHz) is the reference used to check
+that in-memory resampling produces the same signal.
+
+Modes timed per command:
+  file       write OUTPUT_WAV_FILENAME, then faster_whisper.decode_audio(path)
+             (what transcribe(path) does internally; the previous behaviour)
+  file+wave  write, read back and decode with the same code as memory mode
+             (isolates the disk round trip when faster-whisper isn't installed)
+  memory     decode_wav_bytes(wav_bytes), the array passed straight to transcribe
+
+    python bench_wav_decode.py --repeat 50
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from audiosession import decode_wav_bytes, WHISPER_SAMPLE_RATE
+
+try:
+    from faster_whisper import decode_audio
+except ImportError:
+    decode_audio = None
+
+
+def time_mode(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input", default="output.wav")
+    parser.add_argument("--reference", default="output_16k.wav")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with open(args.input, "rb") as f:
+        wav_bytes = f.read()
+    with open(args.reference, "rb") as f:
+        reference = decode_wav_bytes(f.read())
+
+    wav_path = os.path.join(tempfile.mkdtemp(), "output_latest_command.wav")
+
+    def write_file():
+        with open(wav_path, "wb") as f:
+            f.write(wav_bytes)
+
+    def file_mode():
+        write_file()
+        return decode_audio(wav_path, sampling_rate=WHISPER_SAMPLE_RATE)
+
+    def file_wave_mode():
+        write_file()
+        with open(wav_path, "rb") as f:
+            return decode_wav_bytes(f.read())
+
+    def memory_mode():
+        return decode_wav_bytes(wav_bytes)
+
+    modes = [("file+wave", file_wave_mode), ("memory", memory_mode)]
+    if decode_audio is not None:
+        modes.insert(0, ("file", file_mode))
+    else:
+        print("faster-whisper not installed; skipping 'file' mode.")
+
+    print(f"{args.input}: {len(wav_bytes)} bytes, {args.repeat} runs per mode")
+    for name, fn in modes:
+        p50, worst = time_mode(fn, args.repeat)
+        print(f"  {name:<10} p50={p50:7.3f} ms  max={worst:7.3f} ms")
+
+    audio = memory_mode()
+    n = min(len(audio), len(reference))
+    corr = float(np.corrcoef(audio[:n], reference[:n])[0, 1])
+    print(f"memory output: {len(audio)} samples @ {WHISPER_SAMPLE_RATE} Hz, dtype {audio.dtype}; "
+          f"reference {len(reference)} samples; correlation {corr:.4f}, "
+          f"max abs diff {float(np.max(np.abs(audio[:n] - reference[:n]))):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: latency and command accuracy of each Whisper tier alone and of the cascade.
+
+Clips are WAV files; give the expected command phrase for each one in a JSON manifest
+({"path.wav": "lights on", ...}) to get accuracy. Without a manifest the checked-in
+recordings are used and only transcripts, matched commands and latency are reported.
+
+    python bench_whisper_tiers.py --manifest samples.json --repeat 3
+"""
+import argparse
+import json
+import statistics
+import time
+
+import voiceprocess
+from audiosession import decode_wav_bytes
+
+DEFAULT_CLIPS = {"output.wav": None, "output_latest_command.wav": None}
+
+
+def load_clips(manifest_path):
+    clips = DEFAULT_CLIPS
+    if manifest_path:
+        with open(manifest_path) as f:
+            clips = json.load(f)
+    loaded = []
+    for path, expected in clips.items():
+        with open(path, "rb") as f:
+            audio = decode_wav_bytes(f.read())
+        if expected is not None and expected not in voiceprocess.COMMAND_MAP:
+            raise SystemExit(f"Expected phrase '{expected}' for {path} is not a COMMAND_MAP key")
+        loaded.append((path, audio, expected))
+    return loaded
+
+
+def is_correct(action, expected):
+    """ Correct if the action matches the expected phrase's action (device/action/value). """
+    if expected is None:
+        return None
+    want = voiceprocess.COMMAND_MAP[expected]
+    return action is not None and all(action.get(k) == v for k, v in want.items())
+
+
+def report(label, latencies, results):
+    scored = [r for r in results if r is not None]
+    accuracy = f"{100 * sum(scored) / len(scored):5.1f}%" if scored else "  n/a"
+    print(f"{label:<22} p50={statistics.median(latencies) * 1000:8.1f} ms  "
+          f"mean={statistics.mean(latencies) * 1000:8.1f} ms  accuracy={accuracy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--manifest", help="JSON mapping WAV path -> expected COMMAND_MAP phrase")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    clips = load_clips(args.manifest)
+    if not voiceprocess.load_models():
+        raise SystemExit("Model loading failed.")
+
+    # Warm each model once so first-call overhead isn't counted
+    for tier in voiceprocess.WHISPER_TIERS:
+        voiceprocess.transcribe_audio(tier["model"], clips[0][1], tier.get("beam_size", 5))
+
+    print(f"\n{len(clips)} clips x {args.repeat} runs")
+    for tier in voiceprocess.WHISPER_TIERS:
+        latencies, results = [], []
+        for path, audio, expected in clips:
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                text, _ = voiceprocess.transcribe_audio(tier["model"], audio, tier.get("beam_size", 5))
+                phrase, score, _ = voiceprocess.match_commands([text])[0] if text else (None, 0.0, 0.0)
+                latencies.append(time.perf_counter() - start)
+            action = voiceprocess.COMMAND_MAP[phrase] if phrase and score >= voiceprocess.SIMILARITY_THRESHOLD else None
+            results.append(is_correct(action, expected))
+            print(f"  [{tier['model']}] {path}: '{text}' -> {phrase} ({score:.3f})")
+        report(f"{tier['model']} (beam {tier.get('beam_size', 5)})", latencies, results)
+
+    latencies, results, answered_by = [], [], {}
+    for path, audio, expected in clips:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            action = voiceprocess.process_audio_command(audio, label=path)
+            latencies.append(time.perf_counter() - start)
+        model = action.get("whisper_model") if action else "none"
+        answered_by[model] = answered_by.get(model, 0) + 1
+        results.append(is_correct(action, expected))
+    report("cascade", latencies, results)
+    print(f"cascade answered by: {answered_by}")
+
+
+if __name__ == "__main__":
+    main()
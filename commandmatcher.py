@@ -0,0 +1,177 @@
+"""
+Layered mapping of recognized text to COMMAND_MAP phrases.
+
+Layers are tried cheapest first and the first confident one wins:
+  exact      normalized text is a canonical phrase (dict lookup)
+  cache      the same normalized text was matched before (LRU)
+  fuzzy      token-set overlap / edit-distance ratio against phrases sharing a token;
+             never answers when the text has a state word (on, off, open, ...) the phrase lacks
+  embedding  the Sentence Transformer fallback supplied by the caller
+Per-layer hit counts and time are kept so the saving over always embedding can be reported.
+match_many() matches a batch of texts and embeds the ones the cheaper layers cannot
+answer in a single embed_match_many() call.
+"""
+import difflib
+import re
+import time
+from collections import OrderedDict
+
+FUZZY_MIN_SCORE = 0.85  # Fuzzy layer answers only at or above this similarity...
+FUZZY_MIN_MARGIN = 0.1  # ...and this lead over the best phrase with a different action
+CACHE_SIZE = 256
+# On/off-style words the similarity scores barely see ("turn on fan" is 0.87 like "turn off fan")
+STATE_WORDS = frozenset(("on", "off", "open", "close", "closed", "start", "stop", "activate", "deactivate",
+                         "enable", "disable", "up", "down"))
+LAYERS = ("exact", "cache", "fuzzy", "embedding")
+
+
+def normalize_command_text(text):
+    """ Lowercases, drops punctuation and collapses whitespace ("Lights on." -> "lights on"). """
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", text.lower()).split())
+
+
+def token_set_ratio(a_tokens, b_tokens):
+    """ Dice coefficient of two token sets: 1.0 when they hold the same words in any order. """
+    if not a_tokens or not b_tokens:
+        return 0.0
+    return 2 * len(a_tokens & b_tokens) / (len(a_tokens) + len(b_tokens))
+
+
+class CommandMatcher:
+    """
+    Maps text to (phrase, score, margin, layer). embed_match(text) must return
+    (phrase, score, margin) and is only called when the cheaper layers are not confident;
+    embed_match_many(texts), if given, returns a list of those for a batch of texts.
+    """
+
+    def __init__(self, command_map, embed_match=None, fuzzy_min_score=FUZZY_MIN_SCORE,
+                 fuzzy_min_margin=FUZZY_MIN_MARGIN, cache_size=CACHE_SIZE, embed_match_many=None):
+        self.command_map = command_map
+        self.embed_match = embed_match
+        self.embed_match_many = embed_match_many
+        self.fuzzy_min_score = fuzzy_min_score
+        self.fuzzy_min_margin = fuzzy_min_margin
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # normalized text -> (phrase, score, margin)
+        self.stats = {layer: {"hits": 0, "seconds": 0.0} for layer in LAYERS}
+        self.misses = 0
+        self.rebuild()
+
+    def rebuild(self):
+        """ (Re)indexes command_map; call after editing it. """
+        self.exact = {normalize_command_text(phrase): phrase for phrase in self.command_map}
+        self.phrase_tokens = {phrase: frozenset(normalize_command_text(phrase).split()) for phrase in self.command_map}
+        self.token_index = {}  # token -> phrases containing it
+        for phrase, tokens in self.phrase_tokens.items():
+            for token in tokens:
+                self.token_index.setdefault(token, []).append(phrase)
+        self.cache.clear()
+
+    def is_exact(self, text):
+        return normalize_command_text(text) in self.exact
+
+    def match(self, text):
+        """ Returns (phrase, score, margin, layer); phrase is None if no layer produced one. """
+        normalized = normalize_command_text(text)
+        answer, fuzzy = self._match_cheap(normalized)
+        if answer is not None:
+            return answer
+        if self.embed_match is None:
+            return self._miss(fuzzy)
+        start = time.perf_counter()
+        return self._hit("embedding", start, self._remember(normalized, self.embed_match(text)))
+
+    def match_many(self, texts):
+        """
+        match() for a list of texts, in order. The texts no cheaper layer answers are embedded
+        together: one embed_match_many() call (embed_match() per text without it), once per
+        distinct normalized text.
+        """
+        results, to_embed = [None] * len(texts), {}  # normalized -> (text, indices)
+        embed = self.embed_match_many or (self.embed_match and (lambda batch: [self.embed_match(t) for t in batch]))
+        for i, text in enumerate(texts):
+            normalized = normalize_command_text(text)
+            answer, fuzzy = self._match_cheap(normalized)
+            if answer is not None:
+                results[i] = answer
+            elif embed is None:
+                results[i] = self._miss(fuzzy)
+            else:
+                to_embed.setdefault(normalized, (text, []))[1].append(i)
+        if to_embed:
+            start = time.perf_counter()
+            embedded = embed([text for text, _ in to_embed.values()])
+            per_text = (time.perf_counter() - start) / len(to_embed)
+            for (normalized, (_, indices)), result in zip(to_embed.items(), embedded):
+                self._remember(normalized, result)
+                self.stats["embedding"]["hits"] += len(indices)
+                self.stats["embedding"]["seconds"] += per_text
+                for i in indices:
+                    results[i] = (*result, "embedding")
+        return results
+
+    def _match_cheap(self, normalized):
+        """ (answer from the exact, cache or fuzzy layer or None, the fuzzy result for a miss). """
+        start = time.perf_counter()
+        phrase = self.exact.get(normalized)
+        if phrase is not None:
+            return self._hit("exact", start, (phrase, 1.0, 1.0)), None
+
+        start = time.perf_counter()
+        if normalized in self.cache:
+            self.cache.move_to_end(normalized)
+            return self._hit("cache", start, self.cache[normalized]), None
+
+        start = time.perf_counter()
+        result = self.fuzzy_match(normalized)
+        if (result is not None and result[1] >= self.fuzzy_min_score and result[2] >= self.fuzzy_min_margin
+                and not self.state_conflict(normalized, result[0])):
+            return self._hit("fuzzy", start, self._remember(normalized, result)), None
+        return None, result
+
+    def state_conflict(self, normalized, phrase):
+        """ True if the text has a state word the phrase lacks, e.g. "turn on fan" vs "turn off fan". """
+        return any(token in STATE_WORDS and token not in self.phrase_tokens[phrase] for token in normalized.split())
+
+    def _miss(self, fuzzy):
+        self.misses += 1
+        return (*fuzzy, "fuzzy") if fuzzy is not None else (None, 0.0, 0.0, None)
+
+    def fuzzy_match(self, normalized):
+        """ Best (phrase, score, margin) among phrases sharing at least one token, or None. """
+        tokens = frozenset(normalized.split())
+        candidates = {phrase for token in tokens for phrase in self.token_index.get(token, ())}
+        if not candidates:
+            return None
+        scored = []
+        for phrase in candidates:
+            ratio = difflib.SequenceMatcher(None, normalized, normalize_command_text(phrase)).ratio()
+            scored.append((max(ratio, token_set_ratio(tokens, self.phrase_tokens[phrase])), phrase))
+        best_score, best_phrase = max(scored)
+        best_action = self.command_map[best_phrase]
+        runner_up = max((score for score, phrase in scored if self.command_map[phrase] != best_action), default=0.0)
+        return best_phrase, best_score, best_score - runner_up
+
+    def _remember(self, normalized, result):
+        self.cache[normalized] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    def _hit(self, layer, start, result):
+        self.stats[layer]["hits"] += 1
+        self.stats[layer]["seconds"] += time.perf_counter() - start
+        return (*result, layer)
+
+    def summary(self):
+        """ One-line per-layer hit rates and the estimated time saved vs embedding every text. """
+        total = sum(s["hits"] for s in self.stats.values()) + self.misses
+        if not total:
+            return "Matcher: no lookups yet."
+        embed = self.stats["embedding"]
+        embed_cost = embed["seconds"] / embed["hits"] if embed["hits"] else None
+        rates = ", ".join(f"{layer} {100 * s['hits'] / total:.0f}%" for layer, s in self.stats.items())
+        if embed_cost is None:
+            return f"Matcher hit rates: {rates} (no embedding calls yet to estimate savings)"
+        saved = sum(s["hits"] * embed_cost - s["seconds"] for layer, s in self.stats.items() if layer != "embedding")
+        return f"Matcher hit rates: {rates}; saved ~{saved * 1000:.1f} ms vs embedding every text"
@@ -0,0 +1,132 @@
+"""
+On-disk cache of command phrase embeddings, so a restart doesn't re-encode COMMAND_MAP.
+
+For each (model, revision) the cache holds a .npy matrix (memory-mapped on load) and a
+.json index listing the phrase for each row plus a hash of the whole phrase list. If the
+hash matches, the matrix is used as-is; otherwise rows for known phrases are reused and
+only new phrases are encoded, then the cache is rewritten for the current phrase list.
+
+The revision in the key is the commit hash of the model snapshot in use (resolve_revision),
+never a branch or tag, so an upstream model update gets a cache of its own. If it can't
+be resolved, phrases are encoded without the cache.
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+
+
+def phrases_hash(phrases):
+    return hashlib.sha256("\n".join(phrases).encode("utf-8")).hexdigest()
+
+
+COMMIT_HASH = re.compile(r"^[0-9a-f]{40}$")
+
+
+def resolve_revision(model_name, revision=None):
+    """
+    The commit hash of the locally cached Hugging Face snapshot of model_name at revision
+    (a branch, tag or commit; None is the default branch), or None if it can't be resolved
+    (no huggingface_hub, not downloaded yet). A local model directory resolves to a hash of
+    its files' names, sizes and modification times.
+    """
+    if revision and COMMIT_HASH.match(revision):
+        return revision
+    if os.path.isdir(model_name):
+        stamp = hashlib.sha256()
+        for root, _, files in sorted(os.walk(model_name)):
+            for name in sorted(files):
+                info = os.stat(os.path.join(root, name))
+                stamp.update(f"{os.path.relpath(os.path.join(root, name), model_name)}:{info.st_size}:{info.st_mtime_ns}\n".encode())
+        return "local-" + stamp.hexdigest()[:40]
+    try:
+        from huggingface_hub import snapshot_download
+    except ImportError:
+        return None
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"  # As SentenceTransformer resolves it
+    try:
+        snapshot = snapshot_download(repo_id, revision=revision, local_files_only=True)  # .../snapshots/<commit hash>
+    except Exception as e:
+        print(f"Could not resolve {repo_id}@{revision or 'default branch'} to a commit: {e}")
+        return None
+    commit = os.path.basename(os.path.normpath(snapshot))
+    return commit if COMMIT_HASH.match(commit) else None
+
+
+def cache_paths(cache_dir, model_name, revision):
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{model_name}@{revision}")
+    base = os.path.join(cache_dir, slug)
+    return base + ".npy", base + ".json"
+
+
+def load_or_encode(phrases, encode, model_name, revision=None, cache_dir=EMBEDDING_CACHE_DIR):
+    """
+    Returns (embeddings, stats) where embeddings is a float32 array with one row per
+    phrase (in order) and stats = {"cached": n, "encoded": n, "hit": bool}.
+    encode(list_of_phrases) must return a 2-D NumPy array. revision is resolved to a
+    commit hash first (resolve_revision); if that fails, every phrase is encoded and
+    nothing is cached.
+    """
+    if not phrases:
+        return np.empty((0, 0), dtype=np.float32), {"cached": 0, "encoded": 0, "hit": True}
+    commit = resolve_revision(model_name, revision)
+    if commit is None:
+        print(f"Not caching embeddings of {model_name}: its revision can't be resolved to a commit.")
+        return np.asarray(encode(list(phrases)), dtype=np.float32), {"cached": 0, "encoded": len(phrases), "hit": False}
+    npy_path, index_path = cache_paths(cache_dir, model_name, commit)
+    key = phrases_hash(phrases)
+    cached_rows, matrix = {}, None
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        matrix = np.load(npy_path, mmap_mode="r")
+        if index.get("hash") == key and matrix.shape[0] == len(phrases):
+            return matrix, {"cached": len(phrases), "encoded": 0, "hit": True}
+        cached_rows = {phrase: row for row, phrase in enumerate(index.get("phrases", []))}
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring unreadable embedding cache {npy_path}: {e}")
+
+    missing = [p for p in dict.fromkeys(phrases) if p not in cached_rows]
+    encoded = np.asarray(encode(missing), dtype=np.float32) if missing else None
+    dim = encoded.shape[1] if encoded is not None else matrix.shape[1]
+    if matrix is not None and matrix.shape[1] != dim:
+        # Model output changed shape under the same name/revision; start over
+        print(f"Embedding cache dimension changed ({matrix.shape[1]} -> {dim}). Re-encoding all phrases.")
+        del matrix
+        _discard(npy_path, index_path)
+        return load_or_encode(phrases, encode, model_name, commit, cache_dir)
+
+    new_rows = {phrase: i for i, phrase in enumerate(missing)}
+    result = np.empty((len(phrases), dim), dtype=np.float32)
+    for row, phrase in enumerate(phrases):
+        result[row] = encoded[new_rows[phrase]] if phrase in new_rows else matrix[cached_rows[phrase]]
+
+    _save(result, phrases, key, npy_path, index_path)
+    return result, {"cached": len(phrases) - len(missing), "encoded": len(missing), "hit": False}
+
+
+def _save(matrix, phrases, key, npy_path, index_path):
+    """ Writes matrix and index atomically (temp file + rename) so a crash never leaves a torn cache. """
+    os.makedirs(os.path.dirname(npy_path) or ".", exist_ok=True)
+    try:
+        with open(npy_path + ".tmp", "wb") as f:
+            np.save(f, matrix)
+        os.replace(npy_path + ".tmp", npy_path)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"hash": key, "phrases": list(phrases)}, f)
+        os.replace(index_path + ".tmp", index_path)
+    except OSError as e:
+        print(f"Could not write embedding cache {npy_path}: {e}")  # Not fatal; we just re-encode next time
+
+
+def _discard(npy_path, index_path):
+    for path in (npy_path, index_path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,20 +1,8 @@
-import requests
-import json
+import om2m
 
-OM2M_URL = "http://localhost:8080/~/in-cse/in-name/fan"
+client = om2m.OM2MClient(om2m.cse_url())
 
-headers = {
-    "X-M2M-Origin": "admin:admin",
-    "Content-Type": "application/vnd.onem2m-res+json;ty=4"  # Content Instance
-}
-
-payload = {
-    "m2m:cin": {
-        "con": "2"  # Change this to "1", "2", "3", or "OFF"
-    }
-}
-
-response = requests.post(OM2M_URL, headers=headers, data=json.dumps(payload))
+response = client.create_content_instance("fan", "2")  # Change this to "1", "2", "3", or "OFF"
 
 print(f"Status Code: {response.status_code}")
 print("Response:", response.text)
@@ -0,0 +1,97 @@
+"""
+Routing table for one voice server serving many homes.
+
+Each home has its own CSE (or its own AE on a shared CSE), an audio container the ESP
+main node uploads to, and device containers (led, solenoid, fan) to actuate. A Home
+keeps its own pooled om2m.OM2MClient, so a slow or unreachable home only ties up its
+own connections. The routing table maps an audio source to its home: notifications
+are posted to {NOTIFICATION_URL}/{home name}, and polls know which home they fetched.
+
+    {"homes": [
+        {"name": "flat_12", "cse": "http://10.0.12.2:8080"},
+        {"name": "flat_14", "cse": "http://10.0.1.2:8080", "audio": "flat_14/audio_upload",
+         "devices": {"led": "flat_14/led", "fan": "flat_14/fan", "solenoid": "flat_14/solenoid"}}]}
+
+Paths are resolved by om2m.OM2MClient.url(): relative to the home's CSE name
+("voice_command/audio_upload"), CSE-relative ("/~/in-cse/...") or full URLs.
+"""
+import json
+from collections import OrderedDict
+
+import om2m
+
+AUDIO_CONTAINER = "voice_command/audio_upload"
+DEVICE_CONTAINERS = {'led': 'led', 'solenoid': 'solenoid', 'fan': 'fan'}
+POOL_SIZE = 4  # Connections per home: intake, its subscription and its actuation workers
+
+
+class Home:
+    """ One home: its CSE client, audio container and device containers. """
+
+    def __init__(self, name, cse, audio=AUDIO_CONTAINER, devices=None, pool_size=POOL_SIZE, auth=None):
+        self.name = name
+        self.client = om2m.OM2MClient(cse, pool_size=pool_size, auth=auth)
+        self.cse = self.client.cse
+        self.audio_url = self.client.url(audio)
+        self.devices = {**DEVICE_CONTAINERS, **(devices or {})}
+        # Per-home pipeline state, set up by the service serving the home (voiceprocess.setup_home)
+        self.assembler = None
+        self.actuator = None
+        self.actuation_stage = None
+        self.entry_queue = None
+        self.intake_primed = False
+
+    def device_url(self, device):
+        return self.client.url(self.devices[device])
+
+    def __repr__(self):
+        return f"Home({self.name!r}, {self.cse})"
+
+
+class RoutingTable:
+    """ Homes by name, in configuration order. The first home also takes unrouted sources. """
+
+    def __init__(self, homes):
+        self.homes = OrderedDict()
+        for home in homes:
+            if home.name in self.homes:
+                raise ValueError(f"Duplicate home name {home.name!r}")
+            if '/' in home.name:
+                raise ValueError(f"Home name {home.name!r} must not contain '/'")
+            self.homes[home.name] = home
+        if not self.homes:
+            raise ValueError("The routing table needs at least one home")
+
+    def route(self, source=None, base_path=None):
+        """
+        The home of an audio source: a home name, or a notification path ending in one
+        ({base_path}/flat_12). None, '' or base_path itself (the path of NOTIFICATION_URL,
+        which single-home subscriptions notify) goes to the first home. Returns None for an
+        unknown name.
+        """
+        source = (source or "").partition('?')[0].rstrip('/')
+        if not source or source == (base_path or "").rstrip('/'):
+            return next(iter(self.homes.values()))
+        return self.homes.get(source.rpartition('/')[2])
+
+    def __getitem__(self, name):
+        return self.homes[name]
+
+    def __iter__(self):
+        return iter(self.homes.values())
+
+    def __len__(self):
+        return len(self.homes)
+
+    def close(self):
+        for home in self:
+            home.client.close()
+
+
+def load_homes(path, pool_size=POOL_SIZE, auth=None):
+    """ A RoutingTable from a JSON file ({"homes": [{"name", "cse", "audio"?, "devices"?}, ...]}). """
+    with open(path) as f:
+        spec = json.load(f)
+    entries = spec['homes'] if isinstance(spec, dict) else spec
+    return RoutingTable([Home(entry['name'], entry['cse'], entry.get('audio', AUDIO_CONTAINER), entry.get('devices'),
+                              pool_size=pool_size, auth=auth) for entry in entries])
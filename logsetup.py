@@ -0,0 +1,134 @@
+"""
+Structured logging for the services: JSON lines written by a background thread, with
+repeated messages rate limited.
+
+configure_logging() puts a QueueHandler on the root logger, so a log call in a hot loop
+only builds the LogRecord and appends it to a queue; formatting (merging %-style args,
+JSON encoding) and the write happen on the listener thread. Use lazy %-style calls,
+logger.info("Stored %d entries", n), so nothing is formatted for records that are
+filtered out. Fields passed with extra={...} become JSON keys.
+
+RateLimitFilter keeps one token bucket per message: the logger, level, format string
+and the record's 'source' and 'home' fields, if it has them, so one noisy source or
+home does not silence the same message from the others. Records at ERROR and above are
+never limited. The least recently used buckets are evicted past RATE_LIMIT_MAX_BUCKETS,
+so messages that are not %-style (a new format string per call) can't grow it forever. When a message is let through again,
+its record carries 'suppressed', the number of copies dropped since the last one.
+If the queue is full, records are dropped and counted rather than blocking the caller.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+LOG_QUEUE_SIZE = 10000
+RATE_LIMIT_BURST = 5  # Copies of one message let through back to back
+RATE_LIMIT_PER_SECOND = 0.2  # Then one every 5 s
+RATE_LIMIT_MAX_BUCKETS = 1024  # Distinct messages tracked; least recently used forgotten first
+NEVER_LIMITED_LEVEL = logging.ERROR  # Errors (e.g. MongoDB outages) always get through
+
+# LogRecord attributes that are not user fields passed in extra
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "suppressed"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per record: ts, level, logger, msg, extra fields, suppressed and exc. """
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """ Token bucket per message (see the module docstring). """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, per_second=RATE_LIMIT_PER_SECOND, clock=time.monotonic,
+                 max_buckets=RATE_LIMIT_MAX_BUCKETS):
+        super().__init__()
+        self.burst = burst
+        self.per_second = per_second
+        self.clock = clock
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> [tokens, last refill, suppressed], least recently used first
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= NEVER_LIMITED_LEVEL:
+            return True
+        key = (record.name, record.levelno, record.msg, getattr(record, "source", None), getattr(record, "home", None))
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without formatting them (the listener thread does that) and drops
+    them, counting, when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=logging.INFO, stream=None, json_lines=True, rate_limit=True, queue_size=LOG_QUEUE_SIZE):
+    """
+    Replaces the root logger's handlers with a queue handler feeding a background
+    listener that writes to stream (stderr by default). Returns the QueueListener;
+    stop() it to flush on exit.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_lines else
+                         logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_queue = queue.Queue(queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter())
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,246 @@
+"""
+Counters, gauges and histograms exposed in the Prometheus text format over HTTP /metrics.
+
+Shared by mong.py and voiceprocess.py. Metrics register themselves in REGISTRY when
+created (at import time), labelled children are created on first use, and an
+observation is a dict lookup plus a short locked update, so instrumenting hot paths
+costs microseconds. start_http_server() serves REGISTRY from a daemon thread.
+Worker processes have their own REGISTRY: they drain() it and the parent merge()s the
+result, so e.g. Whisper timings from the ASR pool show up on the parent's /metrics.
+"""
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; from 1 ms (NLU cache hits) to 60 s (large-v3 on CPU)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+
+    def exposition(self):
+        """ All metrics in the Prometheus text format. """
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.exposition())
+        return "\n".join(lines) + "\n"
+
+    def drain(self):
+        """ Counter and histogram state since the last drain, reset to zero; picklable. """
+        return {name: metric.drain() for name, metric in self.metrics.items() if hasattr(metric, "drain")}
+
+    def merge(self, drained):
+        """ Adds the state drain()ed from another process' registry. Unknown metrics are ignored. """
+        for name, children in drained.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(children)
+
+
+REGISTRY = Registry()
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """ The child for these label values (in labelnames order), created on first use. """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._new_child())
+                self._children[values] = child
+        return child
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def _samples(self):
+        """ (label values, child) once per child; labels() may have cached it under several keys. """
+        seen = {}
+        for values, child in list(self._children.items()):
+            seen.setdefault(id(child), (tuple(str(v) for v in values), child))
+        return sorted(seen.values(), key=lambda item: item[0])
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._samples():
+            lines.extend(self._child_lines(values, child))
+        return lines
+
+    def drain(self):
+        return {values: child.drain() for values, child in self._samples()}
+
+    def merge(self, children):
+        for values, state in children.items():
+            self.labels(*values).merge(state)
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def drain(self):
+        with self._lock:
+            value, self.value = self.value, 0
+        return value
+
+    def merge(self, value):
+        self.inc(value)
+
+
+class Counter(_Metric):
+    """ A monotonically increasing count. """
+    kind = "counter"
+    _new_child = _CounterChild
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def _child_lines(self, values, child):
+        return [f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"]
+
+
+class Gauge:
+    """ A value read when scraped: set() it, or pass fn to compute it at scrape time. No labels. """
+
+    def __init__(self, name, help_text, fn=None, registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0
+        if registry is not None:
+            registry.register(self)
+
+    def set(self, value):
+        self.value = value
+
+    def exposition(self):
+        try:
+            value = self.fn() if self.fn is not None else self.value
+        except Exception:
+            value = math.nan  # A broken callback must not break the scrape
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {format_value(value)}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot: above the largest bucket
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def drain(self):
+        with self._lock:
+            state = (self.counts, self.sum)
+            self.counts, self.sum = [0] * (len(self.buckets) + 1), 0.0
+        return state
+
+    def merge(self, state):
+        counts, total = state
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.sum += total
+
+
+class Histogram(_Metric):
+    """ Counts observations into cumulative buckets (upper bounds, inclusive). """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def _child_lines(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = format_labels(self.labelnames, values, [("le", format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def log_message(self, format, *args):
+        pass  # One line per scrape is noise
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port, host="0.0.0.0", registry=REGISTRY):
+    """ Serves registry on http://host:port/metrics from a daemon thread. Returns the server. """
+    handler = type("BoundMetricsHandler", (MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
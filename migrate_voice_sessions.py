@@ -0,0 +1,94 @@
+"""
+Migrates stored voice_audio chunk documents to one document per session.
+
+Reads the AUDIO_START/CHUNK/END documents of --source from the readings collection (or
+from a mongoexport JSON file with --json), reassembles the sessions and stores each one
+with mong.store_voice_session. Chunk documents are only deleted with --delete-chunks,
+and only for sessions that were stored; incomplete sessions are left as they are.
+Prints the BSON size of the chunk documents and of the session documents replacing them.
+
+    python migrate_voice_sessions.py --json MongoDB_readingsdata.json --dry-run
+    python migrate_voice_sessions.py --dry-run
+    python migrate_voice_sessions.py --delete-chunks
+"""
+import argparse
+
+import bson
+from bson import Binary, json_util
+from pymongo import MongoClient
+
+import mong
+from audiosession import SessionAssembler
+
+BATCH_SIZE = 1000
+
+
+def read_chunk_documents(args, collection):
+    """ Yields the source's documents in creation order. """
+    if args.json:
+        with open(args.json) as f:
+            documents = json_util.loads(f.read())
+        documents = [d for d in documents if d.get('source_name') == args.source]
+        yield from sorted(documents, key=lambda d: (d.get('ct') or '', d.get('ri') or ''))
+    else:
+        yield from collection.find({'source_name': args.source}).sort([('ct', 1), ('_id', 1)]).batch_size(BATCH_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uri", default=mong.MONGO_URI)
+    parser.add_argument("--db", default=mong.MONGO_DB_NAME)
+    parser.add_argument("--collection", default=mong.MONGO_COLLECTION_NAME)
+    parser.add_argument("--source", default="voice_audio")
+    parser.add_argument("--json", help="Read chunk documents from a mongoexport JSON array instead of the collection")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated")
+    parser.add_argument("--delete-chunks", action="store_true", help="Delete chunk documents of migrated sessions")
+    args = parser.parse_args()
+
+    db = None if args.json and args.dry_run else MongoClient(args.uri)[args.db]
+    collection = db[args.collection] if db is not None else None
+    voice_store = mong.get_voice_store(db) if db is not None and not args.dry_run else None
+
+    completed = []
+    assembler = SessionAssembler(on_complete=lambda sid, data: completed.append((sid, data)), ttl=float('inf'))
+    chunk_sizes = {}  # ri -> BSON size of the chunk document
+    batch = []
+    for document in read_chunk_documents(args, collection):
+        chunk_sizes[document.get('ri')] = len(bson.encode(document))
+        batch.append(document)
+        if len(batch) >= BATCH_SIZE:
+            assembler.ingest(batch)
+            batch = []
+    assembler.ingest(batch)
+
+    migrated_ris, session_bytes, failed = [], 0, 0
+    for session_id, session_data in completed:
+        built = mong.build_voice_session(session_id, session_data, args.source)
+        if built is None:
+            print(f"Session {session_id} does not assemble into a WAV; its chunks are left in place.")
+            failed += 1
+            continue
+        document, wav = built
+        session_bytes += len(bson.encode({**document, 'audio': Binary(wav)}))
+        if voice_store is not None:
+            if not mong.store_voice_session(*voice_store, session_id, session_data, args.source):
+                failed += 1
+                continue
+        migrated_ris.extend(session_data['ris'])
+
+    stored = len(completed) - failed
+    replaced_bytes = sum(chunk_sizes.get(ri, 0) for ri in migrated_ris)
+    print(f"{len(chunk_sizes)} {args.source} chunk documents ({sum(chunk_sizes.values()) / 1024:.1f} KiB BSON)")
+    print(f"{stored} sessions {'would be ' if args.dry_run else ''}stored, {failed} failed, "
+          f"{assembler.pending_sessions} incomplete sessions left as chunks")
+    if stored:
+        print(f"{len(migrated_ris)} chunk documents ({replaced_bytes / 1024:.1f} KiB) -> {stored} session documents "
+              f"({session_bytes / 1024:.1f} KiB), {100 * (1 - session_bytes / replaced_bytes):.0f}% smaller")
+
+    if args.delete_chunks and not args.dry_run and migrated_ris:
+        result = collection.delete_many({'ri': {'$in': migrated_ris}})
+        print(f"Deleted {result.deleted_count} chunk documents.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,57 @@
 import requests
 import json
+import random
+import threading
 import time
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from datetime import datetime
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+from bson import Binary
+import gridfs
+import itertools
 import logging
-
-# Configure logging
+import logsetup
+import metrics
+import om2m
+from audiosession import SessionAssembler, assemble_wav_buffer, parse_wav_header
+from pipeline import LatencyTracker
+from spool import Spool, SPOOL_MAX_BYTES
+
+# Configure logging (main() switches to logsetup's queued JSON lines)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
 AUTH_CREDENTIALS = ("admin", "admin")
-HEADERS = {
-    "X-M2M-Origin": "admin:admin",
-    "Accept": "application/json"
-}
 
 # MongoDB config
 MONGO_URI = "mongodb://localhost:27017/" # Default MongoDB URI
 MONGO_DB_NAME = "om2m_data"         # Database name in MongoDB
 MONGO_COLLECTION_NAME = "sensor_readings" # Collection name to store all sensor data
+MONGO_STATE_COLLECTION_NAME = "ingest_state" # Per-source watermark (last stored ct/ri)
+MONGO_VOICE_COLLECTION_NAME = "voice_sessions" # One document per reassembled voice recording
+MONGO_TIMESERIES_COLLECTION_NAME = "sensor_timeseries" # Typed readings (numbers, datetime) of parsed sources
+MONGO_TIMEOUT_MS = 3000  # Server selection timeout: an unreachable MongoDB fails fast (into the spool)
+MONGO_SOCKET_TIMEOUT_MS = 10000  # A write slower than this counts as MongoDB being unavailable
+
+# While MongoDB is unreachable, new entries go to a local SQLite spool (spool.py) and a
+# drainer thread replays them in bulk once it is back. None disables the spool.
+SPOOL_PATH = "ingest_spool.sqlite3"
+SPOOL_DRAIN_INTERVAL = 5  # Seconds between drain attempts while MongoDB is down
+SPOOL_DRAIN_BATCH = 200  # Spooled records replayed per step
+METRICS_PORT = 9101  # Prometheus /metrics endpoint (None disables it)
+READ_API_PORT = 9103  # Dashboard read API (readapi.py), served from this process so new data invalidates its cache; None disables it
+LOG_JSON = True  # Log JSON lines from a background writer, rate limited (logsetup.py); False for plain text
+
+# Voice audio: instead of one base64 document per AUDIO_START/CHUNK/END instance, each
+# completed session is stored once as raw WAV bytes with its format metadata.
+VOICE_SESSION_SOURCES = {'voice_audio'}  # Empty set = store voice chunks like any other source
+VOICE_GRIDFS_BUCKET = "voice_audio"
+VOICE_GRIDFS_THRESHOLD = 8 * 1024 * 1024  # Larger recordings go to GridFS (BSON documents max out at 16 MB)
 
 # Define the list of data sources to monitor
 # Add more dictionaries to this list for each sensor/data source you have
 # Use ?rcn=4 for latest N entries, use /la for the single latest entry
+# Optional per-source keys 'interval', 'timeout' and 'jitter' override the defaults below
 OM2M_DATA_SOURCES = [
     {
         'name': 'voice_audio',
@@ -46,52 +75,158 @@ OM2M_DATA_SOURCES = [
 
 # Fetch interval in seconds
 FETCH_INTERVAL = 4
+FETCH_TIMEOUT = 5  # Seconds before a fetch is abandoned, so a hung endpoint can't stall its source
+FETCH_RETRIES = 1  # Retries of a fetch that failed to connect (or got 502/503/504); the next cycle retries anyway
+FETCH_JITTER = 0.1  # Each wait is FETCH_INTERVAL +/- this fraction, so sources don't fetch in lockstep
+STATS_INTERVAL = 60  # Seconds between per-source cycle time summaries
+# Ask the CSE for the delta only (oneM2M filter criteria cra/lim) on ?rcn=4 sources that
+# have a watermark. Entries at or below the watermark are skipped client-side either way.
+USE_FILTER_CRITERIA = True
+FETCH_LIMIT = 100  # lim: most content instances returned per filtered fetch; a full page is followed by the next
+OM2M_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+# Per-source cycle times (fetch + parse + store), for the periodic summary
+source_cycle_times = {}
+# source name -> {'ct': latest stored creation time, 'ris': ri's stored with that ct}
+source_watermarks = {}
+unread_watermarks = set()  # Sources whose stored watermark could not be read yet (MongoDB down)
+# source name -> SessionAssembler holding partial voice sessions between cycles
+voice_assemblers = {}
+voice_store = None  # (voice session collection, GridFS bucket), see get_voice_store
+timeseries_collection = None  # Set by prepare_database() when the time-series collection is available
+database_ready = False  # prepare_database() has run; until then every store retries it (ensure_database)
+database_lock = threading.Lock()
+ingest_spool = None  # Spool, set by main() when SPOOL_PATH is set
+read_cache = None  # readapi.ReadCache, set by main() when READ_API_PORT is set
+
+# --- Metrics (served on METRICS_PORT) ---
+fetch_seconds = metrics.Histogram("om2m_fetch_seconds", "OM2M fetch latency per source.", ["source"])
+fetch_errors = metrics.Counter("om2m_fetch_errors_total", "Fetches that returned no data.", ["source"])
+cycle_seconds = metrics.Histogram("ingest_cycle_seconds", "Fetch, parse and store time per source cycle.", ["source"])
+cycle_entries = metrics.Histogram("ingest_cycle_entries", "New entries per fetch cycle.", ["source"], buckets=metrics.COUNT_BUCKETS)
+stored_entries = metrics.Counter("ingest_entries_total", "Entries by storage outcome.", ["source", "outcome"])
+db_write_seconds = metrics.Histogram("mongo_write_seconds", "MongoDB write latency.", ["source", "kind"])
+metrics.Gauge("ingest_spool_records", "Records waiting in the local spool.",
+              fn=lambda: ingest_spool.pending() if ingest_spool is not None else 0)
+metrics.Gauge("ingest_spool_bytes", "Payload bytes waiting in the local spool.",
+              fn=lambda: ingest_spool.size_bytes if ingest_spool is not None else 0)
+
+# --- Content Parsers ---
+# source name -> parser(con) returning a dict of typed fields, registered with @content_parser.
+# Readings of these sources also go to the time-series collection.
+CONTENT_PARSERS = {}
+
+def content_parser(source_name):
+    def register(parser):
+        CONTENT_PARSERS[source_name] = parser
+        return parser
+    return register
+
+@content_parser('gas_sensor')
+def parse_gas_reading(con):
+    """ "433" -> {'gas_level': 433.0} (raw ADC reading of the gas sensor). """
+    return {'gas_level': float(con)}
+
+@content_parser('fall_sensor')
+def parse_fall_event(con):
+    """ "FALL_DETECTED: accel=14623.70" -> {'event': 'FALL_DETECTED', 'fall': True, 'accel': 14623.7}. """
+    event, _, fields = str(con).partition(':')
+    parsed = {'event': event.strip(), 'fall': event.strip() == 'FALL_DETECTED'}
+    for item in fields.split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            parsed[key.strip()] = float(value)
+    return parsed
+
+def parse_content(source_name, con, resource_id=None):
+    """ Typed fields of con from the source's registered parser, or None (no parser / unparsable). """
+    parser = CONTENT_PARSERS.get(source_name)
+    if parser is None or con is None:
+        return None
+    try:
+        return parser(con)
+    except (TypeError, ValueError) as parse_error:
+        logging.warning("Failed to parse 'con' for %s ri %s: %s", source_name, resource_id, parse_error, extra={'source': source_name})
+        return None
+
+def parse_om2m_time(ct):
+    """ OM2M ct ("20250410T152836") -> datetime, or None. Naive CSE time; BSON stores it as UTC. """
+    try:
+        return datetime.strptime(ct[:15], OM2M_TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
 
 # --- Database Connection ---
 def get_mongo_collection():
-    """ Establishes MongoDB connection and returns the collection object. """
+    """
+    Establishes MongoDB connection and returns the collection object. If MongoDB is
+    unreachable and the spool is enabled, the collection is returned anyway: entries are
+    spooled until it comes up.
+    """
     try:
-        client = MongoClient(MONGO_URI)
-        # The ismaster command is cheap and does not require auth.
-        client.admin.command('ismaster')
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS, socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS)
         db = client[MONGO_DB_NAME]
         collection = db[MONGO_COLLECTION_NAME]
-        logging.info(f"Connected to MongoDB: Database '{MONGO_DB_NAME}', Collection '{MONGO_COLLECTION_NAME}'")
-        # Ensure an index on 'ri' for faster lookups/updates and uniqueness
-        collection.create_index('ri', unique=True)
-        logging.info("Ensured unique index on 'ri' field.")
+        # The ismaster command is cheap and does not require auth.
+        client.admin.command('ismaster')
+        logging.info("Connected to MongoDB: Database '%s', Collection '%s'", MONGO_DB_NAME, MONGO_COLLECTION_NAME)
+        prepare_database(collection)
         return collection
     except ConnectionFailure as e:
-        logging.error(f"Could not connect to MongoDB: {e}")
+        logging.error("Could not connect to MongoDB: %s", e)
+        if SPOOL_PATH:
+            logging.warning("Spooling entries to %s until MongoDB is reachable at %s.", SPOOL_PATH, MONGO_URI)
+            return collection
         logging.error("Please ensure MongoDB server is running and accessible at " + MONGO_URI)
         return None
     except OperationFailure as e:
-         logging.error(f"MongoDB operation failed (e.g., index creation): {e}")
+         logging.error("MongoDB operation failed (e.g., index creation): %s", e)
          return None
     except Exception as e:
-        logging.error(f"An unexpected error occurred during MongoDB connection: {e}")
+        logging.error("An unexpected error occurred during MongoDB connection: %s", e)
         return None
 
+def prepare_database(collection):
+    """ Creates the indexes and the time-series collection. Raises ConnectionFailure if MongoDB is down. """
+    global timeseries_collection, database_ready
+    # Ensure an index on 'ri' for faster lookups/updates and uniqueness
+    collection.create_index('ri', unique=True)
+    # Latest reading and time ranges per source, for the read API
+    collection.create_index([('source_name', 1), ('ct', 1)])
+    logging.info("Ensured unique index on 'ri' field and index on (source_name, ct).")
+    timeseries_collection = get_timeseries_collection(collection.database)
+    database_ready = True
+
+def ensure_database(collection):
+    """ Runs prepare_database() if it hasn't succeeded yet (MongoDB was down at startup). Raises ConnectionFailure. """
+    if database_ready:
+        return
+    with database_lock:
+        if not database_ready:
+            prepare_database(collection)
+
 # --- OM2M Fetching and Parsing Functions ---
 
-def fetch_om2m_data(url):
-    """ Fetches data from a specific OM2M URL. """
-    logging.info(f"Fetching data from: {url}")
+def create_http_session(pool_size):
+    """ A keep-alive OM2M client shared by all source pollers, with one pooled connection per source. """
+    return om2m.OM2MClient(timeout=FETCH_TIMEOUT, retries=FETCH_RETRIES, pool_size=pool_size, auth=AUTH_CREDENTIALS)
+
+def fetch_om2m_data(url, session=None, timeout=FETCH_TIMEOUT):
+    """ Fetches data from a specific OM2M URL (through session, an om2m.OM2MClient, if given). """
+    logging.debug("Fetching data from: %s", url)
     try:
-        response = requests.get(url, auth=AUTH_CREDENTIALS, headers=HEADERS)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
-        logging.info(f"Successfully fetched data from {url}")
+        data = (session or om2m.default_client()).get(url, timeout=timeout)  # Raises HTTPError on 4xx/5xx
+        logging.debug("Successfully fetched data from %s", url)
         return data
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching data from OM2M URL {url}: {e}")
+        logging.error("Error fetching data from OM2M URL %s: %s", url, e, extra={'url': url})
         return None # Return None on error
     except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON response from OM2M URL {url}: {e}")
+        logging.error("Error decoding JSON response from OM2M URL %s: %s", url, e, extra={'url': url})
         # logging.debug(f"Response text: {response.text[:500]}...") # Log part of the response
         return None
     except Exception as e:
-        logging.error(f"An unexpected error occurred during fetching from URL {url}: {e}")
+        logging.error("An unexpected error occurred during fetching from URL %s: %s", url, e, extra={'url': url})
         return None
 
 def extract_entries_from_response(data):
@@ -134,128 +269,576 @@ def extract_entries_from_response(data):
 
 
 # --- Data Storage Logic ---
+def build_document(entry, source_name):
+    """ The fields of a content instance that are stored, plus the source it came from. """
+    # Note: The structure of 'con' will vary by sensor type.
+    data_to_store = {
+        'ri': entry.get('ri'),
+        'source_name': source_name, # <-- Add the source name here
+        'rn': entry.get('rn'), # Resource Name (optional)
+        'ct': entry.get('ct'), # Creation Time
+        'lt': entry.get('lt'), # Last Modified Time
+        'st': entry.get('st'), # State Tag (useful for tracking changes)
+        'cs': entry.get('cs'), # Content Size (optional)
+        'con': entry.get('con'),# Content (the actual data, e.g., base64 audio, sensor value)
+        # Add other standard CIN fields if needed, e.g., 'pi' (Parent ID)
+        'pi': entry.get('pi')
+    }
+
+    # Parse the 'con' field with the source's registered parser, if it has one
+    parsed = parse_content(source_name, data_to_store['con'], data_to_store['ri'])
+    if parsed is not None:
+        data_to_store['parsed_content'] = parsed
+    return data_to_store
+
 def store_or_update_entries(collection, entries, source_name):
-    """ Stores or updates fetched entries in MongoDB, adding source info. """
+    """
+    Stores or updates fetched entries in MongoDB, adding source info. All entries of one
+    source go out as a single unordered bulk_write of upserts, so a document that fails
+    does not stop the others. Returns a dict of inserted/updated/up_to_date/errors counts. Raises ConnectionFailure
+    if MongoDB is unreachable.
+    """
+    counts = {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
     if not entries:
-        logging.info(f"No new entries found to process for source: {source_name}.")
-        return
-
-    logging.info(f"Processing {len(entries)} entries for storage from source: {source_name}...")
-    inserted_count = 0
-    updated_count = 0
-    up_to_date_count = 0
-    error_count = 0
+        logging.info("No new entries found to process for source: %s.", source_name, extra={'source': source_name})
+        return counts
 
+    logging.debug("Processing %d entries for storage from source: %s...", len(entries), source_name)
+    documents = {}  # ri -> document; a repeated ri keeps its last version
     for entry in entries:
         # Ensure 'ri' exists, as it's our unique identifier
         if 'ri' not in entry:
-            logging.warning(f"Skipping entry without 'ri' from source {source_name}: {entry}")
-            error_count += 1
+            logging.warning("Skipping entry without 'ri' from source %s: %s", source_name, entry, extra={'source': source_name})
+            counts['errors'] += 1
             continue
+        documents[entry['ri']] = build_document(entry, source_name)
+
+    if not documents:
+        return counts
+    resource_ids = list(documents)
+    # Filter on ri, $set the fields, insert if no matching document is found
+    operations = [UpdateOne({'ri': ri}, {'$set': doc}, upsert=True) for ri, doc in documents.items()]
+
+    try:
+        start_time = time.perf_counter()
+        result = collection.bulk_write(operations, ordered=False)
+        db_write_seconds.labels(source_name, "bulk_write").observe(time.perf_counter() - start_time)
+        summary = result.bulk_api_result
+    except BulkWriteError as e:
+        # Unordered: every operation was attempted; only the listed ones failed
+        summary = e.details
+        for error in summary.get('writeErrors', []):
+            logging.error("MongoDB operation failed for ri %s from %s: %s", resource_ids[error['index']], source_name,
+                          error.get('errmsg'), extra={'source': source_name})
+        counts['errors'] += len(summary.get('writeErrors', []))
+    except ConnectionFailure:
+        raise  # MongoDB is unreachable: the caller spools the entries
+    except OperationFailure as e:
+        logging.error("MongoDB bulk write failed for %d entries from %s: %s", len(operations), source_name, e, extra={'source': source_name})
+        counts['errors'] += len(operations)
+        return counts
+    except Exception as e:
+        logging.error("An unexpected error occurred storing %d entries from %s: %s", len(operations), source_name, e,
+                      extra={'source': source_name})
+        counts['errors'] += len(operations)
+        return counts
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for upserted in summary.get('upserted', []):
+            logging.debug("Inserted new document with ri: %s from %s", resource_ids[upserted['index']], source_name)
+    counts['inserted'] = summary.get('nUpserted', 0)
+    counts['updated'] = summary.get('nModified', 0)
+    counts['up_to_date'] = summary.get('nMatched', 0) - counts['updated']
+
+    logging.info("Finished storing entries for %s: Inserted %d, Updated %d, Up-to-date %d, Errors %d", source_name,
+                 counts['inserted'], counts['updated'], counts['up_to_date'], counts['errors'], extra={'source': source_name, **counts})
+    return counts
+
+
+# --- Typed Time-Series Storage ---
+def get_timeseries_collection(db):
+    """
+    The typed readings collection: a time-series collection (timeField 'timestamp',
+    metaField 'source_name'), created if missing. None if the server can't (MongoDB < 5.0).
+    """
+    try:
+        if MONGO_TIMESERIES_COLLECTION_NAME not in db.list_collection_names():
+            db.create_collection(MONGO_TIMESERIES_COLLECTION_NAME, timeseries={
+                'timeField': 'timestamp', 'metaField': 'source_name', 'granularity': 'seconds'})
+            logging.info("Created time-series collection '%s'.", MONGO_TIMESERIES_COLLECTION_NAME)
+        collection = db[MONGO_TIMESERIES_COLLECTION_NAME]
+        # Per-source time range scans, and lookups of a reading by its content instance
+        collection.create_index([('source_name', 1), ('timestamp', 1)])
+        collection.create_index('ri')
+        return collection
+    except OperationFailure as e:
+        logging.error("Time-series collection unavailable (needs MongoDB 5.0+): %s", e)
+        return None
 
-        resource_id = entry['ri']
-
-        # Decide what fields to store. Add the source_name.
-        # Note: The structure of 'con' will vary by sensor type.
-        data_to_store = {
-            'ri': entry.get('ri'),
-            'source_name': source_name, # <-- Add the source name here
-            'rn': entry.get('rn'), # Resource Name (optional)
-            'ct': entry.get('ct'), # Creation Time
-            'lt': entry.get('lt'), # Last Modified Time
-            'st': entry.get('st'), # State Tag (useful for tracking changes)
-            'cs': entry.get('cs'), # Content Size (optional)
-            'con': entry.get('con'),# Content (the actual data, e.g., base64 audio, sensor value)
-            # Add other standard CIN fields if needed, e.g., 'pi' (Parent ID)
-            'pi': entry.get('pi')
-        }
-
-        # Optional: You might want to add logic here to parse the 'con' field
-        # based on the 'source_name' if the data format in 'con' is structured.
-        # Example:
-        # if source_name == 'gas_sensor' and isinstance(data_to_store['con'], str):
-        #     try:
-        #         gas_values = {}
-        #         # Assuming 'con' is like "CO:100,CH4:50"
-        #         for item in data_to_store['con'].split(','):
-        #              key, val = item.split(':')
-        #              gas_values[key.strip()] = float(val.strip())
-        #         data_to_store['parsed_content'] = gas_values
-        #     except Exception as parse_error:
-        #         logging.warning(f"Failed to parse 'con' for {source_name} ri {resource_id}: {parse_error}")
+def build_reading(entry, source_name):
+    """ Time-series document for a content instance, or None if its con or ct doesn't parse. """
+    parsed = parse_content(source_name, entry.get('con'), entry.get('ri'))
+    timestamp = parse_om2m_time(entry.get('ct'))
+    if parsed is None or timestamp is None:
+        return None
+    return {'timestamp': timestamp, 'source_name': source_name, 'ri': entry.get('ri'), **parsed}
 
+def store_readings(ts_collection, entries, source_name):
+    """
+    Inserts typed readings for entries that don't have one yet. Time-series collections
+    are insert-only, and the same entries come back after a partly failed store (the
+    watermark stays put), from the spool or after a lost watermark, so the ri's already
+    in the collection are skipped. Returns the count.
+    """
+    readings = {r['ri']: r for r in (build_reading(entry, source_name) for entry in entries) if r is not None}
+    if not readings:
+        return 0
+    try:
+        start_time = time.perf_counter()
+        for existing in ts_collection.find({'source_name': source_name, 'ri': {'$in': list(readings)}}, {'ri': 1, '_id': 0}):
+            readings.pop(existing['ri'], None)
+        if not readings:
+            return 0
+        readings = list(readings.values())
+        inserted = len(ts_collection.insert_many(readings, ordered=False).inserted_ids)
+        db_write_seconds.labels(source_name, "timeseries").observe(time.perf_counter() - start_time)
+        return inserted
+    except BulkWriteError as e:
+        logging.error("%d of %d readings from %s failed to insert.", len(e.details.get('writeErrors', [])), len(readings), source_name,
+                      extra={'source': source_name})
+        return e.details.get('nInserted', 0)
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        logging.error("Failed to insert %d readings from %s: %s", len(readings), source_name, e, extra={'source': source_name})
+        return 0
+
+# --- Voice Session Storage ---
+def get_voice_store(db):
+    """ The voice session collection (with its unique index) and GridFS bucket in db. """
+    voice_collection = db[MONGO_VOICE_COLLECTION_NAME]
+    voice_collection.create_index([('session_id', 1), ('ct', 1)], unique=True)
+    return voice_collection, gridfs.GridFSBucket(db, bucket_name=VOICE_GRIDFS_BUCKET)
+
+def build_voice_session(session_id, session_data, source_name):
+    """ (metadata document, WAV bytes) for a complete session, or None if it does not assemble. """
+    wav = assemble_wav_buffer(session_data)
+    if wav is None:
+        return None
+    fmt = parse_wav_header(wav)
+    frame_size = fmt['channels'] * fmt['bits'] // 8
+    document = {
+        'session_id': session_id,
+        'source_name': source_name,
+        'ct': session_data.get('ct'),  # Creation time of the session's first content instance
+        'sample_rate': fmt['sample_rate'],
+        'channels': fmt['channels'],
+        'bits': fmt['bits'],
+        'duration': (len(wav) - fmt['data_offset']) / (fmt['sample_rate'] * frame_size) if frame_size else None,
+        'chunk_count': session_data.get('total_chunks'),
+        'size': len(wav),
+        'source_ris': session_data.get('ris', []),  # The AUDIO_* content instances it came from
+    }
+    return document, bytes(wav)
+
+def store_voice_session(voice_collection, fs, session_id, session_data, source_name):
+    """
+    Stores one complete session as a single document: WAV bytes inline as BSON Binary, or
+    in GridFS above VOICE_GRIDFS_THRESHOLD. Upserted on (session_id, ct), so re-storing
+    the same session is harmless. Returns True on success; raises ConnectionFailure if
+    MongoDB is unreachable.
+    """
+    built = build_voice_session(session_id, session_data, source_name)
+    if built is None:
+        logging.warning("Voice session %s from %s did not assemble into a WAV. Not stored.", session_id, source_name,
+                        extra={'source': source_name})
+        return False
+    document, wav = built
+    key = {'session_id': session_id, 'ct': document['ct']}
+    try:
+        start_time = time.perf_counter()
+        if len(wav) > VOICE_GRIDFS_THRESHOLD:
+            existing = voice_collection.find_one(key, {'gridfs_id': 1})
+            if existing and existing.get('gridfs_id') is not None:
+                document['gridfs_id'] = existing['gridfs_id']
+            else:
+                document['gridfs_id'] = fs.upload_from_stream(f"{session_id}.wav", wav, metadata=key)
+            document['audio'] = None
+        else:
+            document['audio'] = Binary(wav)
+        voice_collection.update_one(key, {'$set': document}, upsert=True)
+        db_write_seconds.labels(source_name, "voice_session").observe(time.perf_counter() - start_time)
+        logging.info("Stored voice session %s from %s: %.2f s, %d bytes%s.", session_id, source_name, document['duration'],
+                     len(wav), ' in GridFS' if 'gridfs_id' in document else '', extra={'source': source_name})
+        return True
+    except ConnectionFailure:
+        raise
+    except Exception as e:
+        logging.error("Failed to store voice session %s from %s: %s", session_id, source_name, e, extra={'source': source_name})
+        return False
 
+def store_voice_entries(collection, entries, source_name):
+    """
+    Feeds voice content instances to the source's SessionAssembler (partial sessions are
+    kept between cycles) and stores each session they complete. The chunks themselves
+    are not stored. Returns counts like store_or_update_entries, counting sessions. A
+    session that can't be stored because MongoDB went down is spooled on its own.
+    """
+    global voice_store
+    counts = {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    if not entries:
+        logging.info("No new entries found to process for source: %s.", source_name, extra={'source': source_name})
+        return counts
+    if voice_store is None:
+        voice_store = get_voice_store(collection.database)
+
+    completed = []
+    assembler = voice_assemblers.setdefault(source_name, SessionAssembler(on_complete=None, log_extra={'source': source_name}))
+    assembler.on_complete = lambda session_id, session_data: completed.append((session_id, session_data))
+    assembler.ingest(entries)
+    for session_id, session_data in completed:
         try:
-            # Use update_one with upsert=True to insert if ri doesn't exist, or update if it does
-            result = collection.update_one(
-                {'ri': resource_id},       # Filter: Find document by resource ID
-                {'$set': data_to_store},   # Update: Set/replace fields with new data
-                upsert=True                # Option: Insert if no matching document found
-            )
-
-            if result.upserted_id is not None:
-                inserted_count += 1
-                logging.info(f"Inserted new document with ri: {resource_id} from {source_name}")
-            elif result.modified_count > 0:
-                updated_count += 1
-                logging.info(f"Updated document with ri: {resource_id} from {source_name}")
+            counts['inserted' if store_voice_session(*voice_store, session_id, session_data, source_name) else 'errors'] += 1
+        except ConnectionFailure as e:
+            # The chunks are already consumed by the assembler, so the session itself is spooled
+            if ingest_spool is None:
+                logging.error("MongoDB unreachable, voice session %s from %s lost: %s", session_id, source_name, e, extra={'source': source_name})
+                counts['errors'] += 1
             else:
-                 up_to_date_count += 1
-                 # logging.debug(f"Document with ri: {resource_id} from {source_name} already up-to-date.") # Too verbose
+                ingest_spool.append(source_name, 'voice_session', {'session_id': session_id, 'session_data': session_data})
+                logging.warning("MongoDB unreachable, spooled voice session %s from %s.", session_id, source_name, extra={'source': source_name})
+    logging.info("Processed %d voice entries from %s: %d session(s) stored, %d partial, %d failed.", len(entries), source_name,
+                 counts['inserted'], assembler.pending_sessions, counts['errors'], extra={'source': source_name})
+    return counts
 
 
-        except OperationFailure as e:
-            logging.error(f"MongoDB operation failed for ri {resource_id} from {source_name}: {e}")
-            error_count += 1
+# --- Change Detection (Watermark) ---
+def load_watermark(state_collection, source_name):
+    """
+    The source's watermark from memory, else from the state collection, else empty. If the
+    state collection can't be read (MongoDB down), it is read again every cycle until it
+    can, and the stored watermark replaces the one in memory if it is newer, so the source
+    is not refetched and restored from the start.
+    """
+    if source_name in source_watermarks and source_name not in unread_watermarks:
+        return source_watermarks[source_name]
+    current = source_watermarks.get(source_name, {'ct': None, 'ris': []})
+    state = None
+    if state_collection is not None:
+        try:
+            state = state_collection.find_one({'_id': source_name})
         except Exception as e:
-            logging.error(f"An unexpected error occurred storing ri {resource_id} from {source_name}: {e}")
-            error_count += 1
+            logging.error("Could not load watermark for %s: %s", source_name, e, extra={'source': source_name})
+            unread_watermarks.add(source_name)
+            return current
+    unread_watermarks.discard(source_name)
+    if state and state.get('ct') and (current['ct'] is None or state['ct'] > current['ct']):
+        current = {'ct': state['ct'], 'ris': list(state.get('ris', []))}
+    source_watermarks[source_name] = current
+    return current
+
+def save_watermark(state_collection, source_name, watermark):
+    source_watermarks[source_name] = watermark
+    if state_collection is None:
+        return
+    try:
+        state_collection.replace_one({'_id': source_name}, {'_id': source_name, **watermark}, upsert=True)
+    except Exception as e:
+        logging.error("Could not save watermark for %s: %s", source_name, e, extra={'source': source_name})
 
-    logging.info(f"Finished storing entries for {source_name}: Inserted {inserted_count}, Updated {updated_count}, Up-to-date {up_to_date_count}, Errors {error_count}")
+def filter_new_entries(entries, watermark):
+    """
+    Keeps entries created after the watermark, plus those with the same ct but an unseen
+    ri (ct only has second resolution). Returns (new_entries, advanced_watermark).
+    """
+    last_ct, seen = watermark['ct'], set(watermark['ris'])
+    new_entries = []
+    for entry in entries:
+        ct = entry.get('ct') or ''
+        if 'ri' in entry and (last_ct is None or ct > last_ct or (ct == last_ct and entry['ri'] not in seen)):
+            new_entries.append(entry)
+    if not new_entries:
+        return [], watermark
+    newest_ct = max(entry.get('ct') or '' for entry in new_entries)
+    ris = [entry['ri'] for entry in new_entries if (entry.get('ct') or '') == newest_ct]
+    if newest_ct == last_ct:
+        ris = watermark['ris'] + ris
+    return new_entries, {'ct': newest_ct, 'ris': ris}
+
+def shift_om2m_time(ct, seconds):
+    """ OM2M ct moved by seconds ("20250410T152836", -1 -> "20250410T152835"), or None if it doesn't parse. """
+    try:
+        moved = time.mktime(time.strptime(ct[:15], OM2M_TIME_FORMAT)) + seconds
+    except (TypeError, ValueError):
+        return None
+    return time.strftime(OM2M_TIME_FORMAT, time.localtime(moved))
 
+def source_fetch_url(source, watermark):
+    """
+    Adds filter criteria to a ?rcn=4 source URL so the CSE only returns instances created
+    since the watermark: cra is one second earlier, since it is strict and ct has
+    second resolution. /la sources and sources without a watermark are fetched as-is.
+    """
+    url = source['url']
+    if not (source.get('filter', USE_FILTER_CRITERIA) and watermark['ct'] and 'rcn=4' in url):
+        return url
+    since = shift_om2m_time(watermark['ct'], -1)
+    if since is None:
+        return url
+    return f"{url}&cra={since}&lim={FETCH_LIMIT}"
+
+def fetch_source_entries(source, watermark, session=None, timeout=FETCH_TIMEOUT):
+    """
+    Fetches the source's content instances since the watermark: (first response, entries).
+    A filtered fetch returns at most FETCH_LIMIT instances, and oneM2M leaves their order
+    to the CSE, so a full page is followed by the next until a short one comes back: if
+    the page is oldest first, the next starts at its newest ct (cra); if it is newest
+    first, the next ends after its oldest ct (crb), keeping the watermark's cra. Either
+    way the watermark only advances once every page is in.
+    """
+    url = source_fetch_url(source, watermark)
+    raw_data = fetch_om2m_data(url, session, timeout)
+    entries = extract_entries_from_response(raw_data)
+    if url == source['url']:
+        return raw_data, entries
+    seen = {entry.get('ri') for entry in entries}
+    page = entries
+    while len(page) >= FETCH_LIMIT:
+        cts = [entry.get('ct') or '' for entry in page]
+        if cts[0] > cts[-1]:  # Newest first: the rest are older than this page
+            until = shift_om2m_time(min(cts), 1)  # crb is strict too; instances of the oldest second are deduplicated
+            if until is None:
+                break
+            page_url = f"{url}&crb={until}"
+        else:
+            page_url = source_fetch_url(source, {'ct': max(cts)})
+        page = extract_entries_from_response(fetch_om2m_data(page_url, session, timeout))
+        fresh = [entry for entry in page if entry.get('ri') not in seen]
+        if not fresh:
+            break  # More than FETCH_LIMIT instances in one second; the rest come with the next cycle
+        seen.update(entry.get('ri') for entry in fresh)
+        entries.extend(fresh)
+    return raw_data, entries
+
+def run_fetch_cycle(collection, source, session=None, timeout=FETCH_TIMEOUT, state_collection=None):
+    """ Fetches one source and stores only instances newer than its watermark. Returns the store counts. """
+    source_name = source['name']
+    watermark = load_watermark(state_collection, source_name)
+    start_time = time.perf_counter()
+    raw_data, entries = fetch_source_entries(source, watermark, session, timeout)
+    fetch_seconds.labels(source_name).observe(time.perf_counter() - start_time)
+    if raw_data is None:
+        fetch_errors.labels(source_name).inc()
+    new_entries, advanced = filter_new_entries(entries, watermark)
+    cycle_entries.labels(source_name).observe(len(new_entries))
+    if not new_entries:
+        # Nothing to store (or the fetch failed): don't touch MongoDB or the spool
+        if entries:
+            logging.info("All %d entries from %s already stored (watermark %s).", len(entries), source_name, watermark['ct'],
+                         extra={'source': source_name})
+        else:
+            logging.info("No new entries found to process for source: %s.", source_name, extra={'source': source_name})
+        return {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    if ingest_spool is not None and ingest_spool.pending(source_name):
+        # Stay behind what is already spooled, so the drainer replays the source in order
+        ingest_spool.append(source_name, 'entries', new_entries)
+        stored_entries.labels(source_name, "spooled").inc(len(new_entries))
+        counts = {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    else:
+        try:
+            counts = store_entries(collection, new_entries, source_name)
+        except ConnectionFailure as e:
+            if ingest_spool is None:
+                logging.error("MongoDB unreachable, %d entries from %s not stored: %s", len(new_entries), source_name, e,
+                              extra={'source': source_name})
+                return {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': len(new_entries)}
+            ingest_spool.append(source_name, 'entries', new_entries)
+            logging.warning("MongoDB unreachable, spooled %d entries from %s: %s", len(new_entries), source_name, e,
+                            extra={'source': source_name})
+            stored_entries.labels(source_name, "spooled").inc(len(new_entries))
+            counts = {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    if not counts['errors'] and advanced is not watermark:
+        # On errors the next cycle retries them. Spooled entries are safe locally; the drainer
+        # persists the watermark once they are in MongoDB.
+        spooled = ingest_spool is not None and ingest_spool.pending(source_name)
+        save_watermark(None if spooled else state_collection, source_name, advanced)
+    return counts
+
+def store_entries(collection, entries, source_name):
+    """ Stores a source's new entries (raw documents or voice sessions, plus typed readings). """
+    ensure_database(collection)  # Indexes and the time-series collection before the first write
+    store = store_voice_entries if source_name in VOICE_SESSION_SOURCES else store_or_update_entries
+    counts = store(collection, entries, source_name)
+    if timeseries_collection is not None and source_name in CONTENT_PARSERS:
+        store_readings(timeseries_collection, entries, source_name)
+    for outcome, count in counts.items():
+        if count:
+            stored_entries.labels(source_name, outcome).inc(count)
+    if read_cache is not None and (counts['inserted'] or counts['updated']):
+        read_cache.invalidate(source_name)
+    return counts
+
+# --- Spool Draining ---
+def replay_voice_session(collection, payload, source_name):
+    global voice_store
+    if voice_store is None:
+        voice_store = get_voice_store(collection.database)
+    session_data = payload['session_data']
+    session_data['chunks'] = {int(index): chunk for index, chunk in session_data['chunks'].items()}  # JSON keys are strings
+    stored = store_voice_session(*voice_store, payload['session_id'], session_data, source_name)
+    stored_entries.labels(source_name, 'inserted' if stored else 'errors').inc()
+
+def replay_spooled(collection, spool, state_collection=None, limit=SPOOL_DRAIN_BATCH):
+    """
+    Replays up to limit of the oldest spooled records and acks them. Consecutive entry
+    records of a source are stored together, as one bulk_write. Returns the number of
+    records replayed; raises ConnectionFailure if MongoDB is (still) unreachable.
+    """
+    records = spool.peek(limit)
+    by_source = {}
+    for record in records:
+        by_source.setdefault(record[1], []).append(record)
+    for source_name, source_records in by_source.items():
+        for kind, group in itertools.groupby(source_records, key=lambda record: record[2]):
+            group = list(group)
+            try:
+                if kind == 'entries':
+                    store_entries(collection, [entry for record in group for entry in record[3]], source_name)
+                else:
+                    for record in group:
+                        replay_voice_session(collection, record[3], source_name)
+            except ConnectionFailure:
+                raise
+            except Exception as e:
+                # Not a connectivity problem, so a retry would fail the same way; don't block the spool on it
+                logging.error("Dropping %d spooled %s record(s) from %s that failed to replay: %s", len(group), kind, source_name, e,
+                              extra={'source': source_name})
+            spool.ack([record[0] for record in group])
+        if not spool.pending(source_name) and source_name in source_watermarks:
+            save_watermark(state_collection, source_name, source_watermarks[source_name])
+    return len(records)
+
+def drain_spool(collection, spool, stop_event, state_collection=None):
+    """
+    Replays the spool into MongoDB whenever it holds records; retries every SPOOL_DRAIN_INTERVAL
+    while MongoDB is down. Also prepares the database once MongoDB is up, spool or not.
+    """
+    while not stop_event.is_set():
+        if not spool.pending():
+            if not database_ready:
+                try:
+                    ensure_database(collection)
+                    logging.info("MongoDB reachable, database prepared.")
+                except ConnectionFailure:
+                    pass  # Still down; try again next interval
+            stop_event.wait(SPOOL_DRAIN_INTERVAL)
+            continue
+        start_time = time.time()
+        replayed = 0
+        try:
+            while spool.pending() and not stop_event.is_set():
+                replayed += replay_spooled(collection, spool, state_collection)
+        except ConnectionFailure as e:
+            logging.warning("MongoDB unreachable, %d records spooled (%.1f KiB): %s", spool.pending(), spool.size_bytes / 1024, e)
+            stop_event.wait(SPOOL_DRAIN_INTERVAL)
+        if replayed:
+            logging.info("Replayed %d spooled records in %.2f s, %d left.", replayed, time.time() - start_time, spool.pending())
+        if not spool.pending():
+            spool.compact()
+
+# --- Per-Source Polling ---
+def poll_source(collection, source, session, stop_event, state_collection=None):
+    """
+    Fetches and stores one source on its own schedule until stop_event is set. Each
+    source runs in its own thread, so a slow or hung endpoint only delays itself.
+    """
+    source_name = source['name']
+    interval = source.get('interval', FETCH_INTERVAL)
+    timeout = source.get('timeout', FETCH_TIMEOUT)
+    jitter = source.get('jitter', FETCH_JITTER)
+    cycle_times = source_cycle_times.setdefault(source_name, LatencyTracker())
+
+    stop_event.wait(random.uniform(0, interval * jitter))  # Spread out the first fetches
+    while not stop_event.is_set():
+        start_time = time.time()
+        try:
+            # Fetch data from the source URL, parse the entries (e.g., CINs) and store the new ones
+            run_fetch_cycle(collection, source, session, timeout, state_collection)
+        except Exception as e:
+            logging.error("Unexpected error in fetch cycle for %s: %s", source_name, e, extra={'source': source_name})
+
+        cycle_duration = time.time() - start_time
+        cycle_times.record(cycle_duration)
+        cycle_seconds.labels(source_name).observe(cycle_duration)
+        logging.info("Fetch cycle for %s finished in %.2f seconds.", source_name, cycle_duration,
+                     extra={'source': source_name, 'cycle_seconds': round(cycle_duration, 4)})
+
+        time_to_sleep = interval * random.uniform(1 - jitter, 1 + jitter) - cycle_duration
+        if time_to_sleep <= 0:
+            logging.warning("Fetch cycle for %s took longer than its interval (%ss). Proceeding immediately.", source_name, interval,
+                            extra={'source': source_name})
+        stop_event.wait(max(0.0, time_to_sleep))
+
+def log_cycle_stats():
+    """ Logs p50/p99 cycle time per source. """
+    for source_name, cycle_times in source_cycle_times.items():
+        logging.info("%s", cycle_times.summary(f"Cycle time {source_name}"), extra={'source': source_name})
 
 # --- Main Execution Loop ---
 def main():
+    log_listener = logsetup.configure_logging(json_lines=LOG_JSON)
     # Get MongoDB collection connection
     collection = get_mongo_collection()
     if collection is None:
         logging.critical("Failed to connect to MongoDB. Exiting.")
+        log_listener.stop()
         return
 
-    logging.info(f"Starting data fetch loop, cycling through {len(OM2M_DATA_SOURCES)} sources every {FETCH_INTERVAL} seconds...")
-
-    while True:
-        start_time = time.time()
-        logging.info("-" * 30)
-        logging.info(f"Starting fetch cycle at {time.ctime()}")
-
-        for source in OM2M_DATA_SOURCES:
-            source_name = source['name']
-            source_url = source['url']
-            logging.info(f"\n--- Fetching from source: {source_name} ---")
-
-            # Fetch data from the current source URL
-            raw_data = fetch_om2m_data(source_url)
-
-            # Parse the response to get a list of entries (e.g., CINs)
-            entries = extract_entries_from_response(raw_data)
-
-            # Store or update the entries in MongoDB for this source
-            store_or_update_entries(collection, entries, source_name)
-
-        end_time = time.time()
-        cycle_duration = end_time - start_time
-        logging.info("-" * 30)
-        logging.info(f"Fetch cycle finished in {cycle_duration:.2f} seconds.")
+    logging.info("Starting %d source pollers (default interval %ss, timeout %ss)...", len(OM2M_DATA_SOURCES), FETCH_INTERVAL, FETCH_TIMEOUT)
+    global ingest_spool, read_cache
+    if METRICS_PORT:
+        try:
+            metrics.start_http_server(METRICS_PORT)
+            logging.info("Serving metrics on port %s at /metrics", METRICS_PORT)
+        except OSError as e:
+            logging.error("Could not start metrics endpoint on port %s: %s", METRICS_PORT, e)
+    if READ_API_PORT:
+        import readapi
+        read_cache = readapi.ReadCache()
+        try:
+            readapi.start_http_server(READ_API_PORT, readapi.ReadService(collection, read_cache))
+            logging.info("Serving the read API on port %s", READ_API_PORT)
+        except OSError as e:
+            read_cache = None
+            logging.error("Could not start the read API on port %s: %s", READ_API_PORT, e)
+    session = create_http_session(len(OM2M_DATA_SOURCES))
+    state_collection = collection.database[MONGO_STATE_COLLECTION_NAME]
+    stop_event = threading.Event()
+    pollers = [threading.Thread(target=poll_source, args=(collection, source, session, stop_event, state_collection),
+                                name=f"poll-{source['name']}", daemon=True)
+               for source in OM2M_DATA_SOURCES]
+    if SPOOL_PATH:
+        ingest_spool = Spool(SPOOL_PATH, SPOOL_MAX_BYTES)
+        pollers.append(threading.Thread(target=drain_spool, args=(collection, ingest_spool, stop_event, state_collection),
+                                        name="spool-drainer", daemon=True))
+    for poller in pollers:
+        poller.start()
 
-        # Calculate remaining time to sleep
-        time_to_sleep = FETCH_INTERVAL - cycle_duration
-        if time_to_sleep > 0:
-            logging.info(f"Waiting for {time_to_sleep:.2f} seconds before next cycle...")
-            time.sleep(time_to_sleep)
-        else:
-            logging.warning("Fetch cycle took longer than FETCH_INTERVAL. Proceeding immediately.")
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            log_cycle_stats()
+            if ingest_spool is not None and ingest_spool.pending():
+                logging.info("Spool: %d records (%.1f KiB) waiting for MongoDB, %d dropped over the size cap.",
+                             ingest_spool.pending(), ingest_spool.size_bytes / 1024, ingest_spool.dropped)
+    except KeyboardInterrupt:
+        logging.info("Stopping source pollers...")
+        stop_event.set()
+        for poller in pollers:
+            poller.join(FETCH_TIMEOUT)
+    finally:
+        log_listener.stop()  # Flush queued records
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,205 @@
+"""
+OM2M (oneM2M HTTP binding) client shared by the scripts in this repo.
+
+OM2MClient keeps a requests.Session with a keep-alive connection pool, so repeated
+requests to the CSE reuse TCP connections instead of opening one per call. Every
+request has a timeout. Connection failures and 502/503/504 answers are retried with
+exponential backoff; a POST is only retried when the connection failed, before the CSE
+could have created anything, and read timeouts are never retried. Helpers create AEs,
+containers, content instances and subscriptions and retrieve the latest (/la) or all
+(?rcn=4, optionally filtered) content instances of a container.
+
+Paths are resolved against the CSE URL: "gas_sensor/data" -> {cse}/~/in-cse/in-name/gas_sensor/data,
+"/~/in-cse" -> {cse}/~/in-cse; full URLs are used as they are. The CSE URL defaults to
+OM2M_CSE_URL from the environment (see cse_url()).
+
+AsyncOM2MClient offers the same helpers as coroutines for asyncio code, running the
+pooled client's requests on a thread pool the size of its connection pool.
+
+    client = om2m.OM2MClient("http://127.0.0.1:8080")
+    client.create_content_instance("led", "ON")
+    latest = client.latest("gas_sensor/data")
+"""
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ORIGINATOR = "admin:admin"
+CSE_PATH = "/~/in-cse"
+CSE_NAME = "in-name"
+TIMEOUT = (3.05, 10)  # Seconds to connect, seconds to wait for the answer
+RETRIES = 3
+BACKOFF = 0.25  # The first retry is immediate, later ones wait 0.5 s, 1 s, ...
+RETRY_STATUSES = (502, 503, 504)
+POOL_SIZE = 10  # Connections kept open per CSE; size it to the number of threads sharing the client
+
+RESOURCE_TYPES = {'m2m:ae': 2, 'm2m:cnt': 3, 'm2m:cin': 4, 'm2m:sub': 23}
+ACCEPT_JSON = {"Accept": "application/json"}
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def cse_url(default="http://127.0.0.1:8080"):
+    """ The CSE base URL: OM2M_CSE_URL from the environment, else default. """
+    return os.environ.get("OM2M_CSE_URL", default)
+
+
+def default_client():
+    """ A process-wide client on cse_url(), created on first use. """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OM2MClient()
+        return _default_client
+
+
+def extract_content_instances(data):
+    """ The m2m:cin list of a container retrieved with ?rcn=4 (or a single /la answer). """
+    if not isinstance(data, dict):
+        return []
+    if 'm2m:cin' in data:
+        cin = data['m2m:cin']
+        return cin if isinstance(cin, list) else [cin]
+    container = data.get('m2m:cnt', {})
+    return container.get('m2m:cin', []) if isinstance(container, dict) else []
+
+
+class OM2MClient:
+    def __init__(self, cse=None, originator=ORIGINATOR, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF,
+                 pool_size=POOL_SIZE, auth=None):
+        self.cse = (cse or cse_url()).rstrip('/')
+        self.timeout = timeout
+        self.auth = auth
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update({"X-M2M-Origin": originator, **ACCEPT_JSON})
+        retry = Retry(total=retries, connect=retries, read=0, status=retries, backoff_factor=backoff,
+                      status_forcelist=RETRY_STATUSES, allowed_methods=frozenset({"GET", "PUT", "DELETE"}),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        if path.startswith("/"):
+            return self.cse + path
+        return f"{self.cse}{CSE_PATH}/{CSE_NAME}/{path}".rstrip('/')
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """ One request through the pool. Returns the Response; raises requests.RequestException on failure. """
+        return self.session.request(method, self.url(path), timeout=timeout or self.timeout, auth=self.auth, **kwargs)
+
+    def get(self, path, params=None, timeout=None):
+        """ GETs a resource and returns its JSON. Raises requests.HTTPError on 4xx/5xx and ValueError on a non-JSON answer. """
+        response = self.request("GET", path, timeout, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def create(self, parent, resource_key, attributes, timeout=None):
+        """ Creates a resource ({resource_key: attributes}) under parent. Returns the Response (201 created, 409 exists). """
+        headers = {"Content-Type": f"application/json;ty={RESOURCE_TYPES[resource_key]}"}
+        return self.request("POST", parent, timeout, json={resource_key: attributes}, headers=headers)
+
+    def update(self, path, resource_key, attributes, timeout=None):
+        """ Updates attributes of the resource at path (PUT). Returns the Response (200 updated). """
+        return self.request("PUT", path, timeout, json={resource_key: attributes}, headers={"Content-Type": "application/json"})
+
+    def create_ae(self, name, api, parent=CSE_PATH, request_reachability=True, **attributes):
+        return self.create(parent, 'm2m:ae', {"rn": name, "api": api, "rr": request_reachability, **attributes})
+
+    def create_container(self, parent, name, **attributes):
+        """ attributes: e.g. mni (max instances), mbs (max bytes). """
+        return self.create(parent, 'm2m:cnt', {"rn": name, **attributes})
+
+    def create_content_instance(self, container, con, timeout=None, **attributes):
+        return self.create(container, 'm2m:cin', {"con": con, **attributes}, timeout)
+
+    def create_subscription(self, container, name, notification_urls, **attributes):
+        """ Notifies notification_urls of every content instance created in container (net=3, whole resource). """
+        return self.create(container, 'm2m:sub', {"rn": name, "nu": list(notification_urls), "nct": 1,
+                                                  "enc": {"net": [3]}, **attributes})
+
+    def latest(self, container, timeout=None):
+        """ The container's latest content instance (/la), or None if it has none. """
+        response = self.request("GET", f"{self.url(container)}/la", timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json().get('m2m:cin')
+
+    def content_instances(self, container, created_after=None, created_before=None, limit=None, timeout=None):
+        """ The container's content instances (?rcn=4), optionally only those created after/before an OM2M ct, at most limit. """
+        params = {"rcn": 4}
+        for key, value in (("cra", created_after), ("crb", created_before), ("lim", limit)):
+            if value is not None:
+                params[key] = value
+        return extract_content_instances(self.get(container, params, timeout))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncOM2MClient:
+    """ OM2MClient's helpers as coroutines; takes the same arguments. """
+
+    def __init__(self, *args, **kwargs):
+        self.client = OM2MClient(*args, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=self.client.pool_size, thread_name_prefix="om2m")
+
+    def _run(self, method, *args, **kwargs):
+        return asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+
+    async def request(self, method, path, timeout=None, **kwargs):
+        return await self._run(self.client.request, method, path, timeout, **kwargs)
+
+    async def get(self, path, params=None, timeout=None):
+        return await self._run(self.client.get, path, params, timeout)
+
+    async def create(self, parent, resource_key, attributes, timeout=None):
+        return await self._run(self.client.create, parent, resource_key, attributes, timeout)
+
+    async def update(self, path, resource_key, attributes, timeout=None):
+        return await self._run(self.client.update, path, resource_key, attributes, timeout)
+
+    async def create_ae(self, name, api, parent=CSE_PATH, request_reachability=True, **attributes):
+        return await self._run(self.client.create_ae, name, api, parent, request_reachability, **attributes)
+
+    async def create_container(self, parent, name, **attributes):
+        return await self._run(self.client.create_container, parent, name, **attributes)
+
+    async def create_content_instance(self, container, con, timeout=None, **attributes):
+        return await self._run(self.client.create_content_instance, container, con, timeout, **attributes)
+
+    async def create_subscription(self, container, name, notification_urls, **attributes):
+        return await self._run(self.client.create_subscription, container, name, notification_urls, **attributes)
+
+    async def latest(self, container, timeout=None):
+        return await self._run(self.client.latest, container, timeout)
+
+    async def content_instances(self, container, created_after=None, created_before=None, limit=None, timeout=None):
+        return await self._run(self.client.content_instances, container, created_after, created_before, limit, timeout)
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,31 +1,15 @@
-import requests
 import time
 
-# OM2M server configuration
-server_url = "http://192.168.158.66:8080"
-resource_path = "/~/in-cse/in-name/solenoid"
-content_instance_url = f"{server_url}{resource_path}"
+import om2m
 
-# Authentication credentials
-headers = {
-    "X-M2M-Origin": "admin:admin",
-    "Content-Type": "application/json;ty=4"
-}
+# OM2M server configuration (OM2M_CSE_URL overrides the address)
+client = om2m.OM2MClient(om2m.cse_url("http://192.168.158.66:8080"))
+container = "solenoid"
 
 def post_command(command):
     """Post a command (ON/OFF) to the OM2M server"""
-    data = {
-        "m2m:cin": {
-            "con": command
-        }
-    }
-    
     try:
-        response = requests.post(
-            content_instance_url, 
-            headers=headers, 
-            json=data
-        )
+        response = client.create_content_instance(container, command)
         
         if response.status_code == 201:
             print(f"Successfully posted command: {command}")
@@ -0,0 +1,177 @@
+"""
+Bounded worker stages for the voice command pipeline (intake -> ASR -> actuation).
+
+Each Stage runs handler(item) on its own worker threads, fed from bounded queues. put()
+blocks the producer for up to put_timeout when the queue is full (backpressure) and then
+drops the oldest queued item, so a backlog never grows without limit and fresh commands
+win over stale ones. With route=..., every worker has its own queue and items with the
+same key always go to the same worker, which keeps them in order. With batch_size=N, a
+worker hands handler a list of up to N items: the first one it gets plus whatever
+arrives within batch_wait seconds of it (micro-batching).
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("pipeline")
+
+
+def percentile(values, p):
+    """ Nearest-rank percentile (p in 0..100) of a sequence; None if it is empty. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+class LatencyTracker:
+    """ Keeps the last `window` latencies (seconds) for p50/p99 reporting. """
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    def percentiles(self, *ps):
+        with self._lock:
+            samples = list(self.samples)
+        return [percentile(samples, p) for p in ps]
+
+    def summary(self, label="latency"):
+        p50, p99 = self.percentiles(50, 99)
+        if p50 is None:
+            return f"{label}: no samples"
+        return f"{label}: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms (n={self.count})"
+
+
+class Stage:
+    """ A named pipeline stage: bounded queue(s) drained by `workers` threads running handler(item). """
+
+    def __init__(self, name, handler, workers=1, maxsize=8, put_timeout=1.0, route=None, batch_size=None, batch_wait=0.0,
+                 log_extra=None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self.route = route
+        self.batch_size = batch_size  # None: handler(item); N: handler([item, ...]) with up to N items
+        self.batch_wait = batch_wait
+        self.log_extra = {'stage': name, **(log_extra or {})}  # Fields of this stage's log records, e.g. its home
+        self.queues = [queue.Queue(maxsize) for _ in range(workers if route else 1)]
+        self.stats = {"submitted": 0, "processed": 0, "failed": 0, "dropped": 0, "batches": 0,
+                      "blocked_seconds": 0.0, "busy_seconds": 0.0, "max_depth": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, args=(self.queues[i % len(self.queues)],),
+                                          name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stop.clear()
+
+    def put(self, item):
+        """ Queues item, blocking up to put_timeout; then drops the oldest queued item. Returns False if any were dropped. """
+        target = self.queues[0] if self.route is None else self.queues[hash(self.route(item)) % len(self.queues)]
+        start = time.perf_counter()
+        dropped = 0
+        try:
+            target.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            # Another producer blocked in put() can take the slot we free, so drop until ours fits
+            while True:
+                try:
+                    target.get_nowait()
+                    target.task_done()
+                    dropped += 1
+                except queue.Empty:
+                    pass
+                try:
+                    target.put_nowait(item)
+                    break
+                except queue.Full:
+                    continue
+        with self._lock:
+            self.stats["submitted"] += 1
+            self.stats["dropped"] += dropped
+            self.stats["blocked_seconds"] += time.perf_counter() - start
+            self.stats["max_depth"] = max(self.stats["max_depth"], self.depth)
+        if dropped:
+            log.warning("%s queue full. Dropped the %d oldest item(s).", self.name, dropped, extra=self.log_extra)
+        return not dropped
+
+    @property
+    def depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def join(self):
+        """ Blocks until every queued item has been handled. """
+        for q in self.queues:
+            q.join()
+
+    def _take_batch(self, source, first):
+        """ first plus the items that arrive within batch_wait of it, up to batch_size. """
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(source.get(timeout=max(0.0, deadline - time.perf_counter())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, source):
+        while not self._stop.is_set():
+            try:
+                item = source.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            items = 1
+            start = time.perf_counter()
+            try:
+                if self.batch_size is None:
+                    self.handler(item)
+                else:
+                    batch = self._take_batch(source, item)
+                    items = len(batch)
+                    start = time.perf_counter()
+                    self.handler(batch)
+                outcome = "processed"
+            except Exception as e:
+                outcome = "failed"
+                log.exception("Error in %s stage: %s", self.name, e, extra=self.log_extra)
+            finally:
+                with self._lock:
+                    self.stats[outcome] += items
+                    self.stats["batches"] += 1
+                    self.stats["busy_seconds"] += time.perf_counter() - start
+                for _ in range(items):
+                    source.task_done()
+
+    def summary(self):
+        s = self.stats
+        batches = ""
+        if self.batch_size is not None and s["batches"]:
+            batches = f" in {s['batches']} batches (mean {(s['processed'] + s['failed']) / s['batches']:.1f})"
+        return (f"{self.name}: depth {self.depth}/{self.maxsize * len(self.queues)} (max {s['max_depth']}), "
+                f"done {s['processed']}, failed {s['failed']}{batches}, dropped {s['dropped']}, "
+                f"producer blocked {s['blocked_seconds']:.2f} s")
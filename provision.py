@@ -0,0 +1,201 @@
+"""
+Idempotent provisioning of the OM2M resource tree from a declarative spec.
+
+The spec (JSON, or YAML if PyYAML is installed) lists the AEs and containers under the
+CSE, nested through 'children':
+
+    {"resources": [
+        {"ty": "cnt", "rn": "led"},
+        {"ty": "ae", "rn": "voice_command", "api": "app-voice", "children": [
+            {"ty": "cnt", "rn": "audio_upload", "mni": 10, "mbs": 100000}]}]}
+
+Any other key of a node is an attribute of the resource. provision() diffs the spec
+against the CSE level by level with parallel GETs (the children of a missing resource
+are not asked for), then creates the missing resources level by level (a level's
+creates run in parallel once their parents exist) and updates existing ones whose
+updatable attributes (UPDATABLE) differ from the spec. Running it again changes
+nothing; a resource created by someone else in between (409) counts as present.
+
+    python provision.py om2m_tree.json --cse http://127.0.0.1:8080
+    python provision.py om2m_tree.json --dry-run
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import om2m
+
+CONCURRENCY = 16  # Requests in flight, and pooled connections to the CSE
+RESOURCE_KEYS = {'ae': 'm2m:ae', 'cnt': 'm2m:cnt'}
+UPDATABLE = {'m2m:ae': ('rr', 'lbl', 'poa'), 'm2m:cnt': ('mni', 'mbs', 'mia', 'lbl')}
+DEFAULT_SPEC = "om2m_tree.json"
+
+
+class Node:
+    """ One resource of the spec: its path below the CSE (e.g. 'voice_command/audio_upload'). """
+
+    def __init__(self, path, resource_key, attributes, depth):
+        self.path = path
+        self.resource_key = resource_key
+        self.attributes = attributes
+        self.depth = depth
+        self.parent = path.rpartition('/')[0]
+
+    def __repr__(self):
+        return f"{self.resource_key} {self.path}"
+
+
+def load_spec(path):
+    """ The spec file's resource list. .yaml/.yml files need PyYAML. """
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("YAML specs need PyYAML (pip install pyyaml); use a .json spec otherwise.")
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    return spec['resources'] if isinstance(spec, dict) else spec
+
+
+def flatten(resources, parent="", depth=0):
+    """ Nodes of a nested resource list, parents before their children. """
+    nodes = []
+    for resource in resources:
+        resource = dict(resource)
+        kind, children = resource.pop('ty'), resource.pop('children', [])
+        if kind not in RESOURCE_KEYS:
+            raise ValueError(f"Unsupported resource type {kind!r} for {resource.get('rn')} (expected {', '.join(RESOURCE_KEYS)})")
+        path = f"{parent}/{resource['rn']}" if parent else resource['rn']
+        nodes.append(Node(path, RESOURCE_KEYS[kind], resource, depth))
+        nodes.extend(flatten(children, path, depth + 1))
+    return nodes
+
+
+def changed_attributes(node, live):
+    """ Updatable attributes whose live value differs from the spec. """
+    return {key: node.attributes[key] for key in UPDATABLE[node.resource_key]
+            if key in node.attributes and live.get(key) != node.attributes[key]}
+
+
+def diff(client, nodes, pool):
+    """
+    (missing nodes, {node: changed attributes}) against the live CSE. Each level is
+    fetched with parallel GETs; children of a missing resource are missing too, without
+    asking.
+    """
+    def fetch(node):
+        response = client.request("GET", node.path)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json().get(node.resource_key, {})
+
+    missing, changed, missing_paths = [], {}, set()
+    for depth in sorted({node.depth for node in nodes}):
+        level = []
+        for node in nodes:
+            if node.depth != depth:
+                continue
+            if node.parent in missing_paths:
+                missing.append(node)
+                missing_paths.add(node.path)
+            else:
+                level.append(node)
+        for node, live in zip(level, pool.map(fetch, level)):
+            if live is None:
+                missing.append(node)
+                missing_paths.add(node.path)
+            else:
+                attributes = changed_attributes(node, live)
+                if attributes:
+                    changed[node] = attributes
+    return missing, changed
+
+
+def create(client, node):
+    attributes = {k: v for k, v in node.attributes.items() if k != 'rn'}
+    parent = node.parent or ""
+    if node.resource_key == 'm2m:ae':
+        response = client.create_ae(node.attributes['rn'], attributes.pop('api'), parent=parent, **attributes)
+    else:
+        response = client.create_container(parent, node.attributes['rn'], **attributes)
+    return response.status_code in (200, 201, 409), response
+
+
+def provision(nodes, client, concurrency=CONCURRENCY, dry_run=False):
+    """
+    Brings the CSE in line with nodes. Returns {'created': [...], 'updated': [...],
+    'unchanged': [...], 'failed': [(node, reason)]}.
+    """
+    report = {'created': [], 'updated': [], 'unchanged': [], 'failed': []}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        missing, changed = diff(client, nodes, pool)
+        missing_set = set(missing)
+        report['unchanged'] = [node for node in nodes if node not in changed and node not in missing_set]
+        if dry_run:
+            report['created'], report['updated'] = missing, list(changed)
+            return report
+
+        def update(node):
+            return client.update(node.path, node.resource_key, changed[node])
+        for node, response in zip(changed, pool.map(update, changed)):
+            if response.status_code == 200:
+                report['updated'].append(node)
+            else:
+                report['failed'].append((node, f"update {response.status_code}: {response.text[:200]}"))
+
+        failed_paths = set()
+        for depth in sorted({node.depth for node in missing}):
+            level = []
+            for node in missing:
+                if node.depth != depth:
+                    continue
+                if node.parent in failed_paths:
+                    failed_paths.add(node.path)
+                    report['failed'].append((node, f"parent {node.parent} missing"))
+                else:
+                    level.append(node)
+            for node, (ok, response) in zip(level, pool.map(lambda node: create(client, node), level)):
+                if ok:
+                    report['created'].append(node)
+                else:
+                    failed_paths.add(node.path)
+                    report['failed'].append((node, f"create {response.status_code}: {response.text[:200]}"))
+    return report
+
+
+def print_report(report, dry_run=False):
+    verb = "would be " if dry_run else ""
+    for outcome in ('created', 'updated'):
+        for node in report[outcome]:
+            print(f"  {verb}{outcome:<8} {node}")
+    for node, reason in report['failed']:
+        print(f"  failed   {node}: {reason}")
+    print(f"{len(report['created'])} {verb}created, {len(report['updated'])} {verb}updated, "
+          f"{len(report['unchanged'])} unchanged, {len(report['failed'])} failed")
+
+
+def run(resources, cse=None, concurrency=CONCURRENCY, dry_run=False):
+    """ Provisions a resource list (spec format) and prints what changed. Returns the report. """
+    with om2m.OM2MClient(cse, pool_size=concurrency) as client:
+        report = provision(flatten(resources), client, concurrency, dry_run)
+    print_report(report, dry_run)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("spec", nargs="?", default=DEFAULT_SPEC, help="JSON or YAML resource tree")
+    parser.add_argument("--cse", default=om2m.cse_url(), help="CSE base URL (default: OM2M_CSE_URL or http://127.0.0.1:8080)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+    report = run(load_spec(args.spec), args.cse, args.concurrency, args.dry_run)
+    if report['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
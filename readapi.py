@@ -0,0 +1,282 @@
+"""
+Read-only HTTP JSON API over the readings mong.py stores (om2m_data.sensor_readings),
+for dashboards.
+
+  GET /latest                       latest reading of every source
+  GET /latest?source=gas_sensor     latest reading of one source
+  GET /range?source=..&since=3600   readings of the last hour (or start=/end= as OM2M ct
+                                    "20250410T152836"), oldest first, at most limit=
+  GET /series?source=..&field=gas_level&bucket=minute&since=86400
+                                    avg/min/max/count of a parsed_content field per
+                                    minute, hour or day
+
+Answers are cached (ReadCache): dashboards polling every few seconds share one MongoDB
+query per distinct request until it expires (CACHE_TTL) or the source gets new data.
+mong.py runs this service in-process (READ_API_PORT) and invalidates a source whenever
+it stores entries for it; run standalone (python readapi.py), answers are only as fresh
+as CACHE_TTL. Queries use the (source_name, ct) index created by mong.prepare_database.
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from pymongo.errors import ConnectionFailure
+
+import metrics
+
+READ_API_PORT = 9103
+CACHE_TTL = 10  # Seconds an answer is served without asking MongoDB, unless its source got new data
+CACHE_MAX_ENTRIES = 1024  # Least recently used answers are evicted past this
+RANGE_DEFAULT_LIMIT = 1000
+RANGE_MAX_LIMIT = 10000
+DEFAULT_SINCE = 3600  # Seconds covered by /range and /series without since= or start=
+SERIES_BUCKETS = {'minute': 13, 'hour': 11, 'day': 8}  # Length of the ct prefix ("20250410T1528") per bucket
+# Field plotted by /series when none is given
+DEFAULT_SERIES_FIELDS = {'gas_sensor': 'gas_level', 'fall_sensor': 'accel'}
+OM2M_TIME_FORMAT = "%Y%m%dT%H%M%S"  # ct, as in mong.py
+ALL_SOURCES = '*'  # Cache entries that span sources; invalidated by any source
+READING_PROJECTION = {'_id': 0, 'ri': 1, 'source_name': 1, 'ct': 1, 'con': 1, 'parsed_content': 1}
+# Latest reading of every source. Both keys descending, so the (source_name, ct) index is walked
+# backwards and $sort + $first becomes a DISTINCT_SCAN (one seek per source); mixed directions
+# ({'source_name': 1, 'ct': -1}) can't use it and sort the whole collection in memory.
+LATEST_ALL_PIPELINE = [{'$sort': {'source_name': -1, 'ct': -1}},
+                       {'$group': {'_id': '$source_name', 'reading': {'$first': '$$ROOT'}}}]
+
+FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+CT_PATTERN = re.compile(r'^\d{8}T\d{6}$')
+
+read_requests = metrics.Counter("read_api_requests_total", "Read API requests by endpoint and cache outcome.", ["endpoint", "cache"])
+read_query_seconds = metrics.Histogram("read_api_query_seconds", "MongoDB query time per read API endpoint (cache misses).", ["endpoint"])
+
+
+class ReadCache:
+    """
+    TTL + LRU cache of query answers, grouped by source. invalidate(source) makes every
+    cached answer of that source (and every ALL_SOURCES answer) stale at once by bumping
+    the source's generation. Concurrent misses for the same key wait for one load
+    instead of all querying MongoDB. ttl=0 or max_entries=0 disables caching.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires, generation, value)
+        self._generations = {}  # source name -> int
+        self._loading = {}  # key -> Event set when its load finishes
+        self._lock = threading.Lock()
+
+    def _generation(self, source_name):
+        if source_name == ALL_SOURCES:
+            return sum(self._generations.values())
+        return self._generations.get(source_name, 0)
+
+    def invalidate(self, source_name):
+        with self._lock:
+            self._generations[source_name] = self._generations.get(source_name, 0) + 1
+
+    def get_or_load(self, source_name, key, loader):
+        """ (value, outcome): the cached answer for key ('hit'), or loader()'s ('miss', or 'shared' if another thread loaded it). """
+        if not self.ttl or not self.max_entries:
+            return loader(), 'miss'
+        key = (source_name,) + key
+        waited = False
+        while True:
+            with self._lock:
+                generation = self._generation(source_name)
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > self.clock() and entry[1] == generation:
+                    self._entries.move_to_end(key)
+                    return entry[2], 'shared' if waited else 'hit'
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            loading.wait()
+            waited = True  # Retry: the load may have failed, or been invalidated meanwhile
+        try:
+            value = loader()
+            with self._lock:
+                if self._generation(source_name) == generation:  # Else new data arrived during the query
+                    self._entries[key] = (self.clock() + self.ttl, generation, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return value, 'miss'
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def parse_window(params):
+    """ (start ct, end ct) from start=/end= (OM2M ct) or since= (seconds back from now, CSE local time). """
+    end = params.get('end')
+    start = params.get('start')
+    for value in (start, end):
+        if value is not None and not CT_PATTERN.match(value):
+            raise BadRequest(f"Times are OM2M ct values like 20250410T152836, got {value!r}")
+    if start is None:
+        try:
+            since = float(params.get('since', DEFAULT_SINCE))
+        except ValueError:
+            raise BadRequest("since is a number of seconds")
+        start = time.strftime(OM2M_TIME_FORMAT, time.localtime(time.time() - since))
+    return start, end
+
+
+def parse_limit(params):
+    try:
+        limit = int(params.get('limit', RANGE_DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit is an integer")
+    return max(1, min(limit, RANGE_MAX_LIMIT))
+
+
+class ReadService:
+    """ The queries behind the endpoints, each answer cached as its encoded JSON body. """
+
+    def __init__(self, collection, cache=None):
+        self.collection = collection
+        self.cache = cache if cache is not None else ReadCache()
+
+    def _cached(self, endpoint, source_name, key, query):
+        def load():
+            start_time = time.perf_counter()
+            result = query()
+            read_query_seconds.labels(endpoint).observe(time.perf_counter() - start_time)
+            return json.dumps(result, default=str).encode('utf-8')
+        body, outcome = self.cache.get_or_load(source_name, (endpoint,) + key, load)
+        read_requests.labels(endpoint, outcome).inc()
+        return body
+
+    def latest(self, source_name=None):
+        if source_name is None:
+            return self._cached('latest', ALL_SOURCES, (), self._latest_all)
+        return self._cached('latest', source_name, (), lambda: self.collection.find_one(
+            {'source_name': source_name}, READING_PROJECTION, sort=[('ct', -1)]))
+
+    def _latest_all(self):
+        return {group['_id']: {k: group['reading'].get(k) for k in READING_PROJECTION if k != '_id'}
+                for group in self.collection.aggregate(LATEST_ALL_PIPELINE)}
+
+    def range(self, source_name, params):
+        window, limit = (params.get('start'), params.get('end'), params.get('since')), parse_limit(params)
+        parse_window(params)  # Validate before caching anything
+
+        def query():
+            start, end = parse_window(params)
+            ct_filter = {'$gte': start, **({'$lte': end} if end else {})}
+            cursor = self.collection.find({'source_name': source_name, 'ct': ct_filter}, READING_PROJECTION)
+            return list(cursor.sort('ct', 1).limit(limit))
+        return self._cached('range', source_name, window + (limit,), query)
+
+    def series(self, source_name, params):
+        field = params.get('field') or DEFAULT_SERIES_FIELDS.get(source_name)
+        if not field or not FIELD_PATTERN.match(field):
+            raise BadRequest("field names a parsed_content field, e.g. gas_level")
+        bucket = params.get('bucket', 'minute')
+        if bucket not in SERIES_BUCKETS:
+            raise BadRequest(f"bucket is one of {', '.join(SERIES_BUCKETS)}")
+        window = (params.get('start'), params.get('end'), params.get('since'))
+        parse_window(params)
+
+        def query():
+            start, end = parse_window(params)
+            ct_filter = {'$gte': start, **({'$lte': end} if end else {})}
+            value = f"$parsed_content.{field}"
+            pipeline = [
+                {'$match': {'source_name': source_name, 'ct': ct_filter, f"parsed_content.{field}": {'$exists': True}}},
+                {'$group': {'_id': {'$substrBytes': ['$ct', 0, SERIES_BUCKETS[bucket]]},
+                            'avg': {'$avg': value}, 'min': {'$min': value}, 'max': {'$max': value}, 'count': {'$sum': 1}}},
+                {'$sort': {'_id': 1}}]
+            return [{'bucket': group.pop('_id'), **group} for group in self.collection.aggregate(pipeline)]
+        return self._cached('series', source_name, window + (field, bucket), query)
+
+
+class ReadHandler(BaseHTTPRequestHandler):
+    service = None  # Set by start_http_server
+
+    def log_message(self, format, *args):
+        pass  # Dashboards poll; an access log line per request is noise
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode('utf-8'))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        source_name = params.get('source')
+        try:
+            if url.path == '/latest':
+                body = self.service.latest(source_name)
+            elif url.path in ('/range', '/series'):
+                if not source_name:
+                    raise BadRequest("source is required")
+                body = (self.service.range if url.path == '/range' else self.service.series)(source_name, params)
+            else:
+                self._error(404, f"Unknown endpoint {url.path}")
+                return
+        except BadRequest as e:
+            self._error(400, str(e))
+            return
+        except ConnectionFailure as e:
+            self._error(503, f"MongoDB unreachable: {e}")
+            return
+        except Exception as e:
+            logging.error("Read API query %s failed: %s", self.path, e)
+            self._error(500, f"Query failed: {e}")
+            return
+        self._send(200, body)
+
+
+def start_http_server(port, service, host="0.0.0.0"):
+    """ Serves service on http://host:port from a daemon thread. Returns the server. """
+    handler = type("BoundReadHandler", (ReadHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="read-api", daemon=True).start()
+    return server
+
+
+def main():
+    import mong  # Not at import time: mong.main() imports this module while running as __main__
+    parser = argparse.ArgumentParser(description="Read API over the stored OM2M readings (standalone: TTL-only caching).")
+    parser.add_argument("--uri", default=mong.MONGO_URI)
+    parser.add_argument("--port", type=int, default=READ_API_PORT)
+    parser.add_argument("--ttl", type=float, default=CACHE_TTL)
+    args = parser.parse_args()
+    mong.MONGO_URI, mong.SPOOL_PATH = args.uri, None
+    collection = mong.get_mongo_collection()
+    if collection is None:
+        return
+    server = start_http_server(args.port, ReadService(collection, ReadCache(ttl=args.ttl)))
+    logging.info("Read API listening on port %d", server.server_address[1])
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Streams sensor_readings dumps (like MongoDB_readingsdata.json) into MongoDB and exports them.
+
+Import reads a mongoexport-style Extended JSON array, or NDJSON (optionally gzipped), one
+document at a time and stores it in batches through mong.store_entries, the route fetched
+entries take: voice chunks are reassembled into voice sessions (GridFS above the threshold),
+parsed sources also get typed time-series readings, and re-importing a dump is a no-op.
+Export writes the readings collection, or a dump file, to gzipped NDJSON (.ndjson.gz) or,
+if pyarrow is installed, Parquet (.parquet) written one row group per batch. Only one
+batch is held in memory, so multi-GB dumps run in flat memory.
+
+    python readings_dump.py import MongoDB_readingsdata.json
+    python readings_dump.py export readings.ndjson.gz
+    python readings_dump.py export readings.parquet --json MongoDB_readingsdata.json --source gas_sensor
+"""
+import argparse
+import gzip
+import json
+import logging
+import time
+
+from bson import json_util
+from pymongo import MongoClient
+
+import mong
+
+BATCH_SIZE = 1000
+READ_SIZE = 1 << 16  # Characters read from the dump per refill
+MAX_ELEMENT_SIZE = 64 << 20  # Far above the 16 MB BSON limit; past this the dump is taken as malformed
+WHITESPACE = " \t\r\n"
+GZIP_LEVEL = 1  # Base64 audio barely compresses: level 1 is ~30% faster than 6 for ~2% larger files
+
+# Columns of the Parquet export; the fields build_document keeps, plus the original _id
+PARQUET_COLUMNS = [('_id', 'string'), ('ri', 'string'), ('source_name', 'string'), ('rn', 'string'),
+                   ('ct', 'string'), ('lt', 'string'), ('st', 'int64'), ('cs', 'int64'),
+                   ('con', 'string'), ('pi', 'string')]
+
+
+def open_text(path):
+    """ Opens a dump for reading text, gunzipping it if the name ends in .gz. """
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')
+
+
+def iter_json_array(f, read_size=READ_SIZE):
+    """
+    Yields the elements of a JSON array read incrementally from a text file, decoding
+    Extended JSON ($oid, $date, ...) to BSON types. The buffer only ever holds the
+    unparsed tail of the last read plus the element being decoded.
+    """
+    decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+    buffer, pos, eof = "", 0, False
+
+    def fill(size=read_size):
+        nonlocal buffer, pos, eof
+        data = f.read(size)
+        eof = not data
+        buffer, pos = buffer[pos:] + data, 0
+
+    def next_token():
+        """ Skips whitespace; returns the next character ('' at end of input). """
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return buffer[pos:pos + 1]
+            fill()
+
+    if next_token() != '[':
+        raise ValueError("Expected a JSON array")
+    pos += 1
+    if next_token() == ']':
+        return
+    while True:
+        next_token()
+        while True:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # Most likely the element continues past the buffer; read more unless there is no more.
+                # Reading at least as much as is pending keeps re-parsing a large element linear.
+                if eof or len(buffer) - pos > MAX_ELEMENT_SIZE:
+                    raise
+                fill(max(read_size, len(buffer) - pos))
+        pos = end
+        yield element
+        token = next_token()
+        pos += 1
+        if token == ']':
+            return
+        if token != ',':
+            raise ValueError(f"Expected ',' or ']' between array elements, got {token!r}")
+
+
+def iter_dump(path):
+    """ Yields the documents of a JSON array or NDJSON dump (.json, .ndjson, optionally .gz). """
+    with open_text(path) as f:
+        if '.ndjson' in path or '.jsonl' in path:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_dump(collection, path, batch_size=BATCH_SIZE, default_source=None):
+    """
+    Stores every document of the dump via mong.store_entries, like live ingestion. Returns
+    (documents read, counts); voice sources count the sessions stored, not their chunks.
+    """
+    totals = {'inserted': 0, 'updated': 0, 'up_to_date': 0, 'errors': 0}
+    read = 0
+    for batch in batched(iter_dump(path), batch_size):
+        read += len(batch)
+        by_source = {}
+        for document in batch:
+            by_source.setdefault(document.get('source_name') or default_source, []).append(document)
+        for source_name, entries in by_source.items():
+            if source_name is None:
+                logging.warning("Skipping %d documents without source_name (use --source).", len(entries))
+                totals['errors'] += len(entries)
+                continue
+            for key, value in mong.store_entries(collection, entries, source_name).items():
+                totals[key] += value
+    return read, totals
+
+
+class NDJSONWriter:
+    """ One relaxed Extended JSON document per line, gzipped if the name ends in .gz. """
+
+    def __init__(self, path):
+        self.file = gzip.open(path, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8') if path.endswith('.gz') else open(path, 'w', encoding='utf-8')
+
+    def write_batch(self, documents):
+        self.file.writelines(json_util.dumps(document) + "\n" for document in documents)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """ Writes batches as row groups of the PARQUET_COLUMNS schema. Needs pyarrow. """
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet export needs pyarrow (pip install pyarrow); use .ndjson.gz otherwise.")
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in PARQUET_COLUMNS])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write_batch(self, documents):
+        columns = {name: [] for name, _ in PARQUET_COLUMNS}
+        for document in documents:
+            for name, kind in PARQUET_COLUMNS:
+                value = document.get(name)
+                if value is not None:
+                    value = int(value) if kind == 'int64' else str(value)
+                columns[name].append(value)
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(path):
+    if path.endswith('.parquet'):
+        return ParquetWriter(path)
+    if '.ndjson' in path or '.jsonl' in path:
+        return NDJSONWriter(path)
+    raise SystemExit(f"Unknown export format for {path}; use .ndjson.gz or .parquet")
+
+
+def export_documents(documents, path, batch_size=BATCH_SIZE):
+    """ Writes documents to path in batches. Returns the number written. """
+    writer = open_writer(path)
+    written = 0
+    try:
+        for batch in batched(documents, batch_size):
+            writer.write_batch(batch)
+            written += len(batch)
+    finally:
+        writer.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--uri", default=mong.MONGO_URI)
+    parser.add_argument("--db", default=mong.MONGO_DB_NAME)
+    parser.add_argument("--collection", default=mong.MONGO_COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Load a dump into the readings collection")
+    import_parser.add_argument("dump", help="JSON array or NDJSON file (.json, .ndjson, .ndjson.gz)")
+    import_parser.add_argument("--source", help="source_name for documents that have none")
+    export_parser = commands.add_parser("export", help="Write readings to .ndjson.gz or .parquet")
+    export_parser.add_argument("output")
+    export_parser.add_argument("--json", help="Export this dump file instead of the collection")
+    export_parser.add_argument("--source", help="Only export this source_name")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)  # mong.store_entries logs every batch at INFO
+
+    start = time.perf_counter()
+    if args.command == "import":
+        collection = MongoClient(args.uri)[args.db][args.collection]  # store_entries prepares its indexes
+        read, counts = import_dump(collection, args.dump, args.batch_size, args.source)
+        print(f"Read {read} documents in {time.perf_counter() - start:.1f} s: {counts}")
+    else:
+        if args.json:
+            documents = (d for d in iter_dump(args.json) if not args.source or d.get('source_name') == args.source)
+        else:
+            collection = MongoClient(args.uri)[args.db][args.collection]
+            query = {'source_name': args.source} if args.source else {}
+            documents = collection.find(query).sort('_id', 1).batch_size(args.batch_size)
+        written = export_documents(documents, args.output, args.batch_size)
+        print(f"Wrote {written} documents to {args.output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Durable local write-ahead spool for ingestion while MongoDB is unreachable.
+
+Records (source name, kind, payload) are appended to a SQLite database in WAL mode, each
+append committed (and fsynced with synchronous=FULL) before it returns, so a spooled
+record survives a crash of this process or of MongoDB. A drainer reads the oldest
+records with peek(), replays them and ack()s them; records of one source always come
+back in the order they were appended. The spool is capped at max_bytes of payload: past
+that the oldest records are dropped (and counted), since newer readings matter more.
+Freed pages are returned to the filesystem by compact().
+"""
+import logging
+import sqlite3
+import threading
+
+from bson import json_util
+
+SPOOL_MAX_BYTES = 256 * 1024 * 1024
+
+
+class Spool:
+    def __init__(self, path, max_bytes=SPOOL_MAX_BYTES, synchronous="FULL"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # auto_vacuum only takes effect on a new database, before the first table is created
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "source_name TEXT NOT NULL, kind TEXT NOT NULL, payload TEXT NOT NULL, size INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS records_source ON records (source_name, id)")
+        self._count, self._bytes = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM records").fetchone()
+        self._pending = dict(self._db.execute("SELECT source_name, COUNT(*) FROM records GROUP BY source_name"))
+        if self._count:
+            logging.warning("Spool %s holds %d records (%.1f KiB) from a previous run.", path, self._count, self._bytes / 1024)
+
+    def append(self, source_name, kind, payload):
+        """ Durably stores one record. Returns its id. """
+        text = json_util.dumps(payload)
+        with self._lock:
+            record_id = self._db.execute("INSERT INTO records (source_name, kind, payload, size) VALUES (?, ?, ?, ?)",
+                                         (source_name, kind, text, len(text))).lastrowid
+            self._count += 1
+            self._bytes += len(text)
+            self._pending[source_name] = self._pending.get(source_name, 0) + 1
+            if self._bytes > self.max_bytes:
+                self._drop_oldest()
+        return record_id
+
+    def _drop_oldest(self):
+        """ Deletes the oldest records until the spool is back under max_bytes. Caller holds the lock. """
+        excess, dropped = self._bytes - self.max_bytes, []
+        oldest = self._db.execute("SELECT id, source_name, size FROM records ORDER BY id")
+        while excess > 0:
+            record_id, source_name, size = oldest.fetchone()
+            dropped.append((record_id, source_name, size))
+            excess -= size
+        oldest.close()
+        self._delete([d[0] for d in dropped], [(d[1], d[2]) for d in dropped])
+        self.dropped += len(dropped)
+        logging.error("Spool over %.0f MiB: dropped the %d oldest records (%d dropped in total).",
+                      self.max_bytes / 1024 / 1024, len(dropped), self.dropped)
+
+    def _delete(self, ids, sources_and_sizes):
+        """ Deletes records in one transaction and updates the counters. Caller holds the lock. """
+        self._db.execute("BEGIN")
+        self._db.executemany("DELETE FROM records WHERE id = ?", [(i,) for i in ids])
+        self._db.execute("COMMIT")
+        for source_name, size in sources_and_sizes:
+            self._count -= 1
+            self._bytes -= size
+            self._pending[source_name] -= 1
+            if not self._pending[source_name]:
+                del self._pending[source_name]
+
+    def pending(self, source_name=None):
+        """ Number of spooled records, for one source or in total. """
+        with self._lock:
+            return self._count if source_name is None else self._pending.get(source_name, 0)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def peek(self, limit):
+        """ The oldest records, as [(id, source_name, kind, payload)]. They stay spooled until ack()ed. """
+        with self._lock:
+            rows = self._db.execute("SELECT id, source_name, kind, payload FROM records ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(record_id, source_name, kind, json_util.loads(text)) for record_id, source_name, kind, text in rows]
+
+    def ack(self, ids):
+        """ Removes replayed records. Ids that are already gone (dropped by the cap) are ignored. """
+        if not ids:
+            return
+        with self._lock:
+            placeholders = ",".join("?" * len(ids))
+            rows = self._db.execute(f"SELECT id, source_name, size FROM records WHERE id IN ({placeholders})", list(ids)).fetchall()
+            self._delete([r[0] for r in rows], [(r[1], r[2]) for r in rows])
+
+    def compact(self):
+        """ Returns free pages to the filesystem and folds the WAL back into the database file. """
+        with self._lock:
+            self._db.execute("PRAGMA incremental_vacuum")
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
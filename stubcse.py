@@ -0,0 +1,330 @@
+"""
+Minimal in-memory stand-in for the OM2M IN-CSE, for local testing and benchmarks.
+
+Implements the small part of the oneM2M HTTP binding that the scripts in this
+repo rely on: AE/CNT/CIN/SUB creation, attribute updates (PUT), container retrieval with ?rcn=4 (optionally
+filtered by creation time with cra/crb and capped with lim), /la (latest) and notifications to subscribers when a content instance is created.
+Responses can be delayed (globally or per resource subtree) to simulate a slow or
+hung CSE.
+
+Usage:
+    python stubcse.py --port 8080
+or from a script:
+    cse = StubCSE(port=0)
+    base_url = cse.start()   # e.g. http://127.0.0.1:54321
+    ...
+    cse.stop()
+    cse.set_latency("/~/in-cse/in-name/voice_command", 2.0)  # Slow down one subtree
+"""
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+CSE_ID = "in-cse"
+CSE_NAME = "in-name"
+RESOURCE_KEYS = {2: "m2m:ae", 3: "m2m:cnt", 4: "m2m:cin", 23: "m2m:sub"}
+RESOURCE_PREFIXES = {2: "CAE", 3: "cnt-", 4: "cin-", 23: "sub-"}
+
+
+def om2m_timestamp(seconds=None):
+    """ Returns the time (default now) in OM2M's compact format (e.g. 20250410T152836). """
+    return time.strftime("%Y%m%dT%H%M%S", time.localtime(seconds))
+
+
+def parse_resource_type(content_type):
+    """ Extracts the ty= value from a Content-Type header, or None. """
+    for part in (content_type or "").replace(" ", "").split(";"):
+        if part.startswith("ty="):
+            try:
+                return int(part[3:])
+            except ValueError:
+                return None
+    return None
+
+
+class StubCSE:
+    """ Thread-safe in-memory resource tree served over HTTP. """
+
+    def __init__(self, host="127.0.0.1", port=8080, latency=0.0, clock=time.time):
+        self.host = host
+        self.port = port
+        self.clock = clock  # Source of ct/lt; benchmarks can pass a simulated clock
+        self.latency = latency  # Seconds added to every response
+        self.path_latency = {}  # path tuple -> seconds added to requests at or below it
+        self.lock = threading.Lock()
+        self.ids = itertools.count(100000)
+        # path tuple -> {"ty": int, "attrs": dict, "children": [names...]}
+        self.resources = {(): {"ty": 5, "attrs": {"ri": f"/{CSE_ID}", "rn": CSE_NAME}, "children": []}}
+        self.request_count = 0
+        self.notification_queue = queue.Queue()
+        self.server = None
+        self.threads = []
+
+    # --- Induced latency ---
+
+    def set_latency(self, url_path, seconds):
+        """ Delays every request to url_path and its children by seconds (0 removes it). """
+        path = self.split_path(url_path)
+        if seconds:
+            self.path_latency[path] = seconds
+        else:
+            self.path_latency.pop(path, None)
+
+    def latency_for(self, path):
+        """ Global latency plus the one set on the deepest matching subtree. """
+        for depth in range(len(path), -1, -1):
+            if path[:depth] in self.path_latency:
+                return self.latency + self.path_latency[path[:depth]]
+        return self.latency
+
+    # --- Resource tree ---
+
+    def split_path(self, url_path):
+        """ Maps '/~/in-cse/in-name/a/b' (or '/~/in-cse/a/b') to ('a', 'b'). """
+        parts = [p for p in url_path.split("/") if p and p != "~"]
+        if parts and parts[0] == CSE_ID:
+            parts = parts[1:]
+        if parts and parts[0] == CSE_NAME:
+            parts = parts[1:]
+        return tuple(parts)
+
+    def create(self, parent_path, ty, body):
+        """ Creates a child resource. Returns (status, response_body). """
+        key = RESOURCE_KEYS.get(ty)
+        if key is None or not isinstance(body.get(key), dict):
+            return 400, {"m2m:dbg": f"Unsupported or missing resource for ty={ty}"}
+
+        with self.lock:
+            parent = self.resources.get(parent_path)
+            if parent is None:
+                return 404, {"m2m:dbg": "Parent resource not found"}
+
+            num = next(self.ids)
+            rn = body[key].get("rn") or f"{key.split(':')[1]}_{num}"
+            path = parent_path + (rn,)
+            if path in self.resources:
+                return 409, {"m2m:dbg": f"Name already present in the parent collection: {rn}"}
+
+            now = om2m_timestamp(self.clock())
+            attrs = dict(body[key])
+            attrs.update({
+                "ty": ty,
+                "ri": f"/{CSE_ID}/{RESOURCE_PREFIXES[ty]}{num}",
+                "rn": rn,
+                "pi": parent["attrs"]["ri"],
+                "ct": now,
+                "lt": now,
+            })
+            if ty == 3:
+                attrs.setdefault("cni", 0)
+                attrs.setdefault("st", 0)
+            elif ty == 4:
+                con = attrs.get("con", "")
+                attrs.setdefault("cnf", "text/plain:0")
+                attrs["cs"] = len(con) if isinstance(con, str) else len(json.dumps(con))
+                attrs["st"] = 0
+
+            self.resources[path] = {"ty": ty, "attrs": attrs, "children": []}
+            parent["children"].append(rn)
+
+            targets = []
+            if ty == 4:
+                self._enforce_mni(parent_path, parent)
+                targets = [nu for child in parent["children"]
+                           if self.resources[parent_path + (child,)]["ty"] == 23
+                           for nu in self.resources[parent_path + (child,)]["attrs"].get("nu", [])]
+            created = dict(attrs)
+
+        for nu in targets:
+            self.notification_queue.put((nu, {"m2m:sgn": {"nev": {"rep": {key: created}, "net": 3},
+                                                         "sur": parent["attrs"]["ri"]}}))
+        return 201, {key: created}
+
+    def update(self, path, body):
+        """ Updates a resource's attributes (not its identity or timestamps). Returns (status, response_body). """
+        with self.lock:
+            resource = self.resources.get(path)
+            if resource is None:
+                return 404, {"m2m:dbg": "Resource not found"}
+            key = RESOURCE_KEYS.get(resource["ty"])
+            if key is None or not isinstance(body.get(key), dict):
+                return 400, {"m2m:dbg": f"Expected {key} in the update"}
+            fixed = {"ty", "ri", "rn", "pi", "ct"}
+            resource["attrs"].update({k: v for k, v in body[key].items() if k not in fixed})
+            resource["attrs"]["lt"] = om2m_timestamp(self.clock())
+            if resource["ty"] == 3:
+                self._enforce_mni(path, resource)
+            return 200, {key: dict(resource["attrs"])}
+
+    def _enforce_mni(self, parent_path, parent):
+        """ Drops the oldest content instances once a container exceeds its mni (lock held). """
+        mni = parent["attrs"].get("mni")
+        cins = [c for c in parent["children"] if self.resources[parent_path + (c,)]["ty"] == 4]
+        parent["attrs"]["cni"] = len(cins)
+        parent["attrs"]["st"] = parent["attrs"].get("st", 0) + 1
+        if not mni or len(cins) <= mni:
+            return
+        for rn in cins[:len(cins) - mni]:
+            parent["children"].remove(rn)
+            del self.resources[parent_path + (rn,)]
+        parent["attrs"]["cni"] = mni
+
+    def retrieve(self, path, query):
+        """ Retrieves a resource, honouring /la, rcn=4 and cra/crb/lim. Returns (status, response_body). """
+        latest = bool(path) and path[-1] in ("la", "ol")
+        target = path[:-1] if latest else path
+
+        with self.lock:
+            resource = self.resources.get(target)
+            if resource is None:
+                return 404, {"m2m:dbg": "Resource not found"}
+
+            cins = [self.resources[target + (c,)]["attrs"] for c in resource["children"]
+                    if self.resources[target + (c,)]["ty"] == 4]
+            if latest:
+                if not cins:
+                    return 404, {"m2m:dbg": "No content instance"}
+                return 200, {"m2m:cin": dict(cins[-1] if path[-1] == "la" else cins[0])}
+
+            key = RESOURCE_KEYS.get(resource["ty"], "m2m:cb")
+            body = dict(resource["attrs"])
+            if query.get("rcn", [""])[0] == "4":
+                created_after = query.get("cra", [None])[0]
+                created_before = query.get("crb", [None])[0]
+                limit = int(query.get("lim", [0])[0]) or None
+                returned = 0
+                for child in resource["children"]:
+                    child_res = self.resources[target + (child,)]
+                    ct = child_res["attrs"].get("ct", "")
+                    if (created_after and ct <= created_after) or (created_before and ct >= created_before):
+                        continue
+                    if limit is not None and returned >= limit:
+                        break
+                    returned += 1
+                    child_key = RESOURCE_KEYS.get(child_res["ty"])
+                    body.setdefault(child_key, []).append(dict(child_res["attrs"]))
+            return 200, {key: body}
+
+    # --- Notifications ---
+
+    def _notify_worker(self):
+        """ Delivers notifications in creation order, like a single CSE notification thread. """
+        session = requests.Session()
+        while True:
+            item = self.notification_queue.get()
+            if item is None:
+                return
+            nu, payload = item
+            try:
+                session.post(nu, json=payload, headers={"X-M2M-Origin": f"/{CSE_ID}",
+                                                        "Content-Type": "application/json"}, timeout=5)
+            except requests.exceptions.RequestException as e:
+                print(f"[stubcse] Notification to {nu} failed: {e}")
+
+    # --- HTTP server ---
+
+    def _make_handler(self):
+        cse = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, a keep-alive client's
+            # delayed ACK holds every response back ~40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client gave up (e.g. timed out on an induced delay)
+
+            def do_GET(self):
+                cse.request_count += 1
+                url = urlsplit(self.path)
+                path = cse.split_path(url.path)
+                time.sleep(cse.latency_for(path))
+                status, body = cse.retrieve(path, parse_qs(url.query))
+                self._reply(status, body)
+
+            def do_POST(self):
+                cse.request_count += 1
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._reply(400, {"m2m:dbg": "Invalid JSON"})
+                    return
+                ty = parse_resource_type(self.headers.get("Content-Type"))
+                path = cse.split_path(url.path)
+                time.sleep(cse.latency_for(path))
+                status, body = cse.create(path, ty, body)
+                self._reply(status, body)
+
+            def do_PUT(self):
+                cse.request_count += 1
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._reply(400, {"m2m:dbg": "Invalid JSON"})
+                    return
+                path = cse.split_path(url.path)
+                time.sleep(cse.latency_for(path))
+                status, body = cse.update(path, body)
+                self._reply(status, body)
+
+        return Handler
+
+    def start(self):
+        """ Starts serving in background threads. Returns the base URL. """
+        self.server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        for target in (self.server.serve_forever, self._notify_worker):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self.url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.notification_queue.put(None)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a minimal in-memory OM2M stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay every response")
+    args = parser.parse_args()
+
+    cse = StubCSE(args.host, args.port, args.latency)
+    print(f"Stub CSE listening on {cse.start()}/~/{CSE_ID}/{CSE_NAME}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        cse.stop()
@@ -1,15 +1,14 @@
-import requests
-import base64
 import json
 
+import om2m
+
+from audiosession import assemble_wav_buffer
+
 # OM2M server configuration (adjust as needed)
 # For a container with child content instances, you often need to include ?rcn=4.
 SERVER_URL = "http://192.168.158.66:8080/~/in-cse/in-name/voice_command/audio_upload?rcn=4"
 AUTH_CREDENTIALS = ("admin", "admin")
-HEADERS = {
-    "Content-Type": "application/json",
-    "Accept": "application/json"
-}
+client = om2m.OM2MClient(auth=AUTH_CREDENTIALS)
 
 def fetch_om2m_audio_entries():
     """
@@ -17,9 +16,7 @@ def fetch_om2m_audio_entries():
     Returns the JSON data as a dictionary.
     """
     try:
-        response = requests.get(SERVER_URL, auth=AUTH_CREDENTIALS, headers=HEADERS)
-        response.raise_for_status()  # Raise an error for HTTP error codes
-        data = response.json()
+        data = client.get(SERVER_URL)  # Raises an error for HTTP error codes
         print("=== FULL JSON RESPONSE ===")
         print(json.dumps(data, indent=2))
         return data
@@ -80,33 +77,13 @@ def assemble_wav_file(session_data):
     Assemble a WAV file using a session's header and audio chunks.
     The session_data is expected to have:
       - header: Base64 encoded WAV header string
+      - total_chunks: The number of chunks announced in AUDIO_START
       - chunks: A dictionary with chunk indices as keys and Base64 encoded chunk data as values
     Returns:
-      - wav_bytes: A bytes object containing the complete WAV file data,
-                   or None on error.
+      - wav_bytes: A memoryview over one preallocated buffer holding the complete WAV
+                   file data, or None on error (including missing or oversized chunks).
     """
-    if session_data.get("header") is None:
-        print("No WAV header found in session data.")
-        return None
-
-    try:
-        header_bytes = base64.b64decode(session_data["header"])
-    except Exception as e:
-        print("Error decoding header:", e)
-        return None
-
-    wav_data = bytearray(header_bytes)
-    chunks = session_data.get("chunks", {})
-
-    for idx in sorted(chunks.keys()):
-        try:
-            chunk_bytes = base64.b64decode(chunks[idx])
-        except Exception as e:
-            print(f"Error decoding chunk {idx}:", e)
-            return None
-        wav_data.extend(chunk_bytes)
-
-    return wav_data
+    return assemble_wav_buffer(session_data)
 
 def group_audio_session(entries):
     """
@@ -1,24 +1,10 @@
-import requests
-import json
+import om2m
 
-# OM2M base URL (update if your server IP is different)
-OM2M_URL = "http://localhost:8080/~/in-cse/in-name/led"
+# OM2M server (set OM2M_CSE_URL if it is not on this machine)
+client = om2m.OM2MClient(om2m.cse_url())
 
-# Headers required by OM2M
-headers = {
-    "X-M2M-Origin": "admin:admin",
-    "Content-Type": "application/vnd.onem2m-res+json; ty=4"
-}
-
-# Body with command
-payload = {
-    "m2m:cin": {
-        "con": "ON"  # or "OFF"
-    }
-}
-
-# Send POST request
-response = requests.post(OM2M_URL, headers=headers, data=json.dumps(payload))
+# Send the command as a content instance of the led container
+response = client.create_content_instance("led", "ON")  # or "OFF"
 
 # Print response
 print(f"Status Code: {response.status_code}")
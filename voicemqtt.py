@@ -1,38 +1,18 @@
-import requests
-import json
+import om2m
+import provision
 
-# Parent directory where we want to create the new container
-parent_url = "http://192.168.158.66:8080/~/in-cse/in-name/voice_command"
-
-# Name of the new container
-new_container_name = "audio_upload"
-
-# Headers for OM2M
-headers = {
-    "X-M2M-Origin": "admin:admin",
-    "Content-Type": "application/json;ty=3",  # ty=3 for container
-    "Accept": "application/json"
-}
-
-# Body to define the new container
-payload = {
-    "m2m:cnt": {
-        "rn": new_container_name,     # resource name (directory name)
-        "mni": 10,                    # max number of instances (optional)
-        "mbs": 100000                 # max byte size for all content instances (adjust as needed)
-    }
+# The audio upload container of the voice_command AE (also part of om2m_tree.json).
+# OM2M_CSE_URL overrides the server address. An existing container with other limits is updated.
+audio_upload = {
+    "ty": "cnt",
+    "rn": "audio_upload",     # resource name (directory name)
+    "mni": 10,                # max number of instances (optional)
+    "mbs": 100000,            # max byte size for all content instances (adjust as needed)
 }
 
 def create_container():
-    try:
-        response = requests.post(parent_url, headers=headers, data=json.dumps(payload), timeout=10)
-        print("Status Code:", response.status_code)
-        if response.status_code == 201:
-            print(f"Container '{new_container_name}' created successfully.")
-        else:
-            print("Error Response:", response.text)
-    except Exception as e:
-        print("Error during container creation:", e)
+    provision.run([{"ty": "ae", "rn": "voice_command", "api": "app-voice", "rr": True, "children": [audio_upload]}],
+                  om2m.cse_url("http://192.168.158.66:8080"))
 
 if __name__ == "__main__":
     create_container()
@@ -1,33 +1,93 @@
+import time
+PROCESS_START = time.time()  # For the startup report
 import requests
-import base64
+import inspect
 import json
+import logging
 import os
-import time
-import torch # For device check and Sentence Transformers
-import hashlib  # Added for data comparison
-from faster_whisper import WhisperModel # Import here for type hints or general visibility
-from sentence_transformers import SentenceTransformer, util # Import here
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import numpy as np
+# torch, faster_whisper and sentence_transformers are imported by load_models() so the
+# service (and tooling that imports this module) starts without paying for them.
+from audiosession import SessionAssembler, assemble_wav_buffer, decode_wav_bytes, WHISPER_SAMPLE_RATE
+from commandmatcher import CommandMatcher
+from embeddingcache import load_or_encode
+from pipeline import Stage, LatencyTracker
+import actuation
+import homes
+import logsetup
+import metrics
 
 # --- Configuration ---
 # OM2M server config
 SERVER_URL = "http://192.168.158.66:8080/~/in-cse/in-name/voice_command/audio_upload?rcn=4"
 AUTH_CREDENTIALS = ("admin", "admin")
-HEADERS = {
-    "X-M2M-Origin": "admin:admin", # Include originator for OM2M requests
-    "Content-Type": "application/json",
-    "Accept": "application/json"
-}
 OUTPUT_WAV_FILENAME = "output_latest_command.wav" # Changed filename
+DEBUG_DUMP_WAV = False  # Also write each assembled command to OUTPUT_WAV_FILENAME (Whisper reads from memory)
 POLLING_INTERVAL = 4  # Fetch every 4 seconds
-REQUIRE_COMPLETE_SESSIONS = True  # Only process complete sessions
+
+# Intake mode: "push" subscribes to the audio container and receives each content
+# instance as it is created; "poll" fetches ?rcn=4 every POLLING_INTERVAL seconds.
+# Push mode falls back to polling if the subscription or receiver cannot be set up.
+INTAKE_MODE = "push"
+CONTAINER_URL = SERVER_URL.split('?')[0]
+SUBSCRIPTION_NAME = "voiceprocess_sub"
+NOTIFICATION_HOST = "0.0.0.0"  # Interface the local notification receiver binds to
+NOTIFICATION_PORT = 1400
+NOTIFICATION_URL = "http://192.168.158.50:1400/notify"  # Must be reachable from the CSE
+PUSH_RESYNC_INTERVAL = 30  # Safety poll in push mode, catches missed notifications
+SESSION_TTL = 60  # Seconds a partial session is kept without new chunks before it is dropped
+
+# Homes served. None serves the one home of SERVER_URL, notified at NOTIFICATION_URL. A
+# routing table file (homes.py, e.g. "homes.json") serves many: each home gets its own
+# CSE connection pool, intake thread, session assembly, actuation workers and device
+# state, notified at NOTIFICATION_URL/<home name>; the models and ASR workers are shared.
+HOMES_FILE = None
 
 # AI Model Config
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "int8" # Use float16 on GPU, int8 on CPU for performance
-WHISPER_MODEL_SIZE = "large-v3"
+DEVICE = None  # Resolved by resolve_device(): "cuda" if available, else "cpu"
+COMPUTE_TYPE = None  # float16 on GPU, int8 on CPU for performance
+WHISPER_CPU_THREADS = 0  # Threads per Whisper model on CPU (0 = library default); ASR workers set their share
 SENTENCE_TRANSFORMER_MODEL = 'all-mpnet-base-v2'
+SENTENCE_TRANSFORMER_REVISION = None  # Hugging Face branch/tag/commit; the embedding cache is keyed on its commit hash
+EMBEDDING_CACHE_DIR = "embedding_cache"  # Command embeddings persisted here (None disables the cache)
 SIMILARITY_THRESHOLD = 0.2 # Adjust this threshold based on testing (0.0 to 1.0)
 
+# Whisper cascade: tiers run in order until one maps the clip to a command confidently.
+# A tier is confident when the best command scores >= min_score AND beats the best command
+# with a different action by >= margin. The last tier accepts anything above
+# SIMILARITY_THRESHOLD, exactly as the single large-v3 model did before.
+WHISPER_TIERS = [
+    {"model": "base.en", "beam_size": 1, "min_score": 0.6, "margin": 0.1},
+    {"model": "large-v3", "beam_size": 5},
+]
+
+# Pipeline: intake + assembly -> ASR -> actuation, with a bounded queue in front of each stage.
+# ASR runs in worker processes (each loads its own models), so sessions are transcribed
+# concurrently when there are cores for it; 0 runs ASR on one thread in this process.
+ASR_PROCESSES = 1
+MAX_PENDING_SESSIONS = 16  # Decoded sessions waiting for ASR (including during warm-up)
+# Micro-batching: an ASR worker takes up to ASR_BATCH_SIZE sessions, the first plus those
+# completing within ASR_BATCH_WAIT seconds of it, from any home. Each Whisper tier
+# transcribes them in one call through faster-whisper's BatchedInferencePipeline
+# (faster-whisper >= 1.1; older versions transcribe the batch clip by clip), and the texts
+# are matched with one Sentence Transformer encode. 1 transcribes every session on its own.
+ASR_BATCH_SIZE = 8
+ASR_BATCH_WAIT = 0.05
+ACTUATION_WORKERS = 4  # Concurrent OM2M writes per home; commands for the same device stay in order
+ACTUATION_QUEUE_SIZE = 32  # Per home
+QUEUE_PUT_TIMEOUT = 1.0  # Seconds a producer waits on a full stage queue before the oldest item is dropped
+ACTUATION_TIMEOUT = 5  # Seconds before an OM2M actuation request is abandoned
+COALESCE_WINDOW = 0.2  # Seconds a command waits for a newer one for the same device; only the last is written
+ACTUATION_STATE_MAX_AGE = 300  # Seconds the cached device state (warmed from /la) may drop a no-op command
+METRICS_PORT = 9102  # Prometheus /metrics endpoint (None disables it)
+LOG_JSON = True  # Per-poll and per-session logging as JSON lines (logsetup.py); False for plain text
+
 # Command Mapping Config
 # Define the canonical commands and their corresponding structured action
 COMMAND_MAP = {
@@ -59,41 +119,120 @@ COMMAND_MAP = {
 # Get the list of canonical command phrases for embedding
 CANONICAL_COMMANDS = list(COMMAND_MAP.keys())
 
+# Constrained decoding: prime Whisper with the command vocabulary, cap the decode length
+# and stop reading segments once the transcript is exactly a known command.
+CONSTRAINED_DECODING = True
+COMMAND_PROMPT = "Smart home voice commands: " + ", ".join(CANONICAL_COMMANDS) + "."
+COMMAND_HOTWORDS = None  # e.g. "lights lock fan"; needs faster-whisper >= 1.0.2
+COMMAND_MAX_NEW_TOKENS = 16  # Longest command is well under this
+
+log = logging.getLogger("voiceprocess")  # Poll, session and actuation flow; startup still prints
+
 # --- Global Variables for Models (Load Once) ---
-whisper_model: WhisperModel = None
-st_model: SentenceTransformer = None
-known_command_embeddings: torch.Tensor = None
-last_processed_hash = None  # Track the hash of previously processed data
-last_processed_session_id = None  # Track the last processed session ID
+whisper_models: dict = {}  # Model name -> WhisperModel, one per WHISPER_TIERS entry
+batched_whisper_models: dict = {}  # Model name -> BatchedInferencePipeline over it (ASR_BATCH_SIZE > 1)
+st_model = None  # SentenceTransformer
+known_command_embeddings = None  # torch.Tensor
+models_ready = threading.Event()  # Set once every model is loaded and warmed up
+models_failed = threading.Event()  # Set if background loading failed; intake loops stop
+asr_pool = None  # ProcessPoolExecutor of ASR workers when ASR_PROCESSES > 0
+startup_timings = OrderedDict()  # Stage -> seconds, for the startup report
+routing = None  # homes.RoutingTable of the homes served, set by setup_routing()
+# Exact / cached / fuzzy lookups first; the Sentence Transformer only when none is confident
+command_matcher = CommandMatcher(COMMAND_MAP, embed_match=lambda text: embedding_match(text),
+                                 embed_match_many=lambda texts: embedding_match_many(texts))
+# Shared by every home: batches of (home, session_id, audio, completed_at). Each home has its
+# own actuation stage (see setup_home) carrying (home, session_id, action, completed_at).
+asr_stage = Stage("asr", lambda jobs: run_asr_stage(jobs), workers=max(1, ASR_PROCESSES),
+                  maxsize=MAX_PENDING_SESSIONS, put_timeout=QUEUE_PUT_TIMEOUT,
+                  batch_size=ASR_BATCH_SIZE, batch_wait=ASR_BATCH_WAIT)
+e2e_latency = LatencyTracker()  # Session complete -> actuation sent
+
+# --- Metrics (served on METRICS_PORT; ASR worker processes send theirs back with each result) ---
+assembly_seconds = metrics.Histogram("voice_session_assembly_seconds", "WAV assembly and decode time per session.")
+whisper_seconds = metrics.Histogram("voice_whisper_seconds", "Whisper transcription time per tier.", ["model"])
+nlu_seconds = metrics.Histogram("voice_nlu_seconds", "Command matching time per matcher layer.", ["layer"])
+actuation_seconds = metrics.Histogram("voice_actuation_seconds", "OM2M actuation request latency.", ["device", "outcome"])
+e2e_seconds = metrics.Histogram("voice_end_to_end_seconds", "Session complete to actuation sent.")
+actuation_commands_total = metrics.Counter("voice_actuation_commands_total",
+                                           "Recognized commands by outcome (written, noop, coalesced, failed).",
+                                           ["device", "outcome"])
+sessions_total = metrics.Counter("voice_sessions_total", "Complete sessions by outcome.", ["outcome"])
+asr_batch_size = metrics.Histogram("voice_asr_batch_size", "Sessions per ASR batch.", buckets=metrics.COUNT_BUCKETS)
+metrics.Gauge("voice_asr_queue_depth", "Sessions waiting for ASR.", fn=lambda: asr_stage.depth)
+metrics.Gauge("voice_actuation_queue_depth", "Actions waiting for actuation, all homes.",
+              fn=lambda: sum(home.actuation_stage.depth for home in routing or ()))
+metrics.Gauge("voice_homes", "Homes served.", fn=lambda: len(routing or ()))
+
+# --- Model Loading Functions ---
+def resolve_device():
+    """ Imports torch (once) and picks DEVICE / COMPUTE_TYPE. """
+    global DEVICE, COMPUTE_TYPE
+    if DEVICE is None:
+        st_import = time.time()
+        import torch
+        startup_timings.setdefault("import torch", time.time() - st_import)
+        DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+        COMPUTE_TYPE = "float16" if DEVICE == "cuda" else "int8"
+    return DEVICE
 
-# --- Model Loading Function ---
 def load_models():
-    global whisper_model, st_model, known_command_embeddings
-    if whisper_model is not None and st_model is not None:
+    global st_model, known_command_embeddings
+    if len(whisper_models) == len(WHISPER_TIERS) and st_model is not None:
         print("Models already loaded.")
         return True
 
-    print(f"Attempting to load models on device: {DEVICE}")
     try:
-        # Load Whisper model (using faster-whisper)
-        print(f"Loading Whisper model: {WHISPER_MODEL_SIZE}...")
-        st_whisper = time.time()
-        # Lazy loading, will download model on first use if not cached
-        whisper_model = WhisperModel(WHISPER_MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE)
-        print(f"Whisper model loaded in {time.time() - st_whisper:.2f} seconds.")
+        resolve_device()
+        print(f"Attempting to load models on device: {DEVICE}")
+        st_import = time.time()
+        from faster_whisper import WhisperModel
+        startup_timings["import faster_whisper"] = time.time() - st_import
+        st_import = time.time()
+        from sentence_transformers import SentenceTransformer
+        startup_timings["import sentence_transformers"] = time.time() - st_import
+
+        # Load one Whisper model per tier (using faster-whisper)
+        for tier in WHISPER_TIERS:
+            if tier["model"] in whisper_models:
+                continue
+            print(f"Loading Whisper model: {tier['model']}...")
+            st_whisper = time.time()
+            # Lazy loading, will download model on first use if not cached
+            whisper_models[tier["model"]] = WhisperModel(tier["model"], device=DEVICE, compute_type=COMPUTE_TYPE,
+                                                         cpu_threads=WHISPER_CPU_THREADS)
+            startup_timings[f"load whisper {tier['model']}"] = time.time() - st_whisper
+            print(f"Whisper model loaded in {time.time() - st_whisper:.2f} seconds.")
+        if ASR_BATCH_SIZE > 1:
+            try:
+                from faster_whisper import BatchedInferencePipeline
+                for tier in WHISPER_TIERS:
+                    pipeline = BatchedInferencePipeline(model=whisper_models[tier["model"]])
+                    unsupported = unsupported_batched_options(pipeline)
+                    if unsupported:
+                        print(f"Batched transcription with {tier['model']} does not take {', '.join(unsupported)}; "
+                              f"its ASR batches are transcribed clip by clip.")
+                        continue
+                    batched_whisper_models[tier["model"]] = pipeline
+            except ImportError:
+                print("faster-whisper < 1.1 has no BatchedInferencePipeline; ASR batches are transcribed clip by clip.")
 
         # Load Sentence Transformer model
         print(f"Loading Sentence Transformer model: {SENTENCE_TRANSFORMER_MODEL}...")
         st_st = time.time()
         # Model will be downloaded if not cached
-        st_model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL, device=DEVICE)
+        st_model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL, device=DEVICE, revision=SENTENCE_TRANSFORMER_REVISION)
+        startup_timings[f"load {SENTENCE_TRANSFORMER_MODEL}"] = time.time() - st_st
         print(f"Sentence Transformer model loaded in {time.time() - st_st:.2f} seconds.")
 
-        # Pre-compute embeddings for known commands
+        # Pre-compute embeddings for known commands (reused from the on-disk cache where possible)
         print("Computing known command embeddings...")
         st_emb = time.time()
-        known_command_embeddings = st_model.encode(CANONICAL_COMMANDS, convert_to_tensor=True, device=DEVICE)
+        known_command_embeddings = load_command_embeddings()
+        startup_timings["command embeddings"] = time.time() - st_emb
         print(f"Command embeddings computed in {time.time() - st_emb:.2f} seconds.")
+
+        warm_up_models()
         print("--- Models loaded successfully ---")
         return True
 
@@ -108,37 +247,109 @@ def load_models():
             print("This might be a CUDA setup issue. Ensure PyTorch was installed with the correct CUDA version for your GPU.")
         return False
 
+def load_command_embeddings():
+    """ Embeddings of CANONICAL_COMMANDS as a tensor on DEVICE, encoding only phrases not in the cache. """
+    import torch
+    if EMBEDDING_CACHE_DIR is None:
+        return st_model.encode(CANONICAL_COMMANDS, convert_to_tensor=True, device=DEVICE)
+
+    def encode(phrases):
+        return st_model.encode(phrases, convert_to_numpy=True, device=DEVICE)
+
+    embeddings, stats = load_or_encode(CANONICAL_COMMANDS, encode, SENTENCE_TRANSFORMER_MODEL,
+                                       SENTENCE_TRANSFORMER_REVISION, EMBEDDING_CACHE_DIR)
+    print(f"Command embeddings: {stats['cached']} from cache, {stats['encoded']} encoded.")
+    return torch.tensor(np.asarray(embeddings), device=DEVICE)
+
+def warm_up_models():
+    """ Runs one throwaway inference per model so the first real command doesn't pay for it. """
+    silence = np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)
+    for tier in WHISPER_TIERS:
+        st_first = time.time()
+        transcribe_audio(tier["model"], silence, tier.get("beam_size", 5))
+        startup_timings[f"first inference {tier['model']}"] = time.time() - st_first
+    st_first = time.time()
+    embedding_match("warm up")
+    startup_timings["first inference encoder"] = time.time() - st_first
+
+def start_model_loading():
+    """
+    Loads models (or starts the ASR worker pool) in a background thread so intake can start
+    immediately. Sessions that complete meanwhile wait in the ASR queue until models are ready.
+    """
+    def loader():
+        if not (start_asr_pool() if ASR_PROCESSES > 0 else load_models()):
+            models_failed.set()
+            print("Model loading failed. Queued sessions will not be processed.")
+            return
+        startup_timings["ready (since process start)"] = time.time() - PROCESS_START
+        print_startup_report()
+        if asr_stage.depth:
+            print(f"Processing {asr_stage.depth} session(s) queued during warm-up.")
+        models_ready.set()
+
+    threading.Thread(target=loader, name="model-loader", daemon=True).start()
+
+def start_asr_pool():
+    """
+    Starts ASR_PROCESSES worker processes that each load their own models, splitting the
+    CPU threads between them. Returns True once the pool answers, False if a worker failed.
+    """
+    global asr_pool
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    cpu_threads = max(1, (os.cpu_count() or 1) // ASR_PROCESSES)
+    print(f"Starting {ASR_PROCESSES} ASR worker process(es), {cpu_threads} CPU thread(s) each...")
+    st_pool = time.time()
+    # spawn, not fork: this process already runs intake threads
+    asr_pool = ProcessPoolExecutor(ASR_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_asr_worker, initargs=(cpu_threads,))
+    try:
+        # Workers load models in their initializer, so these return once a worker is ready
+        workers = {f.result() for f in [asr_pool.submit(os.getpid) for _ in range(ASR_PROCESSES)]}
+    except Exception as e:  # BrokenProcessPool when a worker's initializer fails
+        print(f"ASR worker pool failed to start: {e}")
+        return False
+    startup_timings[f"ASR worker pool ({ASR_PROCESSES} process(es))"] = time.time() - st_pool
+    print(f"ASR worker pool ready ({len(workers)} worker(s) answered).")
+    return True
+
+def init_asr_worker(cpu_threads):
+    """ ASR worker process initializer: loads this process's own copy of the models. """
+    global WHISPER_CPU_THREADS
+    WHISPER_CPU_THREADS = cpu_threads
+    logsetup.configure_logging(json_lines=LOG_JSON)
+    import torch
+    torch.set_num_threads(cpu_threads)
+    if not load_models():
+        raise RuntimeError("ASR worker could not load models")
+
+def print_startup_report():
+    """ Breakdown of where startup time went: imports, model loads and first inference. """
+    print("--- Startup report ---")
+    for stage, seconds in startup_timings.items():
+        print(f"  {stage:<40} {seconds:8.2f} s")
+
 # --- OM2M Fetching and Audio Assembly Functions (User Provided) ---
 
-def fetch_om2m_audio_entries():
-    """ Fetches audio entries from OM2M. """
-    print(f"Fetching audio entries from: {SERVER_URL}")
+def fetch_om2m_audio_entries(home):
+    """ Fetches the home's audio entries from OM2M. """
+    log.debug("Fetching audio entries from: %s", home.audio_url)
     try:
-        response = requests.get(SERVER_URL, auth=AUTH_CREDENTIALS, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
+        data = home.client.get(home.audio_url, params={"rcn": 4})
         # print("=== FULL JSON RESPONSE ===") # Optional: uncomment for debugging
         # print(json.dumps(data, indent=2))
         return data
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching audio data from OM2M: {e}")
+        log.error("Error fetching audio data from OM2M: %s", e, extra={'home': home.name})
         return {}
     except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response from OM2M: {e}")
-        print(f"Response text: {response.text[:500]}...") # Log part of the response
+        log.error("Error decoding JSON response from OM2M: %s", e, extra={'home': home.name, 'response_text': e.doc[:500]})
         return {}
     except Exception as e:
-        print(f"An unexpected error occurred during fetching: {e}")
+        log.error("An unexpected error occurred during fetching: %s", e, extra={'home': home.name})
         return {}
 
-def calculate_data_hash(data):
-    """Calculate a hash representing the data content."""
-    if not data:
-        return "empty_data"
-    # Convert data to a consistent string representation and hash it
-    data_str = json.dumps(data, sort_keys=True)
-    return hashlib.md5(data_str.encode()).hexdigest()
-
 def extract_entries_from_container(data):
     """ Extracts entries from typical OM2M container response. """
     if "m2m:cnt" in data:
@@ -151,7 +362,7 @@ def extract_entries_from_container(data):
             elif isinstance(entries, list):
                 return entries
             else:
-                print(f"Warning: Unexpected type for 'm2m:cin': {type(entries)}")
+                log.warning("Unexpected type for 'm2m:cin': %s", type(entries))
                 return []
     return [] # Return empty list if keys not found
 
@@ -161,14 +372,14 @@ def parse_entries(data):
     # Prioritize 'm2m:cnt' structure
     entries = extract_entries_from_container(data)
     if entries:
-        print(f"Found {len(entries)} entries under 'm2m:cnt'.")
+        log.debug("Found %d entries under 'm2m:cnt'.", len(entries))
         return entries
 
     # Fallback: Check if data itself is a list of CINs (less common)
     if isinstance(data, list):
           # Check if elements look like CINs
           if data and isinstance(data[0], dict) and data[0].get('ty') == 4:
-              print(f"Found {len(data)} entries directly in list.")
+              log.debug("Found %d entries directly in list.", len(data))
               return data
 
     # Fallback: Check if it's a response with a list under 'm2m:rsp' -> 'pc' -> 'm2m:cnt' -> 'm2m:cin'
@@ -180,421 +391,654 @@ def parse_entries(data):
             # Now check if 'pc' contains the container structure
             pc_entries = extract_entries_from_container(pc)
             if pc_entries:
-                print(f"Found {len(pc_entries)} entries under 'm2m:rsp/pc/m2m:cnt'.")
+                log.debug("Found %d entries under 'm2m:rsp/pc/m2m:cnt'.", len(pc_entries))
                 return pc_entries
 
-    print("Could not find 'm2m:cin' entries in the expected structures.")
+    log.warning("Could not find 'm2m:cin' entries in the expected structures.")
     return []
 
 
-def group_audio_session(entries):
-    """ Groups audio messages by session ID. """
-    sessions = {}
-    print(f"Grouping {len(entries)} entries into sessions...")
-    for entry in entries:
-        # Check if entry is a dictionary and has 'con' key
-        if not isinstance(entry, dict) or "con" not in entry:
-            print(f"Skipping invalid entry: {entry}")
-            continue
-
-        message = entry["con"]
-        if not isinstance(message, str):
-            print(f"Skipping entry with non-string content: {message}")
-            continue
-
-        try:
-            if message.startswith("AUDIO_START:"):
-                parts = message.split(":", 3) # Split max 3 times
-                if len(parts) == 4:
-                    session_id, total_chunks_str, header_encoded = parts[1], parts[2], parts[3]
-                    total_chunks = int(total_chunks_str)
-                    sessions[session_id] = {
-                        "header": header_encoded, "total_chunks": total_chunks,
-                        "chunks": {}, "end": False
-                    }
-                else: print(f"Malformed AUDIO_START: {message}")
-            elif message.startswith("AUDIO_CHUNK:"):
-                parts = message.split(":", 3) # Split max 3 times
-                if len(parts) == 4:
-                    session_id, chunk_index_str, chunk_encoded = parts[1], parts[2], parts[3]
-                    chunk_index = int(chunk_index_str)
-                    if session_id not in sessions: # Handle chunk before start (unlikely but possible)
-                        sessions[session_id] = {"header": None, "total_chunks": 0, "chunks": {}, "end": False}
-                    sessions[session_id]["chunks"][chunk_index] = chunk_encoded
-                else: print(f"Malformed AUDIO_CHUNK: {message}")
-            elif message.startswith("AUDIO_END:"):
-                parts = message.split(":", 1) # Split max 1 time
-                if len(parts) == 2:
-                    session_id = parts[1]
-                    if session_id in sessions:
-                        sessions[session_id]["end"] = True
-                    else: # Handle end before start/chunk (unlikely)
-                        sessions[session_id] = {"header": None, "total_chunks": 0, "chunks": {}, "end": True}
-                else: print(f"Malformed AUDIO_END: {message}")
-        except ValueError:
-             print(f"Error parsing numeric part in message: {message}")
-        except Exception as e:
-             print(f"Unexpected error processing message '{message}': {e}")
-
-    print(f"Found {len(sessions)} unique session IDs.")
-    return sessions
-
-def is_session_complete(session_data):
-    """Check if a session is complete (has all chunks and end marker)."""
-    # Verify we have header, all chunks, and end marker
-    if not session_data or session_data.get("header") is None:
-        # print("Session incomplete: Missing header") # Too noisy if always incomplete
-        return False
-
-    expected_chunks = session_data.get("total_chunks", 0)
-    received_chunks = len(session_data.get("chunks", {}))
-
-    if expected_chunks <= 0:
-        # print("Session incomplete: Invalid expected chunk count") # Too noisy
-        return False
-
-    if received_chunks != expected_chunks:
-        # print(f"Session incomplete: Missing chunks (expected {expected_chunks}, got {received_chunks})") # Too noisy
-        return False
-
-    if not session_data.get("end", False):
-        # print("Session incomplete: Missing end marker") # Too noisy
-        return False
+def assemble_wav_file(session_data):
+    """
+    Assembles WAV data from session header and chunks into one preallocated buffer.
+    Returns a memoryview over it, or None if chunks are missing, out of range or oversized.
+    """
+    if session_data:
+        log.debug("Assembling WAV from %d received chunks.", len(session_data.get('chunks', {})))
+    return assemble_wav_buffer(session_data)
+
+# --- AI Processing Functions ---
+WHISPER_WINDOW_SECONDS = 30  # Whisper decodes 30 s windows; a batch gives each clip its own
+def transcription_options(beam_size):
+    """ Keyword arguments for WhisperModel.transcribe, including the constrained-decoding ones. """
+    options = {"beam_size": beam_size, "language": "en"}
+    if CONSTRAINED_DECODING:
+        options.update(initial_prompt=COMMAND_PROMPT, without_timestamps=True,
+                       condition_on_previous_text=False, max_new_tokens=COMMAND_MAX_NEW_TOKENS)
+        if COMMAND_HOTWORDS:
+            options["hotwords"] = COMMAND_HOTWORDS
+    return options
+
+def transcribe_audio(model_name, audio, beam_size):
+    """ Transcribes audio (English only) with one loaded Whisper model. Returns (text, seconds). """
+    st_transcribe = time.time()
+    # Segments are generated lazily; stop pulling them once the text is a known command
+    segments, info = whisper_models[model_name].transcribe(audio, **transcription_options(beam_size))
+    texts = []
+    for segment in segments:
+        texts.append(segment.text)
+        if CONSTRAINED_DECODING and command_matcher.is_exact(" ".join(texts)):
+            break
+    recognized_text = " ".join(texts).strip()
+    duration = time.time() - st_transcribe
+    whisper_seconds.labels(model_name).observe(duration)
+    return recognized_text, duration
+
+def batched_transcription_options(beam_size):
+    """ transcription_options for BatchedInferencePipeline.transcribe: every window is decoded on its own. """
+    options = transcription_options(beam_size)
+    options.pop("condition_on_previous_text", None)
+    return options
+
+def unsupported_batched_options(pipeline):
+    """ The keywords transcribe_batch passes that this faster-whisper's batched transcribe doesn't take. """
+    parameters = inspect.signature(pipeline.transcribe).parameters
+    if any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return []
+    needed = ["batch_size", "vad_filter", "clip_timestamps", *batched_transcription_options(1)]
+    return [name for name in needed if name not in parameters]
+
+def transcribe_batch(model_name, audios, beam_size):
+    """
+    Transcribes several clips with one batched Whisper call. Returns ([text, ...], seconds).
+    Each clip gets a 30 s window of its own (Whisper pads every window to 30 s anyway, and
+    longer clips are cut there), and the windows are decoded as one batch by the model's
+    BatchedInferencePipeline. A single clip, or a model without a pipeline, goes through
+    transcribe_audio clip by clip.
+    """
+    pipeline = batched_whisper_models.get(model_name)
+    if pipeline is None or len(audios) == 1:
+        results = [transcribe_audio(model_name, audio, beam_size) for audio in audios]
+        return [text for text, _ in results], sum(duration for _, duration in results)
+
+    st_transcribe = time.time()
+    window = WHISPER_WINDOW_SECONDS * WHISPER_SAMPLE_RATE
+    packed = np.zeros(window * len(audios), dtype=np.float32)
+    for index, audio in enumerate(audios):
+        if isinstance(audio, str):
+            from faster_whisper import decode_audio
+            audio = decode_audio(audio, sampling_rate=WHISPER_SAMPLE_RATE)
+        clip = audio[:window]
+        packed[index * window:index * window + len(clip)] = clip
+    # The keywords were checked against this pipeline when it was loaded (unsupported_batched_options)
+    segments, info = pipeline.transcribe(packed, batch_size=len(audios), vad_filter=False,
+                                         clip_timestamps=[{"start": index * window, "end": (index + 1) * window}
+                                                          for index in range(len(audios))],
+                                         **batched_transcription_options(beam_size))
+    texts = [[] for _ in audios]
+    for segment in segments:
+        texts[min(int(segment.start // WHISPER_WINDOW_SECONDS), len(audios) - 1)].append(segment.text)
+    duration = time.time() - st_transcribe
+    for _ in audios:
+        whisper_seconds.labels(model_name).observe(duration / len(audios))  # Per clip, amortized
+    return [" ".join(clip_texts).strip() for clip_texts in texts], duration
+
+def match_commands(recognized_texts):
+    """
+    Finds the canonical command for each text through the layered matcher; the texts the
+    cheaper layers miss share one encode. Returns [(command_phrase, best_score, margin)],
+    where margin is the gap to the best scoring command that maps to a different action.
+    """
+    st_nlu = time.time()
+    matches = command_matcher.match_many(recognized_texts)
+    nlu_duration = time.time() - st_nlu
+    for phrase, best_score, margin, layer in matches:
+        nlu_seconds.labels(layer).observe(nlu_duration / len(matches))  # Per text, amortized
+        log.info("NLU processed in %.3fs (%s layer, batch of %d). Best command match: '%s' with score: %.4f (margin %.4f)",
+                 nlu_duration, layer, len(matches), phrase, best_score, margin,
+                 extra={'layer': layer, 'nlu_seconds': round(nlu_duration, 4), 'command': phrase, 'score': round(best_score, 4)})
+    return [match[:3] for match in matches]
+
+def embedding_match(recognized_text):
+    """ Sentence Transformer fallback for the matcher: cosine similarity against all commands. """
+    return embedding_match_many([recognized_text])[0]
+
+def embedding_match_many(recognized_texts):
+    """ embedding_match for a batch of texts with one encode. Returns [(phrase, score, margin)]. """
+    import torch  # Already loaded by load_models(); these are sys.modules lookups
+    from sentence_transformers import util
+
+    recognized_embeddings = st_model.encode(list(recognized_texts), convert_to_tensor=True, device=DEVICE,
+                                            batch_size=len(recognized_texts))
+
+    # Compute cosine similarities, one row per text
+    results = []
+    for cosine_scores in util.cos_sim(recognized_embeddings, known_command_embeddings):
+        # Find the best match
+        best_match_idx = torch.argmax(cosine_scores).item()
+        best_score = cosine_scores[best_match_idx].item()
+        matched_command_phrase = CANONICAL_COMMANDS[best_match_idx]
+        best_action = COMMAND_MAP[matched_command_phrase]
+        runner_up = max((score for phrase, score in zip(CANONICAL_COMMANDS, cosine_scores.tolist())
+                         if COMMAND_MAP[phrase] != best_action), default=0.0)
+        results.append((matched_command_phrase, best_score, best_score - runner_up))
+    return results
 
-    # All checks passed
-    return True
+def process_audio_command(audio, label="audio"):
+    """
+    Transcribes audio using the Whisper cascade (English only) and maps recognized text
+    to a command using Sentence Transformers and cosine similarity. Small tiers answer
+    when confident; low-confidence clips are re-run on the next (larger) tier.
+    audio is either a 16 kHz mono float32 NumPy array (see decode_wav_bytes) or a file path.
+    """
+    if isinstance(audio, str):
+        if not os.path.exists(audio):
+            log.error("Audio file not found at %s", audio)
+            return None
+        label = audio
+    return process_audio_batch([(audio, label)])[0]
 
-def assemble_wav_file(session_data):
-    """ Assembles WAV bytes from session header and chunks. """
-    if not session_data or session_data.get("header") is None:
-        print("Error: No header found in session data for assembly.")
-        return None
+def process_audio_batch(clips):
+    """
+    process_audio_command for a batch of (audio, label) clips. Each tier transcribes the
+    clips still undecided in one batched call and matches their texts together; clips it
+    is not confident about move on to the next tier as a (smaller) batch.
+    Returns the actions (or None) in clip order.
+    """
+    if len(whisper_models) < len(WHISPER_TIERS) or st_model is None:
+        log.error("Models not loaded. Cannot process audio.")
+        return [None] * len(clips)
 
+    actions = [None] * len(clips)
+    pending = list(range(len(clips)))  # Clips no tier has decided yet
     try:
-        header_bytes = base64.b64decode(session_data["header"])
-    except Exception as e:
-        print(f"Error decoding base64 header: {e}")
-        return None
+        for tier_index, tier in enumerate(WHISPER_TIERS):
+            if not pending:
+                break
+            is_last_tier = tier_index == len(WHISPER_TIERS) - 1
+
+            # 1. Transcribe Audio using faster-whisper
+            log.debug("Transcribing %d clip(s) with %s (tier %d/%d, English only)...", len(pending), tier['model'],
+                      tier_index + 1, len(WHISPER_TIERS))
+            texts, duration = transcribe_batch(tier["model"], [clips[i][0] for i in pending], tier.get("beam_size", 5))
+            escalated, recognized = [], []
+            for i, recognized_text in zip(pending, texts):
+                log.info("Whisper recognized: '%s' (in %.2fs)", recognized_text, duration,
+                         extra={'model': tier['model'], 'whisper_seconds': round(duration, 4), 'batch': len(pending),
+                                'clip': clips[i][1]})
+                if recognized_text:
+                    recognized.append((i, recognized_text))
+                else:
+                    log.info("Whisper recognized empty text.", extra={'model': tier['model'], 'clip': clips[i][1]})
+                    if not is_last_tier:
+                        escalated.append(i)
+
+            # 2. NLU: Find most similar command using Sentence Transformers
+            matches = match_commands([text for _, text in recognized]) if recognized else []
+
+            # 3. Map to Action (Apply threshold, or the tier's confidence bar before the last tier)
+            for (i, recognized_text), (matched_command_phrase, best_score, margin) in zip(recognized, matches):
+                if is_last_tier:
+                    accepted = best_score >= SIMILARITY_THRESHOLD
+                else:
+                    accepted = (best_score >= tier.get("min_score", SIMILARITY_THRESHOLD)
+                                and margin >= tier.get("margin", 0.0))
+                    if not accepted:
+                        log.info("Low confidence on %s. Escalating to %s.", tier['model'], WHISPER_TIERS[tier_index + 1]['model'])
+                        escalated.append(i)
+                        continue
+
+                if not accepted:
+                    log.info("Command similarity (%.4f) below threshold (%s). Ignoring.", best_score, SIMILARITY_THRESHOLD)
+                    continue
+
+                action_details = COMMAND_MAP[matched_command_phrase]
+                log.info("Command accepted. Action: %s", action_details)
+                # Add confidence score to the action details
+                action_details_with_score = action_details.copy()
+                action_details_with_score['confidence'] = best_score
+                action_details_with_score['recognized_text'] = recognized_text # Include original text
+                action_details_with_score['whisper_model'] = tier['model']
+                actions[i] = action_details_with_score
+            pending = sorted(escalated)
+        return actions
 
-    wav_data = bytearray(header_bytes)
-    chunks = session_data.get("chunks", {})
-    received_indices = sorted(chunks.keys())
-
-    # Check for missing chunks if total_chunks is reliable
-    expected_chunks = session_data.get("total_chunks", 0)
-    if expected_chunks > 0 and len(received_indices) != expected_chunks:
-        print(f"Warning: Mismatch! Expected {expected_chunks}, Got {len(received_indices)} chunks.")
-        # Optional: Check for sequence gaps
-        expected_indices = set(range(expected_chunks))
-        missing = expected_indices - set(received_indices)
-        if missing:
-            print(f"Missing chunk indices: {sorted(list(missing))}")
-            # Decide if you want to proceed despite missing chunks
-            # return None # Uncomment to fail if chunks are missing
-
-    print(f"Assembling WAV from {len(received_indices)} received chunks.")
-    for idx in received_indices:
-        try:
-            chunk_bytes = base64.b64decode(chunks[idx])
-            wav_data.extend(chunk_bytes)
-        except Exception as e:
-            print(f"Error decoding base64 for chunk {idx}: {e}")
-            return None # Fail assembly if a chunk is corrupt
-
-    return bytes(wav_data) # Return immutable bytes
+    except Exception as e:
+        log.exception("Error during AI processing: %s", e)  # With the traceback, for debugging
+        return actions
 
-# --- AI Processing Function ---
-def process_audio_command(audio_path):
+# --- OM2M Interaction ---
+def execute_om2m_action(action_details, home):
     """
-    Transcribes audio using Whisper (English only) and maps recognized text to a command
-    using Sentence Transformers and cosine similarity.
+    Hands a recognized action to the home's actuator. Returns a Future resolving to the
+    command's outcome (see actuation.OUTCOMES), or None if there is nothing to write.
     """
-    global whisper_model, st_model, known_command_embeddings # Use global models
-
-    if whisper_model is None or st_model is None:
-        print("Error: Models not loaded. Cannot process audio.")
+    if not action_details:
+        log.info("No action to execute.")
         return None
 
-    if not os.path.exists(audio_path):
-        print(f"Error: Audio file not found at {audio_path}")
+    log.debug("Executing OM2M action for %s: %s", home.name, action_details)
+    command = actuation.command_content(action_details)
+    if command is None or command[0] not in home.devices:
+        log.warning("Could not determine target URI or payload for the action: %s", action_details)
         return None
-
+    device, payload_con = command
+    future = home.actuator.submit(device, payload_con)
+    future.add_done_callback(lambda f: actuation_commands_total.labels(device, f.result()).inc())
+    return future
+
+def write_actuation(home, device, payload_con):
+    """ Creates the content instance that actuates the home's device. Returns True on success. Runs on actuator threads. """
+    full_target_url = home.device_url(device)
+    st_actuation = time.perf_counter()
+    outcome = "error"
     try:
-        # 1. Transcribe Audio using faster-whisper
-        print(f"Transcribing '{audio_path}' with {WHISPER_MODEL_SIZE} (English only)...")
-        st_transcribe = time.time()
-        # Transcribe returns an iterator -> convert to list
-        # *** MODIFICATION HERE: Specify language="en" ***
-        segments, info = whisper_model.transcribe(audio_path, beam_size=5, language="en")
-        # *********************************************
-        recognized_text = " ".join([segment.text for segment in segments]).strip()
-        duration = time.time() - st_transcribe
-        print(f"Whisper recognized: '{recognized_text}' (in {duration:.2f}s)")
-        # The language detection info might still be available but less relevant as we forced English
-        # print(f"Detected language (Note: Forced English): {info.language} (probability {info.language_probability:.2f})")
-
-
-        if not recognized_text:
-            print("Whisper recognized empty text.")
-            return None
-
-        # 2. NLU: Find most similar command using Sentence Transformers
-        st_nlu = time.time()
-        recognized_embedding = st_model.encode(recognized_text, convert_to_tensor=True, device=DEVICE)
-
-        # Compute cosine similarities
-        cosine_scores = util.cos_sim(recognized_embedding, known_command_embeddings)[0]
-
-        # Find the best match
-        best_match_idx = torch.argmax(cosine_scores).item()
-        best_score = cosine_scores[best_match_idx].item()
-        matched_command_phrase = CANONICAL_COMMANDS[best_match_idx]
-        nlu_duration = time.time() - st_nlu
-        print(f"NLU processed in {nlu_duration:.3f}s")
-        print(f"Best command match: '{matched_command_phrase}' with score: {best_score:.4f}")
-
-        # 3. Map to Action (Apply threshold)
-        if best_score >= SIMILARITY_THRESHOLD:
-            action_details = COMMAND_MAP[matched_command_phrase]
-            print(f"Command accepted. Action: {action_details}")
-            # Add confidence score to the action details
-            action_details_with_score = action_details.copy()
-            action_details_with_score['confidence'] = best_score
-            action_details_with_score['recognized_text'] = recognized_text # Include original text
-            return action_details_with_score
+        log.debug("Sending POST to %s", full_target_url)
+        response = home.client.create_content_instance(full_target_url, payload_con, timeout=ACTUATION_TIMEOUT)
+        log.debug("OM2M response %s: %s", response.status_code, response.text[:200])  # First 200 chars of the body
+
+        # More detailed status reporting
+        if response.status_code in [200, 201]:
+            outcome = "ok"
+            log.info("OM2M command successful (status %s): %s -> %s", response.status_code, device, payload_con,
+                     extra={'home': home.name, 'device': device, 'status': response.status_code})
         else:
-            print(f"Command similarity ({best_score:.4f}) below threshold ({SIMILARITY_THRESHOLD}). Ignoring.")
-            return None
+            outcome = f"http_{response.status_code}"
+            log.warning("OM2M command returned status %s: %s -> %s", response.status_code, device, payload_con,
+                        extra={'home': home.name, 'device': device, 'status': response.status_code})
 
+    except requests.exceptions.RequestException as e:
+        outcome = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+        log.error("Error sending command to OM2M: %s", e, extra={'home': home.name, 'device': device})
     except Exception as e:
-        print(f"Error during AI processing: {e}")
-        import traceback
-        traceback.print_exc() # Print detailed traceback for debugging
-        return None
+        log.error("Unexpected error during OM2M command execution: %s", e, extra={'home': home.name, 'device': device})
+    actuation_seconds.labels(device, outcome).observe(time.perf_counter() - st_actuation)
+    return outcome == "ok"
 
-# --- OM2M Interaction Function (Placeholder) ---
-def execute_om2m_action(action_details):
+def warm_actuation_state():
     """
-    Placeholder function to send commands back to OM2M based on action_details.
-    Replace this with your actual OM2M client logic.
+    Seeds each home's actuator with the latest content of its device containers, so a
+    first no-op command is dropped. Homes are read in parallel; a slow one only delays itself.
+    main() runs this on its own thread, so intake never waits for it: until a device's
+    state is known, its commands are written whatever they are.
     """
-    if not action_details:
-        print("No action to execute.")
-        return
+    def warm(home):
+        def read_latest(device):
+            cin = home.client.latest(home.device_url(device), timeout=ACTUATION_TIMEOUT)
+            return cin.get('con') if cin else None
+        return home.actuator.warm(read_latest, devices=list(home.devices))
+
+    st_warm = time.time()
+    with ThreadPoolExecutor(max_workers=min(16, len(routing))) as pool:
+        known = dict(zip((home.name for home in routing), pool.map(warm, routing)))
+    startup_timings["actuation state from /la"] = time.time() - st_warm
+    for name, state in list(known.items())[:10]:
+        print(f"Actuation state of {name}: {', '.join(f'{device}={con}' for device, con in state.items()) or 'unknown'}")
+    if len(known) > 10:
+        print(f"... and {len(known) - 10} more homes.")
 
-    print(f"--- EXECUTING OM2M ACTION ---")
-    print(f"  Action Details: {action_details}")
-
-    device = action_details['device']
-    action = action_details['action']
-    value = action_details.get('value') # Might be None
-
-    # Example: Construct target URI and payload based on action
-    # YOU NEED TO DEFINE THESE URIS BASED ON YOUR OM2M RESOURCE STRUCTURE
-    target_uri = None
-    payload_con = None # Content for the content instance
-
-    if device == 'led':
-        target_uri = "/~/in-cse/in-name/led" # EXAMPLE URI
-        payload_con = "ON" if action == 'activate' else "OFF"
-    elif device == 'solenoid':
-        target_uri = "/~/in-cse/in-name/solenoid" # EXAMPLE URI
-        payload_con = "ON" if action == 'activate' else "OFF"
-    elif device == 'fan':
-        target_uri = "/~/in-cse/in-name/fan" # EXAMPLE URI
-        if action == 'set_speed':
-            payload_con = str(value) # Speed 1, 2, or 3
-        elif action == 'deactivate':
-            payload_con = "0" # Speed 0 for off
-
-    if target_uri and payload_con is not None:
-        print(f"  Target URI: {target_uri}")
-        print(f"  Payload Content: {payload_con}")
-
-        # Construct OM2M payload for creating a content instance
-        om2m_payload = {
-            "m2m:cin": {
-                "con": payload_con
-            }
-        }
-        om2m_headers = {
-             "X-M2M-Origin": "admin:admin", # Or your application AE credentials
-             "Content-Type": "application/json;ty=4" # ty=4 for content instance
-        }
-        # Build URL safely
-        # Extract base URL from SERVER_URL
-        base_url_parts = SERVER_URL.split('/')
-        if len(base_url_parts) > 2:
-             base_url = '/'.join(base_url_parts[:3])
-        else:
-             print(f"Error parsing SERVER_URL: {SERVER_URL}")
-             base_url = "http://localhost:8080" # Fallback
-
-        full_target_url = f"{base_url}{target_uri}"
+# --- Process data when it's new ---
+def process_data_if_new(home, raw_data):
+    """
+    Feeds content instances not seen before to the home's session assembler, which
+    processes each session as it completes. Returns the number of new entries ingested.
+    """
+    if not raw_data:
+        return 0
+    entries = parse_entries(raw_data)
+    # On the first fetch only the latest complete session is processed, as before,
+    # so a restart doesn't replay every command still held in the container.
+    new_count = home.assembler.ingest(entries, latest_only=not home.intake_primed)
+    home.intake_primed = True
+    if new_count:
+        log.info("Ingested %d new audio entries for %s (%d partial sessions pending).", new_count, home.name,
+                 home.assembler.pending_sessions, extra={'home': home.name})
+    return new_count
+
+# --- Process one complete session ---
+def process_complete_session(home, session_id, session_data):
+    """
+    Assembles and decodes a complete session and hands it to the ASR stage, so intake
+    never waits for transcription or actuation. Shared by poll and push intake.
+    """
+    completed_at = time.perf_counter()
+    # Assemble the WAV file from the session data
+    wav_bytes = assemble_wav_file(session_data)
+    if wav_bytes is None:
+        log.warning("Failed to assemble WAV file from session %s data.", session_id)
+        sessions_total.labels("assembly_failed").inc()
+        return False
 
+    # Decode straight to the float32 array Whisper takes; no round trip through disk
+    audio = decode_wav_bytes(wav_bytes)
+    if audio is None:
+        log.warning("Failed to decode WAV data from session %s.", session_id)
+        sessions_total.labels("assembly_failed").inc()
+        return False
+    assembly_seconds.observe(time.perf_counter() - completed_at)
 
-        # Send POST request to OM2M
+    if DEBUG_DUMP_WAV:
         try:
-            print(f"  Sending POST to {full_target_url}")
-            response = requests.post(full_target_url, auth=AUTH_CREDENTIALS, headers=om2m_headers, json=om2m_payload)
-            print(f"  OM2M Response Status: {response.status_code} {'(Success)' if response.status_code in [200, 201] else ''}")
-            print(f"  OM2M Response Body: {response.text[:200]}")  # Show first 200 chars of response
-
-            # More detailed status reporting
-            if response.status_code in [200, 201]:
-                print(f"  ✅ OM2M Command Successful (Status {response.status_code})")
-            else:
-                print(f"  ⚠️ OM2M Command returned status {response.status_code}")
-
-        except requests.exceptions.RequestException as e:
-            print(f"  ❌ Error sending command to OM2M: {e}")
+            with open(OUTPUT_WAV_FILENAME, "wb") as f:
+                f.write(wav_bytes)
+            log.debug("Debug copy saved as '%s' for session %s. Size: %d bytes.", OUTPUT_WAV_FILENAME, session_id, len(wav_bytes))
         except Exception as e:
-            print(f"  ❌ Unexpected error during OM2M command execution: {e}")
-
-    else:
-        print("  Could not determine target URI or payload for the action.")
+            log.error("Error writing debug WAV file '%s': %s", OUTPUT_WAV_FILENAME, e)  # Not fatal
 
-    print(f"--- END OM2M ACTION ---")
-# --- Find and process only complete sessions ---
-def find_complete_session(sessions):
-    """Find the latest complete session that hasn't been processed yet."""
-    global last_processed_session_id
-
-    if not sessions:
-        return None, None
-
-    # Sort session IDs by numeric value (assuming session IDs are numeric)
-    try:
-        # Convert to int for sorting, handle potential non-numeric IDs gracefully
-        sorted_session_ids = sorted(sessions.keys(), key=lambda sid: int(sid) if sid.isdigit() else float('-inf'), reverse=True)
-    except ValueError:
-        print("Warning: Non-numeric session IDs found during sorting attempt. Falling back to string sorting.")
-        sorted_session_ids = sorted(sessions.keys(), reverse=True)
-
-
-    # Find the first complete session that we haven't processed yet
-    for session_id in sorted_session_ids:
-        # Skip if we've already processed this session
-        if session_id == last_processed_session_id:
-            # print(f"Session {session_id} already processed. Skipping.") # Too noisy
-            continue
-
-        session_data = sessions[session_id]
+    if models_failed.is_set():
+        log.error("Models failed to load. Cannot process session %s.", session_id)
+        return False
+    if not models_ready.is_set():
+        log.info("Models still loading. Queued session %s (%d waiting).", session_id, asr_stage.depth + 1)
+    asr_stage.put((home, session_id, audio, completed_at))
+    return True
 
-        if is_session_complete(session_data):
-            print(f"Found complete session: {session_id}")
-            return session_id, session_data
+def recognize_session(session_id, audio):
+    """ Transcribes decoded audio and maps it to an action (or None). Runs in an ASR worker process. """
+    log.debug("Starting AI processing for session %s", session_id)
+    action_to_execute = process_audio_command(audio, label=f"session {session_id}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s", command_matcher.summary())
+    return action_to_execute
+
+def recognize_in_worker(session_id, audio):
+    """ recognize_session in an ASR worker process, plus the worker's metrics since its last result. """
+    return recognize_session(session_id, audio), metrics.REGISTRY.drain()
+
+def recognize_sessions(sessions):
+    """ recognize_session for a batch of (session_id, audio), in one batched pass. Runs in an ASR worker process. """
+    log.debug("Starting AI processing for sessions %s", [session_id for session_id, _ in sessions])
+    actions = process_audio_batch([(audio, f"session {session_id}") for session_id, audio in sessions])
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s", command_matcher.summary())
+    return actions
+
+def recognize_sessions_in_worker(sessions):
+    """ recognize_sessions in an ASR worker process, plus the worker's metrics since its last result. """
+    return recognize_sessions(sessions), metrics.REGISTRY.drain()
+
+def run_asr_stage(jobs):
+    """
+    ASR stage worker: waits for the models, recognizes a micro-batch of sessions
+    [(home, session_id, audio, completed_at), ...] and queues their actions.
+    """
+    while not models_ready.wait(timeout=1):
+        if models_failed.is_set():
+            log.error("Models failed to load. Cannot process sessions %s.", [job[1] for job in jobs])
+            return
+    asr_batch_size.observe(len(jobs))
+    if len(jobs) == 1:
+        _, session_id, audio, _ = jobs[0]
+        if asr_pool is not None:
+            action_to_execute, worker_metrics = asr_pool.submit(recognize_in_worker, session_id, audio).result()
+            metrics.REGISTRY.merge(worker_metrics)
+        else:
+            action_to_execute = recognize_session(session_id, audio)
+        actions = [action_to_execute]
+    else:
+        sessions = [(session_id, audio) for _, session_id, audio, _ in jobs]
+        if asr_pool is not None:
+            actions, worker_metrics = asr_pool.submit(recognize_sessions_in_worker, sessions).result()
+            metrics.REGISTRY.merge(worker_metrics)
         else:
-            # print(f"Session {session_id} is incomplete. Skipping.") # Too noisy
-            pass # Keep console cleaner
+            actions = recognize_sessions(sessions)
 
-    return None, None
+    for (home, session_id, _, completed_at), action_to_execute in zip(jobs, actions):
+        if action_to_execute:
+            sessions_total.labels("command").inc()
+            home.actuation_stage.put((home, session_id, action_to_execute, completed_at))
+        else:
+            sessions_total.labels("no_command").inc()
+            log.info("No command recognized or action determined for session %s.", session_id)
 
-# --- Process data when it's new ---
-def process_data_if_new(raw_data):
-    """Process data only if it differs from the previously processed data and contains complete sessions."""
-    global last_processed_hash, last_processed_session_id
-
-    # Calculate hash of current data
-    current_hash = calculate_data_hash(raw_data)
-
-    # If this is the exact same data we processed last time, skip processing
-    # Also skip if the last processed session ID matches the one that would be found now,
-    # *unless* the data has changed but that specific session is still the latest complete one.
-    # The hash check is the primary mechanism for detecting overall data change.
-    if current_hash == last_processed_hash:
-        # print("No new data detected (hash unchanged). Skipping processing.") # Too noisy
+def run_actuation_stage(home, session_id, action_to_execute, completed_at):
+    """
+    Actuation stage worker: hands the command to the actuator and records end-to-end
+    latency once it is settled (written, dropped as a no-op or coalesced into a later one).
+    """
+    def settled(future=None):
+        e2e_latency.record(time.perf_counter() - completed_at)
+        e2e_seconds.observe(time.perf_counter() - completed_at)
+        log.info("Successfully processed session %s of %s%s", session_id, home.name,
+                 f" ({future.result()})" if future else "", extra={'home': home.name})
+        if log.isEnabledFor(logging.INFO):
+            log.info("%s", pipeline_summary())
+
+    future = execute_om2m_action(action_to_execute, home)
+    if future is None:
+        settled()
+    else:
+        future.add_done_callback(settled)
+
+def setup_home(home):
+    """ Gives a home its session assembler, actuator and actuation stage, and starts the stage. """
+    home.assembler = SessionAssembler(
+        on_complete=lambda session_id, session_data: process_complete_session(home, session_id, session_data),
+        ttl=SESSION_TTL, log_extra={'home': home.name})
+    # Last known content of each device container; drops no-op commands and coalesces bursts
+    home.actuator = actuation.Actuator(write=lambda device, con: write_actuation(home, device, con),
+                                       window=COALESCE_WINDOW, max_age=ACTUATION_STATE_MAX_AGE)
+    home.actuation_stage = Stage(f"actuation {home.name}", lambda job: run_actuation_stage(*job),
+                                 workers=ACTUATION_WORKERS, maxsize=ACTUATION_QUEUE_SIZE,
+                                 put_timeout=QUEUE_PUT_TIMEOUT, route=lambda job: job[2]['device'],
+                                 log_extra={'home': home.name}).start()
+    home.entry_queue = queue.Queue()
+    return home
+
+def setup_routing(table=None):
+    """
+    Sets up the homes served: table, else HOMES_FILE's, else the one home of SERVER_URL.
+    Returns the routing table.
+    """
+    global routing
+    if table is None and HOMES_FILE:
+        table = homes.load_homes(HOMES_FILE, pool_size=ACTUATION_WORKERS + 2, auth=AUTH_CREDENTIALS)
+    if table is None:
+        base_url = '/'.join(SERVER_URL.split('/')[:3])
+        table = homes.RoutingTable([homes.Home("home", base_url, CONTAINER_URL, pool_size=ACTUATION_WORKERS + 2,
+                                               auth=AUTH_CREDENTIALS)])
+    for home in table:
+        setup_home(home)
+    routing = table
+    return routing
+
+def start_pipeline():
+    """ Starts the ASR stage and loads the models in the background. """
+    asr_stage.workers = max(1, ASR_PROCESSES)  # One in-flight session per ASR worker process
+    asr_stage.start()
+    start_model_loading()
+
+def pipeline_summary():
+    """ Queue depths, drops and producer blocking per stage, commands saved, plus end-to-end latency. """
+    parts = [asr_stage.summary()]
+    served = list(routing or ())
+    if len(served) == 1:
+        parts += [served[0].actuation_stage.summary(), served[0].actuator.summary()]
+    elif served:
+        deepest = max(served, key=lambda home: home.actuation_stage.depth)
+        stats = [home.actuator.stats for home in served]
+        commands, writes = sum(s["submitted"] for s in stats), sum(s["writes"] for s in stats)
+        parts.append(f"actuation: {len(served)} homes, depth {sum(home.actuation_stage.depth for home in served)} "
+                     f"(deepest {deepest.name}: {deepest.actuation_stage.depth}), {commands} commands, {writes} writes")
+    parts.append(e2e_latency.summary("end-to-end"))
+    return "Pipeline: " + " | ".join(parts)
+
+# --- Push Intake (oneM2M Subscription + Notification Receiver) ---
+def notification_url_for(home):
+    """ NOTIFICATION_URL for a single home; NOTIFICATION_URL/<home name> when serving several. """
+    return NOTIFICATION_URL if len(routing) == 1 else f"{NOTIFICATION_URL.rstrip('/')}/{home.name}"
+
+def create_om2m_subscription(home, notification_url=None):
+    """
+    Creates an m2m:sub on the home's audio container so its CSE notifies us of every new
+    content instance (net=3). An existing subscription with the same name is reused.
+    Returns True if a subscription is in place.
+    """
+    container_url = home.audio_url
+    notification_url = notification_url or notification_url_for(home)
+    print(f"Creating subscription '{SUBSCRIPTION_NAME}' on {container_url} -> {notification_url}")
+    try:
+        response = home.client.create_subscription(container_url, SUBSCRIPTION_NAME, [notification_url])
+        if response.status_code == 201:
+            print("Subscription created.")
+            return True
+        if response.status_code == 409:
+            print("Subscription already exists. Reusing it.")
+            return True
+        print(f"Subscription creation failed with status {response.status_code}: {response.text[:200]}")
         return False
-
-    print("New data detected. Processing...")
-    # Extract audio entries from the JSON
-    entries = parse_entries(raw_data)
-    if not entries:
-        print("No audio entries found after parsing.")
-        # Update hash even if no entries, to avoid reprocessing the same empty/invalid response
-        last_processed_hash = current_hash
+    except requests.exceptions.RequestException as e:
+        print(f"Error creating subscription: {e}")
         return False
 
-    print(f"Found {len(entries)} audio entries.")
+def extract_cin_from_notification(data):
+    """
+    Extracts the created m2m:cin from a oneM2M notification body.
+    Returns None for verification requests and anything that is not a CIN.
+    """
+    if not isinstance(data, dict):
+        return None
+    sgn = data.get("m2m:sgn", data.get("sgn"))
+    if not isinstance(sgn, dict) or sgn.get("vrq"):
+        return None
+    rep = sgn.get("nev", {}).get("rep", {})
+    cin = rep.get("m2m:cin") if isinstance(rep, dict) else None
+    return cin if isinstance(cin, dict) else None
+
+class NotificationHandler(BaseHTTPRequestHandler):
+    """ Receives oneM2M notifications and hands created CINs to the intake queue of the home they are for. """
+    dispatch = None  # dispatch(request path, cin); set by start_notification_server
+
+    def log_message(self, format, *args):
+        pass  # One access log line per chunk is too noisy
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        # Acknowledge straight away so the CSE is never held up by processing
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        try:
+            cin = extract_cin_from_notification(json.loads(body))
+        except json.JSONDecodeError:
+            log.warning("Ignoring notification with invalid JSON: %s", body[:200])
+            return
+        if cin is not None:
+            self.dispatch(self.path, cin)
+
+def dispatch_notification(path, cin):
+    """ Queues a notified CIN for the intake thread of the home the notification path names. """
+    home = routing.route(path, urlsplit(NOTIFICATION_URL).path)
+    if home is None:
+        log.warning("Ignoring notification for unknown home: %s", path)
+        return
+    home.entry_queue.put(cin)
 
-    # Group the entries by audio session
-    sessions = group_audio_session(entries)
-    if not sessions:
-        print("No audio sessions found.")
-        # Update hash even if no sessions, to avoid reprocessing the same response without sessions
-        last_processed_hash = current_hash
-        return False
+def start_notification_server(dispatch=None, host=None, port=None):
+    """ Starts the notification receiver in a daemon thread. Returns the server, or None on failure. """
+    handler = type("BoundNotificationHandler", (NotificationHandler,),
+                   {"dispatch": staticmethod(dispatch or dispatch_notification)})
+    try:
+        server = ThreadingHTTPServer((host or NOTIFICATION_HOST, NOTIFICATION_PORT if port is None else port), handler)
+    except OSError as e:
+        print(f"Could not start notification receiver: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Notification receiver listening on {server.server_address[0]}:{server.server_address[1]}")
+    return server
 
-    # Find a complete session to process
-    session_id, session_data = find_complete_session(sessions)
+def handle_pushed_entry(home, entry):
+    """
+    Feeds a notified content instance to the home's session assembler; the session is
+    processed as soon as it is complete (normally when AUDIO_END arrives).
+    Returns True if the entry was new.
+    """
+    return home.assembler.ingest([entry]) > 0
 
-    if not session_id or not session_data:
-        # print("No new complete sessions found to process.") # Too noisy if polling incomplete data
-        # Still update the hash to avoid reprocessing the same incomplete data state
-        last_processed_hash = current_hash
-        return False
+def run_polling_loop(home):
+    """ Fetches the home's whole audio container every POLLING_INTERVAL seconds. """
+    print(f"Starting polling loop for {home.name}. Will check for new data every {POLLING_INTERVAL} seconds.")
+    while not models_failed.is_set():
+        log.debug("Polling %s", home.audio_url)
 
-    # Assemble the WAV file from the session data
-    wav_bytes = assemble_wav_file(session_data)
-    if wav_bytes is None:
-        print(f"Failed to assemble WAV file from session {session_id} data.")
-        # Do NOT update last_processed_hash or last_processed_session_id,
-        # so we might try processing this session again if data changes slightly or becomes valid.
+        # Fetch data from the OM2M server
+        raw_data = fetch_om2m_audio_entries(home)
+        # process_data_if_new handles checking if data is empty/same as last time
+        process_data_if_new(home, raw_data)
+
+        # Wait for the next polling interval
+        # print(f"Waiting {POLLING_INTERVAL} seconds until next poll...") # Too noisy
+        time.sleep(POLLING_INTERVAL)
+
+def run_push_loop(home):
+    """
+    Processes content instances as the home's CSE notifies them (through the shared
+    notification receiver). A resync poll every PUSH_RESYNC_INTERVAL seconds picks up
+    anything a lost notification missed. Returns False if the subscription could not be set up.
+    """
+    if not create_om2m_subscription(home):
         return False
 
-    # Save the assembled WAV file
+    print(f"Waiting for notifications from {home.name} (resync poll every {PUSH_RESYNC_INTERVAL} seconds).")
+    process_data_if_new(home, fetch_om2m_audio_entries(home))  # Catch up on anything sent before we subscribed
+    next_resync = time.time() + PUSH_RESYNC_INTERVAL
+    while not models_failed.is_set():
+        try:
+            entry = home.entry_queue.get(timeout=max(0.0, next_resync - time.time()))
+            handle_pushed_entry(home, entry)
+        except queue.Empty:
+            process_data_if_new(home, fetch_om2m_audio_entries(home))
+            next_resync = time.time() + PUSH_RESYNC_INTERVAL
+
+def run_home_intake(home, push):
+    """ Intake thread of one home: push if the receiver is up and the subscription works, else polling. """
     try:
-        with open(OUTPUT_WAV_FILENAME, "wb") as f:
-            f.write(wav_bytes)
-        print(f"WAV file successfully saved as '{OUTPUT_WAV_FILENAME}' for session {session_id}. Size: {len(wav_bytes)} bytes.")
+        if push and run_push_loop(home) is False:
+            print(f"Push intake unavailable for {home.name}. Falling back to polling.")
+        run_polling_loop(home)
     except Exception as e:
-        print(f"Error writing WAV file '{OUTPUT_WAV_FILENAME}': {e}")
-         # Do NOT update last_processed_hash or last_processed_session_id
-        return False
+        log.exception("Intake for %s stopped: %s", home.name, e, extra={'home': home.name})
 
-    # --- Process the saved WAV file for commands ---
-    print(f"\n--- Starting AI Processing for Session {session_id} ---")
-    action_to_execute = process_audio_command(OUTPUT_WAV_FILENAME)
-    print("--- AI Processing Finished ---")
-
-    # --- Execute OM2M Action ---
-    if action_to_execute:
-        execute_om2m_action(action_to_execute)
-    else:
-        print("No command recognized or action determined.")
-
-    # Update the hash and session ID of the processed data ONLY if processing was successful
-    last_processed_hash = current_hash
-    last_processed_session_id = session_id
-    print(f"Successfully processed session {session_id}")
-    return True
+def start_intake(push):
+    """ Starts one intake thread per home, so a slow or unreachable home only delays itself. Returns the threads. """
+    threads = [threading.Thread(target=run_home_intake, args=(home, push), name=f"intake {home.name}", daemon=True)
+               for home in routing]
+    for thread in threads:
+        thread.start()
+    return threads
 
 # --- Main Execution ---
 def main():
-    # Load AI models once
-    if not load_models():
-        print("Exiting due to model loading failure.")
-        return
+    log_listener = logsetup.configure_logging(json_lines=LOG_JSON)
+    # Load AI models once, in the background, and start the ASR/actuation stages; intake starts straight away
+    setup_routing()
+    start_pipeline()
+    threading.Thread(target=warm_actuation_state, name="actuation warm-up", daemon=True).start()
+    if METRICS_PORT:
+        try:
+            metrics.start_http_server(METRICS_PORT)
+            print(f"Serving metrics on port {METRICS_PORT} at /metrics")
+        except OSError as e:
+            print(f"Could not start metrics endpoint on port {METRICS_PORT}: {e}")
 
     try:
-        print(f"Starting polling loop. Will check for new data every {POLLING_INTERVAL} seconds.")
-        print(f"Complete sessions only: {REQUIRE_COMPLETE_SESSIONS}")
-        print(f"Using Whisper model '{WHISPER_MODEL_SIZE}' on {DEVICE}, forcing English transcription.")
+        print(f"Intake mode: {INTAKE_MODE}, serving {len(routing)} home(s)")
+        print(f"Using Whisper tiers {[tier['model'] for tier in WHISPER_TIERS]}, forcing English transcription.")
         print(f"Using Sentence Transformer model '{SENTENCE_TRANSFORMER_MODEL}' for NLU with threshold {SIMILARITY_THRESHOLD}.")
+        print(f"Pipeline: {ASR_PROCESSES or 'in-process'} ASR worker(s), {ACTUATION_WORKERS} actuation worker(s) per home.")
         print("Press Ctrl+C to stop the script.")
 
-        while True:
-            print("\n" + "="*40)
-            print(f"Polling at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-
-            # Fetch data from the OM2M server
-            raw_data = fetch_om2m_audio_entries()
-            # process_data_if_new handles checking if data is empty/same as last time
-            process_data_if_new(raw_data)
-
-            # Wait for the next polling interval
-            # print(f"Waiting {POLLING_INTERVAL} seconds until next poll...") # Too noisy
-            time.sleep(POLLING_INTERVAL)
+        startup_timings["accepting audio (since process start)"] = time.time() - PROCESS_START
+        push = INTAKE_MODE == "push" and start_notification_server() is not None
+        if INTAKE_MODE == "push" and not push:
+            print("Push intake unavailable. Falling back to polling.")
+        for thread in start_intake(push):
+            while thread.is_alive():
+                thread.join(timeout=1)  # Wakes up for Ctrl+C
+        if models_failed.is_set():
+            print("Exiting due to model loading failure.")
 
     except KeyboardInterrupt:
         print("\nPolling loop stopped by user (Ctrl+C).")
@@ -602,6 +1046,10 @@ def main():
         print(f"Unexpected error in polling loop: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if asr_pool is not None:
+            asr_pool.shutdown(wait=False, cancel_futures=True)
+        log_listener.stop()  # Flush queued records
 
 if __name__ == "__main__":
     main()
\ No newline at end of file